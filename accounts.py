@@ -0,0 +1,212 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from durability import atomic_write, file_stamp
+from locking import ValidationError
+
+
+class AccountRegistry:
+    """Resident table of registered accounts with hash indexes.
+
+    all_account.json holds a compacted snapshot; registrations since the
+    last compaction are appended to a journal file (one JSON object per
+    line) and replayed on load.
+    """
+
+    def __init__(self, accounts_file: str, journal_file: Optional[str] = None, compact_every: int = 1000):
+        self.accounts_file = accounts_file
+        self.journal_file = journal_file or os.path.splitext(accounts_file)[0] + ".journal"
+        self.compact_every = compact_every
+
+        # Indexes hold positions in _accounts.
+        self._accounts: List[dict] = []
+        self._by_meter: Dict[str, int] = {}
+        self._by_area: Dict[str, List[int]] = {}
+        self._by_dwelling: Dict[str, List[int]] = {}
+        # Bumped on every change, so that tables derived from the accounts know when to recompute.
+        self.version = 0
+        self._groups: Optional[Tuple[int, List[Tuple[str, str]], np.ndarray, List[str]]] = None
+        self._journal_entries = 0
+        # Where this process stopped reading, to pick up other processes' writes.
+        self._snapshot_stamp = None
+        self._journal_offset = 0
+
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    def __contains__(self, meter_id: str) -> bool:
+        return meter_id in self._by_meter
+
+    def _index(self, account: dict):
+        position = len(self._accounts)
+        self._accounts.append(account)
+        self._by_meter[account["meter_ID"]] = position
+        self._by_area.setdefault(account["area"], []).append(position)
+        self._by_dwelling.setdefault(account["dwelling"], []).append(position)
+        self.version += 1
+
+    def _reset_indexes(self):
+        self._accounts = []
+        self._by_meter = {}
+        self._by_area = {}
+        self._by_dwelling = {}
+        self.version += 1
+
+    def load(self):
+        """Load the snapshot and replay the journal."""
+        self._reset_indexes()
+        self._snapshot_stamp = file_stamp(self.accounts_file)
+        if os.path.exists(self.accounts_file):
+            with open(self.accounts_file, "r", encoding="utf-8") as f:
+                contents = f.read()
+            try:
+                accounts = json.loads(contents) if contents.strip() else []
+            except json.JSONDecodeError as e:
+                # Compacting would overwrite the snapshot with the few accounts left.
+                raise RuntimeError(f"Corrupt accounts snapshot {self.accounts_file}: {e}") from None
+            for account in accounts if isinstance(accounts, list) else []:
+                if account["meter_ID"] not in self._by_meter:
+                    self._index(account)
+
+        self._journal_entries = 0
+        self._journal_offset = 0
+        if self._read_journal() is None:
+            # Appending after a torn line would corrupt the next entry too.
+            self.compact()
+
+    def _read_journal(self) -> Optional[List[dict]]:
+        """Index the journal entries after the read offset; None if the last one is torn."""
+        added = []
+        if not os.path.exists(self.journal_file):
+            return added
+        with open(self.journal_file, "rb") as f:
+            f.seek(self._journal_offset)
+            for line in f:
+                try:
+                    account = json.loads(line)
+                except ValueError:
+                    account = None
+                if account is None or not line.endswith(b"\n"):
+                    # A torn last line from an interrupted append.
+                    return None
+                self._journal_offset += len(line)
+                self._journal_entries += 1
+                if account["meter_ID"] not in self._by_meter:
+                    self._index(account)
+                    added.append(account)
+        return added
+
+    def refresh(self) -> Optional[List[dict]]:
+        """Pick up accounts that another process registered since the last load.
+
+        Returns the new accounts, or None if the snapshot was rewritten and
+        everything was reloaded.
+        """
+        if file_stamp(self.accounts_file) != self._snapshot_stamp:
+            self.load()
+            return None
+        added = self._read_journal()
+        if added is None:
+            self.load()
+        return added
+
+    def get(self, meter_id: str) -> Optional[dict]:
+        position = self._by_meter.get(meter_id)
+        return None if position is None else self._accounts[position]
+
+    def all(self) -> List[dict]:
+        """All accounts in registration order."""
+        return list(self._accounts)
+
+    def meter_ids(self) -> List[str]:
+        return [account["meter_ID"] for account in self._accounts]
+
+    def by_area(self, area: str) -> List[dict]:
+        return [self._accounts[position] for position in self._by_area.get(area, [])]
+
+    def areas(self) -> List[str]:
+        return list(self._by_area)
+
+    def _group_table(self) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        """(area, dwelling) groups in use and the group of every account, from the area and dwelling indexes."""
+        if self._groups is None or self._groups[0] != self.version:
+            area = np.zeros(len(self._accounts), dtype=np.int64)
+            for code, positions in enumerate(self._by_area.values()):
+                area[positions] = code
+            dwelling = np.zeros(len(self._accounts), dtype=np.int64)
+            for code, positions in enumerate(self._by_dwelling.values()):
+                dwelling[positions] = code
+            combined, codes = np.unique(area * len(self._by_dwelling) + dwelling, return_inverse=True)
+            areas, dwellings = list(self._by_area), list(self._by_dwelling)
+            keys = [(areas[c // len(dwellings)], dwellings[c % len(dwellings)]) for c in combined.tolist()]
+            self._groups = (self.version, keys, codes.ravel(), self.meter_ids())
+        return self._groups[1], self._groups[2]
+
+    def group_codes(self, meter_ids: Sequence[str]) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        """The (area, dwelling) groups and the group of every meter in them, -1 if it is not registered.
+
+        Groups keep their numbers until the registry changes (see version).
+        """
+        keys, codes = self._group_table()
+        # Rollup tables usually list the meters in registration order.
+        if self._groups[3][:len(meter_ids)] == list(meter_ids):
+            return keys, codes[:len(meter_ids)]
+        positions = np.fromiter((self._by_meter.get(meter_id, -1) for meter_id in meter_ids), dtype=np.int64,
+                                count=len(meter_ids))
+        return keys, np.append(codes, -1)[positions]
+
+    def add(self, account: dict) -> dict:
+        """Register one account."""
+        return self.add_many([account])[0]
+
+    def add_many(self, accounts: Iterable[dict]) -> List[dict]:
+        """Register several accounts with a single journal append."""
+        accounts = list(accounts)
+        seen = set()
+        for account in accounts:
+            meter_id = account["meter_ID"]
+            if meter_id in self._by_meter or meter_id in seen:
+                raise ValidationError("Meter ID already exists")
+            seen.add(meter_id)
+
+        os.makedirs(os.path.dirname(self.journal_file), exist_ok=True)
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(account, ensure_ascii=False) + "\n" for account in accounts))
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_offset = f.tell()
+        for account in accounts:
+            self._index(account)
+        self._journal_entries += len(accounts)
+
+        # Compacting once the journal reaches half the table keeps rewrites amortized O(1).
+        if self._journal_entries >= max(self.compact_every, len(self._accounts) // 2):
+            self.compact()
+        return accounts
+
+    def replace_all(self, accounts: Iterable[dict]):
+        """Replace every account and write a fresh snapshot."""
+        self._reset_indexes()
+        for account in accounts:
+            self._index(account)
+        self.compact()
+
+    def compact(self):
+        """Write all accounts to the snapshot file and empty the journal."""
+        os.makedirs(os.path.dirname(self.accounts_file), exist_ok=True)
+        with atomic_write(self.accounts_file, "w", encoding="utf-8", sync=True) as f:
+            json.dump(self._accounts, f, ensure_ascii=False, indent=2)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._snapshot_stamp = file_stamp(self.accounts_file)
+        self._journal_entries = 0
+        self._journal_offset = 0
+
+    def clear(self):
+        """Remove every account."""
+        self.replace_all([])
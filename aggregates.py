@@ -0,0 +1,197 @@
+import datetime
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from durability import atomic_write
+from storage import DailyReadings, read_daily_file
+
+
+class MonthAggregate:
+    """Running first/last/min/max/sum/count of one month's readings per meter."""
+
+    FIELDS = ("first", "last", "min", "max", "sum", "count")
+
+    def __init__(self, month: str):
+        self.month = month
+        self.meter_ids: List[str] = []
+        self.meter_index: Dict[str, int] = {}
+        self.first = np.zeros(0)
+        self.last = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.sum = np.zeros(0)
+        self.count = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.meter_ids)
+
+    def _indices(self, meter_ids: List[str]) -> np.ndarray:
+        # Days usually list the meters in the same order as the aggregate.
+        if self.meter_ids[:len(meter_ids)] == meter_ids:
+            return np.arange(len(meter_ids))
+        for meter_id in meter_ids:
+            if meter_id not in self.meter_index:
+                self.meter_index[meter_id] = len(self.meter_ids)
+                self.meter_ids.append(meter_id)
+        grow = len(self.meter_ids) - len(self.count)
+        if grow:
+            for field in self.FIELDS:
+                column = getattr(self, field)
+                setattr(self, field, np.concatenate((column, np.zeros(grow, dtype=column.dtype))))
+        return np.fromiter((self.meter_index[m] for m in meter_ids), dtype=np.int64, count=len(meter_ids))
+
+    def apply(self, readings: DailyReadings):
+        """Fold in readings that are later than everything applied so far."""
+        if not len(readings):
+            return
+        index = self._indices(readings.meter_ids)
+        counts = np.diff(readings.starts)
+        fresh = self.count[index] == 0
+        self.first[index[fresh]] = readings.first_values()[fresh]
+        self.min[index] = np.where(fresh, readings.min_values(), np.minimum(self.min[index], readings.min_values()))
+        self.max[index] = np.where(fresh, readings.max_values(), np.maximum(self.max[index], readings.max_values()))
+        self.last[index] = readings.last_values()
+        self.sum[index] += np.add.reduceat(readings.values, readings.starts[:-1])
+        self.count[index] += counts
+
+    def totals(self) -> Dict[str, float]:
+        """Consumption of the month per meter (last reading minus first)."""
+        return dict(zip(self.meter_ids, (self.last - self.first).tolist()))
+
+    def mismatches(self, other: "MonthAggregate", tolerance: float = 1e-6) -> List[str]:
+        """Meters whose aggregates differ between two states."""
+        bad = sorted(set(self.meter_ids) ^ set(other.meter_ids))
+        common = [m for m in self.meter_ids if m in other.meter_index]
+        mine = np.array([self.meter_index[m] for m in common], dtype=np.int64)
+        theirs = np.array([other.meter_index[m] for m in common], dtype=np.int64)
+        differs = np.zeros(len(common), dtype=bool)
+        for field in self.FIELDS:
+            differs |= ~np.isclose(getattr(self, field)[mine], getattr(other, field)[theirs], rtol=0, atol=tolerance)
+        return bad + [m for m, d in zip(common, differs.tolist()) if d]
+
+    @classmethod
+    def from_files(cls, month: str, daily_files: Iterable[str]) -> "MonthAggregate":
+        """Recompute a month from its daily files (given in date order)."""
+        aggregate = cls(month)
+        for path in daily_files:
+            aggregate.apply(read_daily_file(path))
+        return aggregate
+
+    @classmethod
+    def from_days(cls, month: str, meter_ids: List[str], first: np.ndarray, last: np.ndarray,
+                  total: np.ndarray, slots_per_day: int) -> "MonthAggregate":
+        """A month of whole days given by the first/last value and sum of their readings (days x meters)."""
+        aggregate = cls(month)
+        aggregate._indices(meter_ids)
+        # Readings only grow, so the first and last reading are the min and max.
+        aggregate.first = np.round(first[0], 3)
+        aggregate.min = aggregate.first.copy()
+        aggregate.last = np.round(last[-1], 3)
+        aggregate.max = aggregate.last.copy()
+        aggregate.sum = total.sum(axis=0)
+        aggregate.count = np.full(len(meter_ids), len(last) * slots_per_day, dtype=np.int64)
+        return aggregate
+
+    def save(self, path: str):
+        with atomic_write(path, "wb") as f:
+            np.savez(f, meter_ids=np.array(self.meter_ids, dtype=str),
+                     **{field: getattr(self, field) for field in self.FIELDS})
+
+    @classmethod
+    def load(cls, month: str, path: str) -> "MonthAggregate":
+        aggregate = cls(month)
+        with np.load(path) as state:
+            aggregate.meter_ids = state["meter_ids"].tolist()
+            for field in cls.FIELDS:
+                setattr(aggregate, field, state[field])
+        aggregate.meter_index = {meter_id: i for i, meter_id in enumerate(aggregate.meter_ids)}
+        return aggregate
+
+
+class MonthlyAggregates:
+    """Persisted running aggregates, one MonthAggregate file per month."""
+
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self._months: Dict[str, MonthAggregate] = {}
+
+    @staticmethod
+    def month_key(date) -> str:
+        return date.strftime("%Y%m")
+
+    def _path(self, month: str) -> str:
+        return os.path.join(self.state_dir, f"running_{month}.npz")
+
+    def path_for(self, date) -> str:
+        """File holding the state of the month containing date."""
+        return self._path(self.month_key(date))
+
+    def get(self, date) -> Optional[MonthAggregate]:
+        """State of the month containing date, or None if nothing was flushed."""
+        month = self.month_key(date)
+        if month not in self._months:
+            path = self._path(month)
+            if not os.path.exists(path):
+                return None
+            self._months[month] = MonthAggregate.load(month, path)
+        return self._months[month]
+
+    def update(self, readings: DailyReadings):
+        """Fold a flushed day into its month and persist the month state."""
+        month = self.month_key(readings.date)
+        aggregate = self.get(readings.date)
+        if aggregate is None:
+            aggregate = self._months[month] = MonthAggregate(month)
+        aggregate.apply(readings)
+        os.makedirs(self.state_dir, exist_ok=True)
+        aggregate.save(self._path(month))
+
+    def put(self, date, aggregate: MonthAggregate) -> str:
+        """Replace the state of the month containing date; returns the file written."""
+        month = self.month_key(date)
+        self._months[month] = aggregate
+        os.makedirs(self.state_dir, exist_ok=True)
+        aggregate.save(self._path(month))
+        return self._path(month)
+
+    def rebuild(self, date, daily_files: Iterable[str]):
+        """Recompute the month containing date from its daily files."""
+        month = self.month_key(date)
+        aggregate = MonthAggregate.from_files(month, daily_files)
+        path = self._path(month)
+        if len(aggregate):
+            self._months[month] = aggregate
+            os.makedirs(self.state_dir, exist_ok=True)
+            aggregate.save(path)
+        else:
+            self._months.pop(month, None)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def drop_before(self, month_first: datetime.datetime):
+        """Forget the state of months before month_first."""
+        cutoff = self.month_key(month_first)
+        for month in [m for m in self._months if m < cutoff]:
+            del self._months[month]
+        if os.path.isdir(self.state_dir):
+            for name in os.listdir(self.state_dir):
+                if name.startswith("running_") and name[8:14] < cutoff:
+                    os.remove(os.path.join(self.state_dir, name))
+
+    def drop_from(self, month_first: datetime.datetime):
+        """Forget the state of month_first's month and later ones."""
+        cutoff = self.month_key(month_first)
+        for month in [m for m in self._months if m >= cutoff]:
+            del self._months[month]
+        if os.path.isdir(self.state_dir):
+            for name in os.listdir(self.state_dir):
+                if name.startswith("running_") and name[8:14] >= cutoff:
+                    os.remove(os.path.join(self.state_dir, name))
+
+    def cached_months(self) -> int:
+        return len(self._months)
+
+    def clear(self):
+        self._months.clear()
@@ -0,0 +1,332 @@
+import datetime
+import json
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from durability import atomic_write
+from metrics import METRICS
+from storage import DailyReadings
+
+KINDS = ("zero_streak", "negative", "spike", "peer_outlier")
+
+# A day is complete once its last reading (23:30) is in.
+LAST_SLOT_MINUTE = 23 * 60 + 30
+
+
+class AnomalyDetector:
+    """Checks every completed day of every meter against rolling per-meter statistics.
+
+    The daily usage of the last WINDOW days is kept in a ring (days x meters)
+    with running sums, so a day costs a few vector operations whatever the
+    history. A day is flagged per meter when it:
+
+    - ends a streak of ZERO_STREAK_DAYS or more days without consumption,
+    - is negative (the cumulative reading went backwards),
+    - exceeds the meter's rolling mean by SPIKE_SIGMAS standard deviations
+      and SPIKE_RATIO times, after MIN_HISTORY days,
+    - is a robust outlier (median/MAD z-score above PEER_Z) among the meters
+      of the same area and dwelling type, in groups of MIN_PEERS or more.
+
+    alerts_YYYYMM.ndjson holds one line per day with alerts, its columns
+    being meter_ids, kinds, usage and expected (the mean or the peer median).
+    """
+
+    WINDOW = 28
+    ZERO_KWH = 0.001
+    ZERO_STREAK_DAYS = 3
+    MIN_HISTORY = 7
+    SPIKE_SIGMAS = 4.0
+    SPIKE_RATIO = 2.0
+    MIN_PEERS = 8
+    PEER_Z = 6.0
+
+    def __init__(self, alert_dir: str, group_of: Callable[[str], Optional[Tuple[str, str]]]):
+        self.alert_dir = alert_dir
+        self.group_of = group_of
+        self.clear()
+
+    def clear(self):
+        self.meter_ids: List[str] = []
+        self.meter_index: Dict[str, int] = {}
+        self._groups: Dict[Tuple[str, str], int] = {}
+        self._group = np.zeros(0, dtype=np.int64)
+        # Latest cumulative value, and the value the open day started from.
+        self._last = np.zeros(0)
+        self._start = np.zeros(0)
+        self._open_date: Optional[datetime.date] = None
+        self._ring = np.full((self.WINDOW, 0), np.nan, dtype=np.float32)
+        self._ring_dates: List[Optional[datetime.date]] = [None] * self.WINDOW
+        self._sum = np.zeros(0)
+        self._sumsq = np.zeros(0)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._zero_streak = np.zeros(0, dtype=np.int64)
+        # Alerts of the months read so far: month -> date -> the day's columns.
+        self._months: Dict[str, Dict[str, dict]] = {}
+
+    def _indices(self, meter_ids: List[str]) -> np.ndarray:
+        # Days usually list the meters in the same order as the detector.
+        if self.meter_ids[:len(meter_ids)] == meter_ids:
+            return np.arange(len(meter_ids))
+        for meter_id in meter_ids:
+            if meter_id not in self.meter_index:
+                self.meter_index[meter_id] = len(self.meter_ids)
+                self.meter_ids.append(meter_id)
+        grow = len(self.meter_ids) - len(self._last)
+        if grow:
+            new_ids = self.meter_ids[-grow:]
+            groups = np.fromiter(
+                (-1 if key is None else self._groups.setdefault(key, len(self._groups))
+                 for key in map(self.group_of, new_ids)), dtype=np.int64, count=grow
+            )
+            self._group = np.concatenate((self._group, groups))
+            self._last = np.concatenate((self._last, np.full(grow, np.nan)))
+            self._start = np.concatenate((self._start, np.full(grow, np.nan)))
+            self._ring = np.hstack((self._ring, np.full((self.WINDOW, grow), np.nan, dtype=np.float32)))
+            self._sum = np.concatenate((self._sum, np.zeros(grow)))
+            self._sumsq = np.concatenate((self._sumsq, np.zeros(grow)))
+            self._count = np.concatenate((self._count, np.zeros(grow, dtype=np.int64)))
+            self._zero_streak = np.concatenate((self._zero_streak, np.zeros(grow, dtype=np.int64)))
+        return np.fromiter((self.meter_index[m] for m in meter_ids), dtype=np.int64, count=len(meter_ids))
+
+    def _slot(self, date: datetime.date) -> int:
+        """Ring row of date, emptied first if it still holds an older day."""
+        slot = date.toordinal() % self.WINDOW
+        if self._ring_dates[slot] != date:
+            self._remove(slot, np.arange(len(self.meter_ids)))
+            self._ring_dates[slot] = date
+        return slot
+
+    def _remove(self, slot: int, rows: np.ndarray):
+        old = self._ring[slot, rows].astype(np.float64)
+        known = ~np.isnan(old)
+        self._sum[rows[known]] -= old[known]
+        self._sumsq[rows[known]] -= old[known] ** 2
+        self._count[rows[known]] -= 1
+        self._ring[slot, rows] = np.nan
+
+    def _push(self, slot: int, rows: np.ndarray, usage: np.ndarray):
+        """Add a day's usage of some meters to the window (usage is float32)."""
+        known = ~np.isnan(usage)
+        rows, usage = rows[known], usage[known].astype(np.float64)
+        self._ring[slot, rows] = usage
+        self._sum[rows] += usage
+        self._sumsq[rows] += usage ** 2
+        self._count[rows] += 1
+        zero = usage <= self.ZERO_KWH
+        self._zero_streak[rows] = np.where(zero, self._zero_streak[rows] + 1, 0)
+
+    def _peer_stats(self, rows: np.ndarray, usage: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Median and scaled MAD of usage within each meter's peer group (NaN for small groups)."""
+        median = np.full(len(rows), np.nan)
+        spread = np.full(len(rows), np.nan)
+        valid = np.flatnonzero((self._group[rows] >= 0) & ~np.isnan(usage))
+        if not len(valid):
+            return median, spread
+        codes = self._group[rows[valid]]
+        values = usage[valid]
+
+        sizes = np.bincount(codes, minlength=len(self._groups))
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        lower, upper = starts + np.maximum(sizes - 1, 0) // 2, starts + sizes // 2
+
+        def group_medians(x: np.ndarray) -> np.ndarray:
+            # One sort of group offset + value orders by group, then by value.
+            low = x.min()
+            width = x.max() - low + 1
+            ordered = np.sort(codes * width + (x - low))
+            ordered -= np.repeat(np.arange(len(sizes)) * width, sizes) - low
+            ordered = np.append(ordered, np.nan)
+            return np.where(sizes >= self.MIN_PEERS, (ordered[lower] + ordered[upper]) / 2, np.nan)
+
+        group_median = group_medians(values)[codes]
+        group_mad = group_medians(np.abs(values - group_median))[codes]
+        median[valid] = group_median
+        spread[valid] = 1.4826 * group_mad
+        return median, spread
+
+    def _check(self, date: datetime.date, rows: np.ndarray, usage: np.ndarray) -> List[str]:
+        """Evaluate a completed day of some meters, record it and return the files written."""
+        with METRICS.span("anomaly_check"):
+            usage = usage.astype(np.float32)
+            slot = self._slot(date)
+            # A day evaluated again replaces its earlier values.
+            self._remove(slot, rows)
+            count = self._count[rows]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = self._sum[rows] / count
+                std = np.sqrt(np.maximum(self._sumsq[rows] / count - mean ** 2, 0))
+            value = usage.astype(np.float64)
+            self._push(slot, rows, usage)
+            median, spread = self._peer_stats(rows, value)
+
+            with np.errstate(invalid="ignore"):
+                flags = {
+                    "zero_streak": self._zero_streak[rows] >= self.ZERO_STREAK_DAYS,
+                    "negative": value < -self.ZERO_KWH,
+                    "spike": (count >= self.MIN_HISTORY) & (value > mean + self.SPIKE_SIGMAS * std)
+                             & (value > self.SPIKE_RATIO * mean),
+                    # The spread is floored so that near-identical peers do not flag small differences.
+                    "peer_outlier": np.abs(value - median)
+                                    > self.PEER_Z * np.maximum(spread, np.maximum(0.05 * np.abs(median), self.ZERO_KWH)),
+                }
+            expected = {"zero_streak": mean, "negative": mean, "spike": mean, "peer_outlier": median}
+            alerts = {"meter_ids": [], "kinds": [], "usage": [], "expected": []}
+            for kind in KINDS:
+                hits = np.flatnonzero(flags[kind])
+                if not len(hits):
+                    continue
+                METRICS.count("anomalies_total", len(hits), kind=kind)
+                alerts["meter_ids"].extend(self.meter_ids[r] for r in rows[hits].tolist())
+                alerts["kinds"].extend([kind] * len(hits))
+                alerts["usage"].extend(np.round(value[hits], 3).tolist())
+                alerts["expected"].extend(
+                    None if np.isnan(e) else round(e, 3) for e in expected[kind][hits].tolist()
+                )
+            return self._record(date, rows, alerts)
+
+    def add_day(self, readings: DailyReadings) -> List[str]:
+        """Follow (part of) a flushed day; the meters whose day is complete are checked."""
+        date = readings.date
+        if not len(readings) or (self._open_date is not None and date < self._open_date):
+            return []
+        rows = self._indices(readings.meter_ids)
+        if date != self._open_date:
+            self._start = self._last.copy()
+            self._open_date = date
+        start = self._start[rows]
+        # Meters without an earlier value count from their first reading of the day.
+        self._start[rows] = np.where(np.isnan(start), readings.first_values(), start)
+        self._last[rows] = readings.last_values()
+        last_minutes = np.asarray(readings.minutes)[readings.starts[1:] - 1]
+        complete = last_minutes >= LAST_SLOT_MINUTE
+        if not complete.any():
+            return []
+        rows = rows[complete]
+        return self._check(date, rows, self._last[rows] - self._start[rows])
+
+    def add_days(self, first: datetime.date, meter_ids: List[str], usage: np.ndarray,
+                 last: np.ndarray) -> List[str]:
+        """Check consecutive whole days (days x meters); last is every meter's value after them."""
+        rows = self._indices(meter_ids)
+        paths: List[str] = []
+        for d, day_usage in enumerate(usage):
+            for path in self._check(first + datetime.timedelta(days=d), rows, day_usage):
+                if path not in paths:
+                    paths.append(path)
+        self._last[rows] = last
+        self._open_date = first + datetime.timedelta(days=len(usage) - 1)
+        return paths
+
+    def restore(self, meter_ids: List[str], latest: np.ndarray,
+                history: Iterable[Tuple[datetime.date, List[str], np.ndarray]],
+                open_date: datetime.date, open_usage: Optional[Tuple[List[str], np.ndarray]] = None):
+        """Rebuild the window from completed days' usage (oldest first), without alerting.
+
+        latest holds the meters' latest values; open_usage is the usage so far
+        of open_date, the day in progress.
+        """
+        self.clear()
+        # _indices() grows the vectors, so it runs before they are looked up.
+        rows = self._indices(meter_ids)
+        self._last[rows] = latest
+        for date, day_ids, usage in history:
+            rows = self._indices(day_ids)
+            self._push(self._slot(date), rows, usage.astype(np.float32))
+        self._start = self._last.copy()
+        self._open_date = open_date
+        if open_usage is not None:
+            rows = self._indices(open_usage[0])
+            known = ~np.isnan(open_usage[1])
+            self._start[rows[known]] = self._last[rows[known]] - open_usage[1][known]
+
+    def _month_path(self, month: str) -> str:
+        return os.path.join(self.alert_dir, f"alerts_{month.replace('-', '')}.ndjson")
+
+    def _month(self, month: str) -> Dict[str, dict]:
+        """Alerts of a month (YYYY-MM) by date."""
+        if month not in self._months:
+            days: Dict[str, dict] = {}
+            path = self._month_path(month)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            day = json.loads(line)
+                            days[day.pop("date")] = day
+            self._months[month] = days
+        return self._months[month]
+
+    def _save_month(self, month: str) -> str:
+        path = self._month_path(month)
+        os.makedirs(self.alert_dir, exist_ok=True)
+        with atomic_write(path, "w", encoding="utf-8") as f:
+            for date, day in sorted(self._month(month).items()):
+                f.write(json.dumps(dict(date=date, **day)) + "\n")
+        return path
+
+    def _record(self, date: datetime.date, rows: np.ndarray, alerts: dict) -> List[str]:
+        """Replace the alerts of the checked meters (rows) on date; returns the file written, if any."""
+        days = self._month(date.strftime("%Y-%m"))
+        key = date.isoformat()
+        old = days.get(key)
+        if old is not None:
+            checked = np.zeros(len(self.meter_ids), dtype=bool)
+            checked[rows] = True
+            keep = [k for k, meter_id in enumerate(old["meter_ids"]) if not checked[self.meter_index[meter_id]]]
+            for column in alerts:
+                alerts[column] = [old[column][k] for k in keep] + alerts[column]
+        elif not alerts["meter_ids"]:
+            return []
+        if alerts["meter_ids"]:
+            days[key] = alerts
+        else:
+            del days[key]
+        return [self._save_month(date.strftime("%Y-%m"))]
+
+    def _alert_months(self) -> List[str]:
+        if not os.path.isdir(self.alert_dir):
+            return []
+        return sorted(
+            f"{name[7:11]}-{name[11:13]}" for name in os.listdir(self.alert_dir)
+            if name.startswith("alerts_") and name.endswith(".ndjson")
+        )
+
+    def discard_from(self, date: datetime.date):
+        """Drop the alerts of date and later days."""
+        for month in self._alert_months():
+            if month < date.strftime("%Y-%m"):
+                continue
+            days = self._month(month)
+            later = [key for key in days if key >= date.isoformat()]
+            if not later:
+                continue
+            for key in later:
+                del days[key]
+            if days:
+                self._save_month(month)
+            else:
+                os.remove(self._month_path(month))
+
+    def query(self, start: datetime.date, end: datetime.date, kind: Optional[str] = None,
+              meter_id: Optional[str] = None) -> dict:
+        """Alerts of start..end, optionally of one kind or one meter."""
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f"Invalid kind, expected one of: {', '.join(KINDS)}")
+        first, last = start.isoformat(), end.isoformat()
+        alerts = []
+        for month in self._alert_months():
+            if not first[:7] <= month <= last[:7]:
+                continue
+            for date, day in sorted(self._month(month).items()):
+                if not first <= date <= last:
+                    continue
+                for k, alert_meter in enumerate(day["meter_ids"]):
+                    if (kind is None or day["kinds"][k] == kind) and (meter_id is None or alert_meter == meter_id):
+                        alerts.append({"date": date, "meter_id": alert_meter, "kind": day["kinds"][k],
+                                       "usage": day["usage"][k], "expected": day["expected"][k]})
+        counts = {name: 0 for name in KINDS}
+        for alert in alerts:
+            counts[alert["kind"]] += 1
+        return {"start": first, "end": last, "count": len(alerts), "by_kind": counts, "alerts": alerts}
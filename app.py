@@ -1,33 +1,205 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template
+import atexit
 import json
-import random
 import os
 import datetime
 import shutil
+import threading
 import calendar
+import functools
+import re
+import time
+import numpy as np
 import pandas as pd
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from reading_store import ReadingStore
+from storage import (DailyReadings, daily_file_date, get_daily_storage, list_daily_files, read_daily_file,
+                     storage_for_path)
+from aggregates import MonthAggregate, MonthlyAggregates
+from usage_index import TIME_RANGES, UsageIndex
+from cold_archive import ColdArchive
+from accounts import AccountRegistry
+from areas import AreaCatalog
+from cache import ResultCache
+from generation import ShardedGenerator, cumulative_block, day_summaries
+from consumption import SLOTS_PER_DAY, MeterProfiles, get_consumption_model
+from jobs import JobManager
+from metrics import METRICS
+from profiling import make_profiler
+from durability import SimulationState, atomic_write, file_stamp
+from locking import SystemLock, ValidationError
+from rollups import RollupStore
+from anomalies import LAST_SLOT_MINUTE, AnomalyDetector
+from cube import DIMENSIONS
+from pipeline import (CallbackSink, DailyFileSink, FastForwardMonth, MaintenanceWindow, MonthStart,
+                      NdjsonSink, ReadingBlock, ReadingSink, SafePoint, WindowEnd)
+
+def _legacy_seed_key(seed: int) -> List[int]:
+    """Split a seed into the 32-bit words that random.seed() feeds to MT19937."""
+    seed = abs(seed)
+    key = []
+    while True:
+        key.append(seed & 0xFFFFFFFF)
+        seed >>= 32
+        if not seed:
+            return key
+
+def _next_month_start(time: datetime.datetime) -> datetime.datetime:
+    """The first midnight on the 1st of a month at or after time."""
+    first = time.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if first == time:
+        return first
+    return (first + datetime.timedelta(days=32)).replace(day=1)
+
+def _first_open_day(time: datetime.datetime) -> datetime.date:
+    """The first day whose last reading is not in by time."""
+    return (time - datetime.timedelta(minutes=LAST_SLOT_MINUTE)).date() + datetime.timedelta(days=1)
+
+METER_ID_PATTERN = re.compile(r"^\d{3}-\d{3}-\d{3}$")
+DWELLING_TYPES = {"1", "2", "3", "4", "5", "6"}
+# Usage ranges of a given day or month, which may be in the cold archive.
+HISTORY_RANGES = ("day", "month")
+
+def _reading(method):
+    """Run a SmartMeterSystem method while holding its lock for reading."""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return locked
+
+def _writing(method):
+    """Run a SmartMeterSystem method as the single writer."""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+    return locked
+
+class BulkRegistrationError(ValidationError):
+    """Raised when a bulk registration batch fails validation."""
+    def __init__(self, errors: List[dict]):
+        super().__init__(f"{len(errors)} invalid records, nothing was registered")
+        self.errors = errors
 
 @dataclass
-class MeterReading:
-    meter_id: str
-    reading_time: str
-    meter_value: float
+class CollectionProgress(ReadingSink):
+    """Running totals of one collect_readings call, reported as blocks are generated."""
+    start_time: datetime.datetime
+    target_time: datetime.datetime
+    simulated_time: datetime.datetime
+    readings_count: int = 0
+    sample_readings: List[dict] = field(default_factory=list)
+    callback: Optional[Callable[[dict], None]] = None
+    started_at: float = field(default_factory=time.perf_counter)
+    
+    def on_block(self, block: ReadingBlock):
+        """Count a generated block; only the first few readings are kept as samples."""
+        slot_times, meter_ids, values = block.slot_times, block.meter_ids, block.values
+        self.readings_count += values.size
+        self.simulated_time = slot_times[-1]
+        for slot, meter in zip(*np.unravel_index(np.arange(min(3 - len(self.sample_readings), values.size)), values.shape)):
+            self.sample_readings.append({
+                "meter_ID": meter_ids[meter],
+                "reading_time": slot_times[slot].isoformat(),
+                "meter_value": round(float(values[slot, meter]), 3)
+            })
+        if self.callback is not None:
+            self.callback(self.as_dict())
+    
+    def on_fast_forward(self, month: FastForwardMonth):
+        self.readings_count += month.size
+        self.simulated_time = month.end
+        if self.callback is not None:
+            self.callback(self.as_dict())
+    
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        span = (self.target_time - self.start_time).total_seconds()
+        done = (self.simulated_time - self.start_time).total_seconds()
+        return {
+            "start_time": self.start_time.isoformat(),
+            "target_time": self.target_time.isoformat(),
+            "simulated_time": self.simulated_time.isoformat(),
+            "percent": round(100 * min(max(done / span, 0), 1), 1) if span > 0 else 100.0,
+            "readings_generated": self.readings_count,
+            "elapsed_seconds": round(elapsed, 3),
+            "readings_per_second": round(self.readings_count / elapsed) if elapsed > 0 else 0
+        }
 
 class SmartMeterSystem:
-    def __init__(self, base_dir: str):
+    def __init__(self, base_dir: str, seed: Optional[int] = None, storage_format: str = "json",
+                 verify_aggregates: bool = False, workers: int = 1, export: Optional[str] = None,
+                 sync_interval: float = 0.05, rollup_retention: Optional[Dict[str, Optional[int]]] = None,
+                 consumption_model: str = "uniform", cache_entries: int = 1024):
         self.base_dir = base_dir
         self.data_dir = os.path.join(base_dir, 'data')
         self.accounts_file = os.path.join(self.data_dir, "all_account.json")
         self.current_time_file = os.path.join(self.data_dir, "current_time.json")
         self.daily_readings_dir = os.path.join(self.data_dir, "daily_readings")
         self.monthly_readings_dir = os.path.join(self.data_dir, "month_readings")
+        self.rollup_dir = os.path.join(self.data_dir, "rollups")
+        self.area_data_file = os.path.join(base_dir, "static", "js", "area_data.json")
+        
+        # Registered accounts, loaded once and kept resident.
+        self.account_registry = AccountRegistry(self.accounts_file)
+        # Area metadata by areaId, name and region, reloaded when the file changes.
+        self.area_catalog = AreaCatalog(self.area_data_file)
+        # Pending readings of the current day and the latest value per meter.
+        self.reading_store = ReadingStore()
+        # On-disk format of new daily files; existing files are read in any format.
+        self.daily_storage = get_daily_storage(storage_format)
+        # Per-meter first/last/min/max/sum of each month, updated on every daily flush.
+        self.monthly_aggregates = MonthlyAggregates(os.path.join(self.monthly_readings_dir, "running"))
+        # Cross-check the running aggregates against the daily files when archiving.
+        self.verify_aggregates = verify_aggregates
+        # Daily/monthly consumption per meter for usage queries.
+        self.usage_index = UsageIndex()
+        # Hourly/daily/monthly consumption per meter and per area/dwelling, each
+        # tier with its own retention (days, None keeps it forever).
+        self.rollups = RollupStore(self.rollup_dir, self.account_registry, retention=rollup_retention)
+        # Zero-consumption streaks, spikes and peer outliers of every completed day.
+        self.alert_dir = os.path.join(self.data_dir, "alerts")
+        self.anomalies = AnomalyDetector(self.alert_dir, self._meter_group)
+        # Expired months of daily readings, compressed one file per month.
+        self.cold_archive = ColdArchive(os.path.join(self.data_dir, "cold"))
+        # Write-ahead log of collection ticks and checkpoints of the latest readings.
+        self.state = SimulationState(self.data_dir, sync_interval=sync_interval)
+        # Encoded responses of the read endpoints, valid until the state changes.
+        self.response_cache = ResultCache(max_entries=cache_entries)
         
-        self.latest_readings: Dict[str, float] = {}
-        self.daily_cache: List[MeterReading] = []
+        # Seeding with the same value as random.seed() reproduces the exact
+        # increment stream of the former per-reading random.uniform() loop.
+        self.rng = np.random.RandomState(_legacy_seed_key(seed) if seed is not None else None)
+        # Consumption between readings: "uniform" (the original U(0, 1) kWh) or
+        # "profile" (load curves per dwelling type, day of week and season).
+        self.consumption_model = get_consumption_model(consumption_model)
+        # With several workers, blocks are generated, and JSON daily files encoded,
+        # per meter shard in a process pool.
+        self.workers = max(1, workers)
+        self.generator = ShardedGenerator(self.workers) if self.workers > 1 else None
+        
+        # Consumers of every collected block and flushed day; export adds an
+        # NDJSON stream of all readings ("-" for stdout).
+        self.sinks: List[ReadingSink] = [
+            DailyFileSink(self.daily_storage, self._get_daily_file_path, workers=self.generator),
+            CallbackSink(self.monthly_aggregates.update, self._aggregate_month),
+            CallbackSink(self.usage_index.add_day, lambda month: self.usage_index.skip_to(month.meter_ids, month.final)),
+            CallbackSink(self._rollup_day, self._rollup_month),
+            CallbackSink(self._check_day, self._check_month)
+        ]
+        if export:
+            self.sinks.append(NdjsonSink.open(export))
         
         self._ensure_directories()
+        # Readers run in parallel, writers one at a time across threads and
+        # worker processes; the state is reloaded when another process wrote.
+        self._month_totals_stamp = None
+        self.lock = SystemLock(
+            os.path.join(self.data_dir, "system.lock"), os.path.join(self.data_dir, "state.version"), self._refresh
+        )
+        self.lock.sync()
         
     def _ensure_directories(self):
         """Ensure all required directories exist."""
@@ -35,50 +207,215 @@ class SmartMeterSystem:
         os.makedirs(self.daily_readings_dir, exist_ok=True)
         os.makedirs(self.monthly_readings_dir, exist_ok=True)
     
+    def _refresh(self, full: bool):
+        """Catch up with the writes of another process, or reload everything."""
+        if not full:
+            added = self.account_registry.refresh()
+            update = self.state.catch_up()
+            # Archiving a month writes its totals file and drops old days.
+            archived = self._month_totals_files_stamp() != self._month_totals_stamp
+            full = added is None or update is None or archived
+        if full:
+            self.account_registry.refresh()
+            self.reading_store.reset()
+            self.monthly_aggregates.clear()
+            self.usage_index.clear()
+            self.rollups.clear_cache()
+            self._recover_state()
+            self._build_usage_index()
+            self._restore_anomalies()
+            return
+        
+        for account in added:
+            self.usage_index.add_meter(account["meter_ID"])
+        if update.files:
+            # The other process collected from a later time, so the zero readings of
+            # meters registered here can no longer go in front of their first readings.
+            self.reading_store.clear()
+        # Month states cached here may be outdated.
+        self.monthly_aggregates.clear()
+        self.rollups.clear_cache()
+        self._load_latest(update.files, index_days=True)
+        self._restore_anomalies()
+    
+    def _load_latest(self, daily_paths: List[str], index_days: bool = False):
+        """Take the latest value of every meter from daily files (oldest first)."""
+        for daily_path in dict.fromkeys(daily_paths):
+            if storage_for_path(daily_path) is None or not os.path.exists(daily_path):
+                continue
+            readings = read_daily_file(daily_path)
+            # indices() may grow the latest vector, so it is looked up first.
+            meter_index = self.reading_store.indices(readings.meter_ids)
+            self.reading_store.latest[meter_index] = readings.last_values()
+            if index_days:
+                self.usage_index.add_day(readings, replace=True)
+    
+    def _recover_state(self):
+        """Restore the simulation time and the latest readings after a restart.
+        
+        The time is the last one logged; readings written after it belong to
+        an interrupted collection and are discarded, so collecting again from
+        that time does not duplicate them. The latest value of every meter
+        comes from the checkpoint plus the daily files logged since.
+        """
+        recovered = self.state.recover()
+        first_start = recovered.time is None
+        if first_start:
+            # No checkpoint yet (new or older data directory): take the latest
+            # readings from the daily files once.
+            recovered.time = self.get_current_time()
+            recovered.files = [
+                path for month in sorted(os.listdir(self.daily_readings_dir))
+                for path in list_daily_files(os.path.join(self.daily_readings_dir, month))
+            ]
+        else:
+            self._discard_readings_after(recovered.time)
+            # Fast-forwarded months have no daily files to discard.
+            self.monthly_aggregates.drop_from(_next_month_start(recovered.time))
+        if not self.rollups.cube.exists():
+            # Rollups written before the analytics cube existed.
+            self.rollups.build_cube()
+        self._backfill_rollups()
+        
+        meter_index = self.reading_store.indices(recovered.meter_ids)
+        self.reading_store.latest[meter_index] = recovered.latest
+        self._load_latest(recovered.files)
+        
+        if first_start:
+            self.state.checkpoint(recovered.time, self.reading_store.meter_ids, self.reading_store.latest)
+        if not os.path.exists(self.current_time_file) or self.get_current_time() != recovered.time:
+            self.save_current_time(recovered.time)
+    
+    def _backfill_rollups(self):
+        """Roll up the daily files of days that have no rollups.
+        
+        These are days flushed before rollups existed, or whose rollup
+        directory was removed; days already rolled up are left as they are.
+        """
+        daily_paths = [
+            path for month in sorted(os.listdir(self.daily_readings_dir))
+            for path in list_daily_files(os.path.join(self.daily_readings_dir, month))
+        ]
+        missing = set(self.rollups.missing_days([daily_file_date(path) for path in daily_paths]))
+        for daily_path in daily_paths:
+            if daily_file_date(daily_path) in missing:
+                self.rollups.add_day(read_daily_file(daily_path))
+    
+    def _discard_readings_after(self, resume_time: datetime.datetime):
+        """Remove daily readings later than resume_time and recompute their months."""
+        first_day = resume_time.strftime("%Y%m%d")
+        changed_months, later_days = [], []
+        for month in sorted(os.listdir(self.daily_readings_dir)):
+            month_dir = os.path.join(self.daily_readings_dir, month)
+            if month < first_day[:6] or not os.path.isdir(month_dir):
+                continue
+            changed = False
+            for daily_path in list_daily_files(month_dir):
+                if os.path.basename(daily_path)[9:17] < first_day:
+                    continue
+                later_days.append(daily_path)
+                readings = read_daily_file(daily_path)
+                cutoff = (resume_time - datetime.datetime.combine(readings.date, datetime.time())) // datetime.timedelta(minutes=1)
+                keep = np.asarray(readings.minutes, dtype=np.int64) <= cutoff
+                if keep.all():
+                    continue
+                changed = True
+                if keep.any():
+                    storage_for_path(daily_path).write_day(daily_path, readings.select(keep))
+                else:
+                    os.remove(daily_path)
+            if changed:
+                self.monthly_aggregates.rebuild(datetime.datetime.strptime(month, "%Y%m"), list_daily_files(month_dir))
+                changed_months.append(month_dir)
+        self.anomalies.discard_from(_first_open_day(resume_time))
+        if changed_months or self.rollups.fast_forwarded_from(resume_time.date()):
+            self.rollups.discard_from(resume_time.date())
+            for daily_path in later_days:
+                if os.path.exists(daily_path):
+                    self.rollups.add_day(read_daily_file(daily_path))
+    
+    def _restore_anomalies(self):
+        """Rebuild the anomaly detector's window from the daily rollups."""
+        open_date = _first_open_day(self.get_current_time())
+        history = self.rollups.daily_usage(open_date - datetime.timedelta(days=AnomalyDetector.WINDOW),
+                                           open_date - datetime.timedelta(days=1))
+        open_usage = next(((ids, usage) for _, ids, usage in self.rollups.daily_usage(open_date, open_date)), None)
+        meter_ids = self.reading_store.meter_ids
+        self.anomalies.restore(meter_ids, self.reading_store.latest[:len(meter_ids)], history, open_date, open_usage)
+    
+    def _build_usage_index(self):
+        """Load registered meters, daily files and monthly totals into the usage index."""
+        for account in self.load_accounts():
+            self.usage_index.add_meter(account["meter_ID"])
+        for month in sorted(os.listdir(self.daily_readings_dir)):
+            for daily_path in list_daily_files(os.path.join(self.daily_readings_dir, month)):
+                self.usage_index.add_day(read_daily_file(daily_path))
+        legacy_file = os.path.join(self.monthly_readings_dir, "month_readings.json")
+        if os.path.exists(legacy_file):
+            # Months archived into a single file by earlier versions.
+            with open(legacy_file, "r", encoding="utf-8") as f:
+                self.usage_index.load_month_readings(json.load(f))
+        self._month_totals_stamp = self._month_totals_files_stamp()
+        for month, path in self._month_totals_files():
+            with open(path, "r", encoding="utf-8") as f:
+                self.usage_index.set_month(f"{month[:4]}-{month[4:]}", json.load(f))
+    
+    def _month_totals_path(self, month: str) -> str:
+        """Archived consumption of every meter in a month (YYYYMM), next to its reports."""
+        return os.path.join(self.monthly_readings_dir, month, f"month_readings_{month}.json")
+    
+    def _month_totals_files(self) -> List[Tuple[str, str]]:
+        """(YYYYMM, path) of every archived month, oldest first."""
+        months = (name for name in sorted(os.listdir(self.monthly_readings_dir)) if name.isdigit())
+        return [(month, path) for month, path in ((m, self._month_totals_path(m)) for m in months)
+                if os.path.exists(path)]
+    
+    def _month_totals_files_stamp(self):
+        return tuple((path, file_stamp(path)) for _, path in self._month_totals_files())
+    
     def get_month_directory(self, base_dir: str, date: datetime.datetime) -> str:
         """Get the directory for the specified month."""
         month_dir = os.path.join(base_dir, date.strftime("%Y%m"))
         os.makedirs(month_dir, exist_ok=True)
         return month_dir
     
+    @_reading
     def get_current_time(self) -> datetime.datetime:
-        """Get the current simulation time."""
+        """Get the current simulation time.
+        
+        Without a time file this is the initial time; startup writes it under
+        the write lock (see _recover_state).
+        """
         if os.path.exists(self.current_time_file):
             with open(self.current_time_file, "r") as f:
                 return datetime.datetime.fromisoformat(json.load(f)["current_time"])
-        else:
-            initial_time = datetime.datetime(2024, 5, 1)
-            self.save_current_time(initial_time)
-            return initial_time
+        return datetime.datetime(2024, 5, 1)
     
+    @_writing
     def save_current_time(self, current_time: datetime.datetime):
         """Save the current simulation time."""
-        with open(self.current_time_file, "w") as f:
+        with atomic_write(self.current_time_file, "w") as f:
             json.dump({"current_time": current_time.isoformat()}, f)
     
+    @_reading
     def load_accounts(self) -> List[dict]:
-        """Load all registered accounts."""
-        if os.path.exists(self.accounts_file):
-            with open(self.accounts_file, "r", encoding="utf-8") as f:
-                try:
-                    accounts = json.load(f)
-                    return accounts if isinstance(accounts, list) else []
-                except json.JSONDecodeError:
-                    return []
-        return []
+        """Get all registered accounts."""
+        return self.account_registry.all()
     
+    @_writing
     def save_accounts(self, accounts: List[dict]):
-        """Save account information."""
-        os.makedirs(os.path.dirname(self.accounts_file), exist_ok=True)
-        with open(self.accounts_file, "w", encoding="utf-8") as f:
-            json.dump(accounts, f, ensure_ascii=False, indent=2)
+        """Replace all account information."""
+        self.account_registry.replace_all(accounts)
     
+    @_writing
     def register_meter(self, meter_id: str, area: str, dwelling: str) -> dict:
-        """Register a new meter."""
-        accounts = self.load_accounts()
-        
-        if any(account["meter_ID"] == meter_id for account in accounts):
-            raise ValueError("Meter ID already exists")
+        """Register a new meter; area is a name or areaId and is stored as the name."""
+        if meter_id in self.account_registry:
+            raise ValidationError("Meter ID already exists")
+        known_area = self.area_catalog.lookup(area)
+        if known_area is None:
+            raise ValidationError(f"Unknown area: {area}")
+        area = known_area.name
             
         current_time = self.get_current_time()
         formatted_time = current_time.strftime("%Y-%m-%dT%H:%M:%S")
@@ -90,53 +427,113 @@ class SmartMeterSystem:
             "register_time": formatted_time
         }
         
-        reading = MeterReading(
-            meter_id=meter_id,
-            reading_time=formatted_time,
-            meter_value=0
-        )
-        
-        accounts.append(account)
-        self.save_accounts(accounts)
+        self.account_registry.add(account)
         
-        self.latest_readings[meter_id] = 0
-        self.daily_cache.append(reading)
+        self.reading_store.append(meter_id, current_time, 0)
+        self.usage_index.add_meter(meter_id)
         
         return account
     
-    def collect_readings(self, increment_unit: str = 'days', increment_value: int = 1) -> dict:
-        """Collect meter readings for the specified time period."""
-        accounts = self.load_accounts()
+    @_writing
+    def register_meters_bulk(self, records) -> List[dict]:
+        """Validate and register many meters in a single transaction.
+        
+        Records use the /register keys (meterId, area, dwelling); meter_ID is
+        accepted as well. Areas are given by name or areaId and stored by
+        name. Either every record is registered or none is.
+        """
+        current_time = self.get_current_time()
+        formatted_time = current_time.strftime("%Y-%m-%dT%H:%M:%S")
+        
+        accounts, errors, seen = [], [], set()
+        for row, record in enumerate(records):
+            meter_id = str(record.get("meterId") or record.get("meter_ID") or "").strip()
+            area = str(record.get("area") or "").strip()
+            dwelling = str(record.get("dwelling") or "").strip()
+            known_area = self.area_catalog.lookup(area)
+            if not METER_ID_PATTERN.match(meter_id):
+                errors.append({"row": row, "meterId": meter_id, "error": "Invalid meter ID format"})
+            elif meter_id in seen or meter_id in self.account_registry:
+                errors.append({"row": row, "meterId": meter_id, "error": "Meter ID already exists"})
+            elif known_area is None:
+                errors.append({"row": row, "meterId": meter_id, "error": f"Unknown area: {area}"})
+            elif dwelling not in DWELLING_TYPES:
+                errors.append({"row": row, "meterId": meter_id, "error": f"Unknown dwelling type: {dwelling}"})
+            else:
+                seen.add(meter_id)
+                accounts.append({
+                    "meter_ID": meter_id,
+                    "area": known_area.name,
+                    "dwelling": dwelling,
+                    "register_time": formatted_time
+                })
+        if errors:
+            raise BulkRegistrationError(errors)
         if not accounts:
+            return []
+        
+        self.account_registry.add_many(accounts)
+        
+        # Seed every new meter with a zero reading in one block.
+        meter_ids = [account["meter_ID"] for account in accounts]
+        meter_index = self.reading_store.indices(meter_ids)
+        self.reading_store.append_block([current_time], meter_index, np.zeros((1, len(meter_ids))))
+        for meter_id in meter_ids:
+            self.usage_index.add_meter(meter_id)
+        
+        return accounts
+    
+    @_reading
+    def check_collection(self, increment_unit: str, increment_value: int) -> datetime.datetime:
+        """Validate a collection request and return the time it would advance to."""
+        if not len(self.account_registry):
             raise ValueError("No registered accounts")
+        return self._calculate_next_time(self.get_current_time(), increment_unit, increment_value)
+    
+    @_writing
+    def collect_readings(self, increment_unit: str = 'days', increment_value: int = 1,
+                         on_progress: Optional[Callable[[dict], None]] = None,
+                         fast_forward: bool = False) -> dict:
+        """Collect meter readings for the specified time period.
+        
+        Readings are streamed through the pipeline (generate, partition by
+        day, sinks) as they are generated, so at most one day is buffered;
+        only their count and the first few samples are returned. on_progress
+        is called with CollectionProgress.as_dict() after every block.
+        
+        With fast_forward, whole months that the cleanup would delete by the
+        end of the collection are only summarized (see _fast_forward_range).
+        """
+        accounts = self.load_accounts()
+        if not accounts:
+            raise ValidationError("No registered accounts")
             
         current_time = self.get_current_time()
         next_time = self._calculate_next_time(current_time, increment_unit, increment_value)
         
-        all_readings = []
-        temp_current = current_time
-        
-        # If increment unit is 'months', generate readings day-by-day.
-        if increment_unit == 'months':
-            while temp_current < next_time:
-                daily_readings = self._generate_readings(
-                    temp_current,
-                    min(temp_current + datetime.timedelta(days=1), next_time),
-                    accounts
-                )
-                all_readings.extend(daily_readings)
-                temp_current += datetime.timedelta(days=1)
+        progress = CollectionProgress(current_time, next_time, current_time, callback=on_progress)
+        sinks = self.sinks + [progress]
+        skipped = self._fast_forward_range(current_time, next_time) if fast_forward else None
+        if skipped is None:
+            events = self._generate_blocks(current_time, next_time, accounts)
         else:
-            # For other cases (days, hours, minutes), use the original logic.
-            all_readings = self._generate_readings(current_time, next_time, accounts)
+            events = self._fast_forward_blocks(current_time, next_time, accounts, *skipped)
+        self._drain(self._partition_by_day(events), sinks)
+        for sink in sinks:
+            sink.flush()
         
         self.save_current_time(next_time)
+        progress.simulated_time = next_time
         
         return {
             "message": f"Readings collected from {current_time} to {next_time}",
-            "readings_count": len(all_readings),
-            "sample_readings": all_readings[:3] if all_readings else [],
-            "new_time": next_time.isoformat()
+            "readings_count": progress.readings_count,
+            "sample_readings": progress.sample_readings,
+            "new_time": next_time.isoformat(),
+            "fast_forwarded": {
+                "from": skipped[0].isoformat(), "to": skipped[1].isoformat()
+            } if skipped is not None else None,
+            "progress": progress.as_dict()
         }
     
     def _calculate_next_time(
@@ -170,115 +567,218 @@ class SmartMeterSystem:
                 minute=current_time.minute
             )
         else:
-            raise ValueError("Invalid time unit")
-    
-    def _generate_readings(self, current_time: datetime.datetime, next_time: datetime.datetime, accounts: List[dict]) -> List[dict]:
-        all_readings = []
-        current = current_time
-        
-        # ======= Added: If the target time span exceeds one day, generate data day-by-day =======
-        if (next_time - current_time).total_seconds() > 86400:
-            temp_current = current_time
-            while temp_current < next_time:
-                # Calculate the end of the day (not exceeding next_time)
-                day_end = min(temp_current + datetime.timedelta(days=1), next_time)
-                # Recursively call _generate_readings to process data within one day (where the time span is <= 1 day)
-                daily_readings = self._generate_readings(temp_current, day_end, accounts)
-                all_readings.extend(daily_readings)
-                temp_current += datetime.timedelta(days=1)
-            return all_readings
-        # ======= End of added section =======
-        
-        # Do not skip immediately at midnight; stay at midnight.
-        current = current.replace(minute=0, second=0, microsecond=0)
-        
-        while current <= next_time:
-            # If in the maintenance period (0:00-1:00)
-            if current.hour == 0:
-                process_date = current - datetime.timedelta(minutes=1)
-                # Assume the simulation start date is 2024-05-01
-                if process_date.date() >= datetime.date(2024, 5, 1):
-                    self._process_daily_data(process_date)
-                if current.day == 1:
-                    self._archive_and_prepare_monthly_data(current)
-                current = current.replace(hour=1)
-                continue
-                
-            # Generate the next reading time point (every 30 minutes)
-            reading_time = current + datetime.timedelta(minutes=30)
+            raise ValidationError("Invalid time unit")
+    
+    def _generate_blocks(self, current_time: datetime.datetime, next_time: datetime.datetime,
+                         accounts: List[dict]) -> Iterator[object]:
+        """Generation stage: reading blocks and maintenance events, one day window at a time."""
+        meter_ids = [account["meter_ID"] for account in accounts]
+        profiles = self.consumption_model.profiles(accounts)
+        
+        # Spans are generated day-by-day, each window at most one day long.
+        window_start = current_time
+        while True:
+            window_end = min(window_start + datetime.timedelta(days=1), next_time)
+            slot_times: List[datetime.datetime] = []
             
-            # If the next reading time exceeds the end time or enters the maintenance period, break the loop.
-            if reading_time > next_time or reading_time.hour == 0:
-                break
-                
-            # Generate a reading for each account.
-            for account in accounts:
-                meter_id = account["meter_ID"]
-                previous_value = self.latest_readings.get(meter_id, 0)
-                increment = random.uniform(0, 1)
-                meter_value = previous_value + increment
-                self.latest_readings[meter_id] = meter_value
-                
-                reading_dict = {
-                    "meter_ID": meter_id,
-                    "reading_time": reading_time.isoformat(),
-                    "meter_value": round(meter_value, 3)
-                }
-                all_readings.append(reading_dict)
+            # Do not skip immediately at midnight; stay at midnight.
+            current = window_start.replace(minute=0, second=0, microsecond=0)
+            
+            while current <= window_end:
+                # If in the maintenance period (0:00-1:00)
+                if current.hour == 0:
+                    # Readings before midnight belong to the day being closed.
+                    yield from self._generate_reading_block(slot_times, meter_ids, profiles)
+                    slot_times = []
+                    yield MaintenanceWindow(current)
+                    current = current.replace(hour=1)
+                    continue
+                    
+                # Generate the next reading time point (every 30 minutes)
+                reading_time = current + datetime.timedelta(minutes=30)
                 
-                # Convert to a MeterReading object and add to daily_cache.
-                reading = MeterReading(
-                    meter_id=meter_id,
-                    reading_time=reading_time.isoformat(),
-                    meter_value=round(meter_value, 3)
-                )
-                self.daily_cache.append(reading)
+                # If the next reading time exceeds the end time or enters the maintenance period, break the loop.
+                if reading_time > window_end or reading_time.hour == 0:
+                    break
+                    
+                slot_times.append(reading_time)
+                current = reading_time
+            
+            yield from self._generate_reading_block(slot_times, meter_ids, profiles)
+            yield WindowEnd(window_end)
             
-            current = reading_time
+            window_start += datetime.timedelta(days=1)
+            if window_start >= next_time:
+                return
+    
+    @staticmethod
+    def _fast_forward_range(current_time: datetime.datetime,
+                            next_time: datetime.datetime) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+        """The whole months of a collection that can be fast-forwarded, or None.
         
-        # Process data for the last day
-        if self.daily_cache:
-            # Use the time of the last reading in daily_cache as the archiving date.
-            last_reading_time = datetime.datetime.fromisoformat(self.daily_cache[-1].reading_time)
-            self._process_daily_data(last_reading_time)
-                
-        return all_readings
+        These are the months from the first month start on, up to the month
+        before the last month start reached before next_time: by then the
+        cleanup has deleted their daily readings and only their aggregates
+        would be left.
+        """
+        first = _next_month_start(current_time)
+        last_start = (next_time - datetime.timedelta(minutes=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        kept = (last_start - datetime.timedelta(days=1)).replace(day=1)
+        return (first, kept) if first < kept else None
     
-    def _process_daily_data(self, current_date: datetime.datetime):
-        """Process and save daily data in JSON format."""
-        if not self.daily_cache:
+    def _fast_forward_blocks(self, current_time: datetime.datetime, next_time: datetime.datetime,
+                             accounts: List[dict], first: datetime.datetime,
+                             kept: datetime.datetime) -> Iterator[object]:
+        """Generation stage of a fast-forward: readings up to first, summarized months, readings from kept."""
+        meter_ids = [account["meter_ID"] for account in accounts]
+        profiles = self.consumption_model.profiles(accounts)
+        if current_time < first:
+            yield from self._generate_blocks(current_time, first, accounts)
+        # The maintenance hour at first flushes the day before and archives as usual;
+        # readings still buffered at first go into the summary of its month.
+        yield MaintenanceWindow(first)
+        month = first
+        while month < kept:
+            next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+            yield self._fast_forward_month(month, (next_month - month).days, meter_ids, profiles)
+            if next_month < kept:
+                yield MonthStart(next_month)
+            # The latest values are in no daily file, so they are checkpointed.
+            yield SafePoint(next_month, checkpoint=True)
+            month = next_month
+        yield from self._generate_blocks(kept, next_time, accounts)
+    
+    def _fast_forward_month(self, month: datetime.datetime, days: int, meter_ids: List[str],
+                            profiles: MeterProfiles) -> FastForwardMonth:
+        """Summarize the readings of every day of a month without generating them."""
+        with METRICS.span("fast_forward"):
+            meter_index = self.reading_store.indices(meter_ids)
+            previous = self.reading_store.latest[meter_index]
+            dates = [month.date() + datetime.timedelta(days=d) for d in range(days)]
+            first, last, total = day_summaries(self.rng, previous, self.consumption_model, dates, profiles)
+        return FastForwardMonth(month, meter_ids, meter_index, previous, first, last, total, SLOTS_PER_DAY)
+    
+    def _generate_reading_block(self, slot_times: List[datetime.datetime], meter_ids: List[str],
+                                profiles: MeterProfiles) -> Iterator[ReadingBlock]:
+        """Generate readings for all meters x all slots as one increment matrix."""
+        if not slot_times or not meter_ids:
             return
-
-        # 组织数据结构
-        daily_data = {}
-        for reading in self.daily_cache:
-            meter_id = reading.meter_id
-            if meter_id not in daily_data:
-                daily_data[meter_id] = {
-                    "date": current_date.strftime("%Y-%m-%d"),
-                    "readings": []
-                }
-            daily_data[meter_id]["readings"].append({
-                "time": datetime.datetime.fromisoformat(reading.reading_time).strftime("%H:%M"),
-                "value": round(reading.meter_value, 3)
-            })
-
-        # 生成 JSON 文件路径
-        daily_file = self._get_daily_file_path(current_date).replace(".csv", ".json")
-        os.makedirs(os.path.dirname(daily_file), exist_ok=True)
-
-        # 保存 JSON 格式数据
-        with open(daily_file, "w", encoding="utf-8") as f:
-            json.dump(daily_data, f, ensure_ascii=False, indent=2)
-
-        # 清空缓存
-        self.daily_cache.clear()
+        
+        with METRICS.span("generate"):
+            meter_index = self.reading_store.indices(meter_ids)
+            previous = self.reading_store.latest[meter_index]
+            
+            if self.generator is not None:
+                # Per-block shard key drawn from the system RNG keeps seeded runs reproducible.
+                key = self.rng.randint(0, 2 ** 32, size=4).tolist()
+                values = self.generator.generate(self.consumption_model, previous, slot_times, profiles, key)
+            else:
+                values = cumulative_block(previous, self.consumption_model.increments(self.rng, slot_times, profiles))
+        METRICS.count("readings_generated_total", values.size)
+        
+        yield ReadingBlock(slot_times, meter_ids, meter_index, values)
+    
+    def _partition_by_day(self, events: Iterator[object]) -> Iterator[object]:
+        """Partition stage: buffer blocks in the reading store and emit each finished day."""
+        for event in events:
+            if isinstance(event, ReadingBlock):
+                self.reading_store.append_block(event.slot_times, event.meter_index, event.values)
+                yield event
+            elif isinstance(event, MaintenanceWindow):
+                process_date = event.time - datetime.timedelta(minutes=1)
+                # Assume the simulation start date is 2024-05-01
+                if process_date.date() >= datetime.date(2024, 5, 1):
+                    yield from self._flush_day(process_date)
+                if event.time.day == 1:
+                    yield MonthStart(event.time)
+                # Resuming here repeats the maintenance hour, which finds nothing left to
+                # flush; resuming off the hour would never reach a maintenance hour again.
+                yield SafePoint(event.time)
+            elif isinstance(event, WindowEnd):
+                if len(self.reading_store):
+                    # Use the time of the last buffered reading as the archiving date.
+                    yield from self._flush_day(self.reading_store.last_time())
+                yield SafePoint(event.time)
+            else:
+                if isinstance(event, FastForwardMonth):
+                    # The month starts from the latest values, which include the
+                    # registration readings of a collection started at its midnight.
+                    self.reading_store.clear()
+                    self.reading_store.latest[event.meter_index] = event.final
+                yield event
+    
+    def _flush_day(self, current_date: datetime.datetime) -> Iterator[DailyReadings]:
+        if len(self.reading_store):
+            # 组织数据结构, readings are kept to 3 decimals in every format
+            readings = DailyReadings.from_batch(current_date.date(), self.reading_store.flush())
+            readings.values = np.round(readings.values, 3)
+            yield readings
+    
+    def _drain(self, events: Iterator[object], sinks: List[ReadingSink]):
+        """Sink stage: hand every block, day and month boundary to the sinks."""
+        for event in events:
+            if isinstance(event, ReadingBlock):
+                for sink in sinks:
+                    sink.on_block(event)
+            elif isinstance(event, DailyReadings):
+                with METRICS.span("daily_flush"):
+                    for sink in sinks:
+                        sink.on_day(event)
+                # Written files are logged with the next safe point.
+                self.state.track(self._get_daily_file_path(event.date))
+                self.state.track(self.monthly_aggregates.path_for(event.date))
+            elif isinstance(event, FastForwardMonth):
+                for sink in sinks:
+                    sink.on_fast_forward(event)
+            elif isinstance(event, MonthStart):
+                self._archive_and_prepare_monthly_data(event.time)
+                for sink in sinks:
+                    sink.on_month_start(event.time)
+            elif isinstance(event, SafePoint):
+                with METRICS.span("wal_log"):
+                    self.state.log(event.time)
+                if event.checkpoint or self.state.needs_checkpoint:
+                    with METRICS.span("checkpoint"):
+                        self.state.checkpoint(event.time, self.reading_store.meter_ids, self.reading_store.latest)
+    
+    def _process_daily_data(self, current_date: datetime.datetime):
+        """Process and save the buffered readings as the data of current_date."""
+        self._drain(self._flush_day(current_date), self.sinks)
+    
+    def _meter_group(self, meter_id: str):
+        """(area, dwelling) of a registered meter."""
+        account = self.account_registry.get(meter_id)
+        return (account["area"], account["dwelling"]) if account else None
+    
+    def _rollup_day(self, readings: DailyReadings):
+        for path in self.rollups.add_day(readings):
+            self.state.track(path)
+    
+    def _rollup_month(self, month: FastForwardMonth):
+        for path in self.rollups.add_days(month.month.date(), month.meter_ids, month.usage, month.final):
+            self.state.track(path)
+    
+    def _check_day(self, readings: DailyReadings):
+        for path in self.anomalies.add_day(readings):
+            self.state.track(path)
+    
+    def _check_month(self, month: FastForwardMonth):
+        for path in self.anomalies.add_days(month.month.date(), month.meter_ids, month.usage, month.final):
+            self.state.track(path)
     
-    def _get_daily_file_path(self, date: datetime.datetime) -> str:
+    def _aggregate_month(self, month: FastForwardMonth):
+        aggregate = MonthAggregate.from_days(
+            self.monthly_aggregates.month_key(month.month), month.meter_ids,
+            month.first, month.last, month.total, month.slots_per_day
+        )
+        self.state.track(self.monthly_aggregates.put(month.month, aggregate))
+    
+    def _get_daily_file_path(self, date) -> str:
         """Get the file path for daily readings."""
         month_dir = self.get_month_directory(self.daily_readings_dir, date)
-        return os.path.join(month_dir, f"readings_{date.strftime('%Y%m%d')}.json")
+        return os.path.join(month_dir, f"readings_{date.strftime('%Y%m%d')}{self.daily_storage.extension}")
     
+    @METRICS.timed("monthly_archive")
     def _archive_and_prepare_monthly_data(self, current_date: datetime.datetime):
         """Archive monthly total readings using first and last readings of the month."""
         first_of_current = current_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
@@ -294,155 +794,210 @@ class SmartMeterSystem:
 
         # 归档目录
         process_month_daily_dir = self.get_month_directory(self.daily_readings_dir, month_to_process)
-        process_monthly_file = os.path.join(self.monthly_readings_dir, "month_readings.json")
-
-        # 读取已有 `month_readings.json`
-        if os.path.exists(process_monthly_file):
-            with open(process_monthly_file, "r", encoding="utf-8") as f:
-                monthly_data = json.load(f)
-        else:
-            monthly_data = {}
-
-        # 用于存储每个电表的第一天和最后一天的读数
-        first_readings = {}  # {meter_id: 第一日第一个读数}
-        last_readings = {}   # {meter_id: 最后一天最后一个读数}
-
-        if os.path.exists(process_month_daily_dir):
-            for daily_file in sorted(os.listdir(process_month_daily_dir)):  # 按日期排序
-                if daily_file.endswith(".json"):
-                    daily_path = os.path.join(process_month_daily_dir, daily_file)
-
-                    with open(daily_path, 'r', encoding='utf-8') as f:
-                        daily_data = json.load(f)
 
-                    for meter_id, meter_data in daily_data.items():
-                        readings = sorted(meter_data["readings"], key=lambda x: x["time"])  # 按时间排序
-
-                        # 记录第一个读数
-                        if meter_id not in first_readings:
-                            first_readings[meter_id] = readings[0]["value"]
-
-                        # 记录最后一个读数
-                        last_readings[meter_id] = readings[-1]["value"]
+        # 每个电表的月度首末读数, maintained incrementally by _process_daily_data
+        aggregate = self.monthly_aggregates.get(month_to_process)
+        if aggregate is None:
+            # Months flushed before running aggregates existed.
+            aggregate = MonthAggregate.from_files(
+                month_to_process.strftime("%Y%m"), list_daily_files(process_month_daily_dir)
+            )
+        elif self.verify_aggregates and list_daily_files(process_month_daily_dir):
+            # Fast-forwarded months have no daily files to check against.
+            mismatches = self.verify_monthly_aggregates(month_to_process)
+            if mismatches:
+                raise RuntimeError(
+                    f"Running aggregates for {month_to_process.strftime('%Y-%m')} differ from "
+                    f"the daily files for {len(mismatches)} meters"
+                )
 
         # 计算月用电量
-        for meter_id in first_readings.keys():
-            if meter_id in last_readings:
-                month_key = month_to_process.strftime("%Y-%m")
-                month_total = last_readings[meter_id] - first_readings[meter_id]
+        month_key = month_to_process.strftime("%Y-%m")
+        month_totals = aggregate.totals()
+        if month_totals:
+            # Empty when an interrupted archive is repeated after the cleanup.
+            self.usage_index.set_month(month_key, month_totals)
+            # 存入 `month_readings_YYYYMM.json`, one compact file per month so that
+            # archiving never rewrites the months before it.
+            totals_file = self._month_totals_path(month_to_process.strftime("%Y%m"))
+            os.makedirs(os.path.dirname(totals_file), exist_ok=True)
+            with atomic_write(totals_file, "w", encoding="utf-8", sync=True) as f:
+                f.write(json.dumps({meter_id: round(total, 3) for meter_id, total in month_totals.items()},
+                                   ensure_ascii=False, separators=(",", ":")))
+            self._month_totals_stamp = self._month_totals_files_stamp()
 
-                # 存入 `month_readings.json`
-                if meter_id not in monthly_data:
-                    monthly_data[meter_id] = {}
-
-                monthly_data[meter_id][month_key] = round(month_total, 3)
-
-        # 保存更新后的 `month_readings.json`
-        os.makedirs(self.monthly_readings_dir, exist_ok=True)
-        with open(process_monthly_file, "w", encoding="utf-8") as f:
-            json.dump(monthly_data, f, ensure_ascii=False, indent=2)
+        # 月度报表 (monthly_summary / area_monthly_summary / area_analysis)
+        self._build_monthly_reports(month_to_process, process_month_daily_dir)
 
         # 清除 2 个月前的 `daily_readings`
         self._cleanup_old_readings(last_month_first)
 
+    @_reading
+    def verify_monthly_aggregates(self, month: datetime.datetime) -> List[str]:
+        """Compare a month's running aggregates with a full recompute from its daily files."""
+        aggregate = self.monthly_aggregates.get(month)
+        month_dir = os.path.join(self.daily_readings_dir, month.strftime("%Y%m"))
+        recomputed = MonthAggregate.from_files(month.strftime("%Y%m"), list_daily_files(month_dir))
+        if aggregate is None:
+            return list(recomputed.meter_ids)
+        return aggregate.mismatches(recomputed)
 
     
+    def _load_month_frame(self, month_daily_dir: str) -> pd.DataFrame:
+        """Build df_combined for a month from its daily files.
+        
+        Readings are cumulative, so each meter's first and last reading of a
+        day carry everything the report builders need (first/last of the
+        month, max - min of a day); only those rows are loaded.
+        """
+        frames = []
+        for daily_path in list_daily_files(month_daily_dir):
+            readings = read_daily_file(daily_path)
+            if not len(readings):
+                continue
+            rows = np.stack((readings.starts[:-1], readings.starts[1:] - 1), axis=1).ravel()
+            meter_ids = np.repeat(np.array(readings.meter_ids, dtype=object), 2)
+            date_str = readings.date.strftime("%Y-%m-%d")
+            frames.append(pd.DataFrame({
+                "meter_ID": meter_ids,
+                "date": date_str,
+                "date_time": pd.Timestamp(readings.date) + pd.to_timedelta(np.asarray(readings.minutes[rows], dtype=np.int64), unit="m"),
+                "meter_value": np.asarray(readings.values[rows])
+            }))
+        if not frames:
+            return pd.DataFrame(columns=["meter_ID", "date", "date_time", "meter_value"])
+        return pd.concat(frames, ignore_index=True)
+    
+    @METRICS.timed("monthly_reports")
+    def _build_monthly_reports(self, month_first: datetime.datetime, month_daily_dir: str):
+        """Write the monthly summary, area summary and area analysis CSVs of a month."""
+        df_combined = self._load_month_frame(month_daily_dir)
+        if df_combined.empty:
+            return
+        accounts = {account["meter_ID"]: account for account in self.load_accounts()}
+        month_last = month_first.replace(day=calendar.monthrange(month_first.year, month_first.month)[1])
+        monthly_dir = self.get_month_directory(self.monthly_readings_dir, month_first)
+        
+        self._process_monthly_consumption(df_combined, accounts, month_first, monthly_dir)
+        self._process_area_monthly_summary(df_combined, accounts, month_first, monthly_dir)
+        self._process_region_monthly_summary(df_combined, accounts, month_first, monthly_dir)
+        self._process_area_analysis(df_combined, accounts, month_first, month_last, monthly_dir)
+    
+    @staticmethod
+    def _meter_consumption(df_combined: pd.DataFrame) -> pd.Series:
+        """Last minus first reading per meter, by reading time."""
+        values = df_combined.sort_values('date_time', kind='stable').groupby('meter_ID')['meter_value']
+        return values.last() - values.first()
+    
     def _process_monthly_consumption(self, df_combined: pd.DataFrame, accounts: Dict, 
                                      last_month: datetime.datetime, last_month_monthly_dir: str):
         """Process monthly consumption data."""
-        first_readings = df_combined.sort_values('date_time').groupby('meter_ID').first()
-        last_readings = df_combined.sort_values('date_time').groupby('meter_ID').last()
-        
-        monthly_consumption_data = []
-        for meter_id in first_readings.index:
-            if meter_id in accounts:
-                consumption = last_readings.loc[meter_id, 'meter_value'] - first_readings.loc[meter_id, 'meter_value']
-                monthly_consumption_data.append({
-                    'meter_ID': meter_id,
-                    'month_consumption': round(consumption, 3)
-                })
+        consumption = self._meter_consumption(df_combined)
+        consumption = consumption[consumption.index.isin(self.account_registry.meter_ids())]
         
-        if monthly_consumption_data:
+        if not consumption.empty:
             month_summary_file = os.path.join(
                 last_month_monthly_dir,
                 f"monthly_summary_{last_month.strftime('%Y%m')}.csv"
             )
-            df_summary = pd.DataFrame(monthly_consumption_data)
+            df_summary = pd.DataFrame({
+                'meter_ID': consumption.index,
+                'month_consumption': consumption.round(3).values
+            })
             df_summary.to_csv(month_summary_file, sep=';', index=False)
     
     def _process_area_monthly_summary(self, df_combined: pd.DataFrame, accounts: Dict,
                                       process_month: datetime.datetime, monthly_dir: str):
         """Process area monthly consumption summary."""
-        area_monthly_summary = []
+        registry = self.account_registry
+        df_accounts = pd.DataFrame(list(accounts.values()), columns=['meter_ID', 'area'])
+        meter_counts = pd.Series({area: len(registry.by_area(area)) for area in registry.areas()}, dtype=np.int64)
         
-        # Get all unique areas.
-        unique_areas = set(acc['area'] for acc in accounts.values())
+        # Each meter's consumption, summed per area (areas without data are skipped).
+        consumption = self._meter_consumption(df_combined).rename('consumption')
+        per_meter = df_accounts.join(consumption, on='meter_ID', how='inner')
+        area_totals = per_meter.groupby('area')['consumption'].sum()
         
-        for area in unique_areas:
-            # Get all meters for the area.
-            area_meters = [meter_id for meter_id, acc in accounts.items() if acc['area'] == area]
-            
-            # Filter data for this area.
-            area_data = df_combined[df_combined['meter_ID'].isin(area_meters)]
-            
-            if not area_data.empty:
-                # Calculate total consumption for the area (sum of each meter's consumption).
-                area_total = 0
-                for meter_id in area_meters:
-                    meter_data = area_data[area_data['meter_ID'] == meter_id].sort_values('date_time')
-                    if not meter_data.empty:
-                        meter_consumption = meter_data['meter_value'].iloc[-1] - meter_data['meter_value'].iloc[0]
-                        area_total += meter_consumption
-                
-                area_monthly_summary.append({
-                    'area': area,
-                    'month': process_month.strftime('%Y-%m'),
-                    'total_consumption': round(area_total, 3),
-                    'meter_count': len(area_meters)
-                })
-        
-        if area_monthly_summary:
+        if not area_totals.empty:
+            df_summary = pd.DataFrame({
+                'area': area_totals.index,
+                'month': process_month.strftime('%Y-%m'),
+                'total_consumption': area_totals.round(3).values,
+                'meter_count': meter_counts.loc[area_totals.index].values
+            })
             summary_file = os.path.join(
                 monthly_dir,
                 f"area_monthly_summary_{process_month.strftime('%Y%m')}.csv"
             )
-            df_summary = pd.DataFrame(area_monthly_summary)
+            df_summary.to_csv(summary_file, sep=';', index=False)
+    
+    def _process_region_monthly_summary(self, df_combined: pd.DataFrame, accounts: Dict,
+                                        process_month: datetime.datetime, monthly_dir: str):
+        """Process region monthly consumption summary; areas not in area_data.json count as Unknown."""
+        registry = self.account_registry
+        df_areas = pd.DataFrame({
+            'area': registry.areas(),
+            'meters': [len(registry.by_area(area)) for area in registry.areas()]
+        })
+        df_areas['region'] = [self.area_catalog.region_of(area) or 'Unknown' for area in df_areas['area']]
+        meter_counts = df_areas.groupby('region')['meters'].sum()
+        area_counts = df_areas.groupby('region')['area'].size()
+        
+        df_accounts = pd.DataFrame(list(accounts.values()), columns=['meter_ID', 'area'])
+        df_accounts['region'] = df_accounts['area'].map(df_areas.set_index('area')['region'])
+        
+        consumption = self._meter_consumption(df_combined).rename('consumption')
+        per_meter = df_accounts.join(consumption, on='meter_ID', how='inner')
+        region_totals = per_meter.groupby('region')['consumption'].sum()
+        
+        if not region_totals.empty:
+            df_summary = pd.DataFrame({
+                'region': region_totals.index,
+                'month': process_month.strftime('%Y-%m'),
+                'total_consumption': region_totals.round(3).values,
+                'area_count': area_counts.loc[region_totals.index].values,
+                'meter_count': meter_counts.loc[region_totals.index].values
+            })
+            summary_file = os.path.join(
+                monthly_dir,
+                f"region_monthly_summary_{process_month.strftime('%Y%m')}.csv"
+            )
             df_summary.to_csv(summary_file, sep=';', index=False)
     
     def _process_area_analysis(self, df_combined: pd.DataFrame, accounts: Dict,
                                last_month_first: datetime.datetime, last_month: datetime.datetime,
                                last_month_monthly_dir: str):
         """Process area analysis data."""
-        daily_area_analysis = []
+        start, end = last_month_first.strftime('%Y-%m-%d'), last_month.strftime('%Y-%m-%d')
+        in_range = df_combined[(df_combined['date'] >= start) & (df_combined['date'] <= end)
+                               & df_combined['meter_ID'].isin(self.account_registry.meter_ids())]
         
-        for date in pd.date_range(start=last_month_first, end=last_month):
-            date_str = date.strftime('%Y-%m-%d')
-            daily_data = df_combined[df_combined['date'] == date_str]
-            
-            if not daily_data.empty:
-                for meter_id in accounts:
-                    meter_data = daily_data[daily_data['meter_ID'] == meter_id]
-                    if not meter_data.empty:
-                        consumption = meter_data['meter_value'].max() - meter_data['meter_value'].min()
-                        daily_area_analysis.append({
-                            'DateID': date_str,
-                            'AreaID': accounts[meter_id]['area'],
-                            'dwelling_type_id': accounts[meter_id]['dwelling'],
-                            'kwh_per_acc': round(consumption, 3)
-                        })
-        
-        if daily_area_analysis:
+        # One pass for max - min per (date, meter), ordered by date then account order.
+        daily = in_range.groupby(['date', 'meter_ID'])['meter_value'].agg(['max', 'min']).reset_index()
+        df_accounts = pd.DataFrame(list(accounts.values()), columns=['meter_ID', 'area', 'dwelling'])
+        df_accounts = df_accounts.set_index('meter_ID')
+        daily['order'] = daily['meter_ID'].map(pd.Series(np.arange(len(df_accounts)), index=df_accounts.index))
+        daily = daily.sort_values(['date', 'order'], kind='stable')
+        
+        if not daily.empty:
+            df_area = pd.DataFrame({
+                'DateID': daily['date'].values,
+                'AreaID': daily['meter_ID'].map(df_accounts['area']).values,
+                'dwelling_type_id': daily['meter_ID'].map(df_accounts['dwelling']).values,
+                'kwh_per_acc': (daily['max'] - daily['min']).round(3).values
+            })
             area_analysis_file = os.path.join(
                 last_month_monthly_dir,
                 f"area_analysis_{last_month.strftime('%Y%m')}.csv"
             )
-            df_area = pd.DataFrame(daily_area_analysis)
             df_area.to_csv(area_analysis_file, sep=';', index=False)
     
+    @METRICS.timed("cleanup")
     def _cleanup_old_readings(self, last_month_first: datetime.datetime):
-        """Delete daily readings older than 2 months to save storage space."""
+        """Move daily readings older than 2 months to the cold archive to save storage space."""
         if os.path.exists(self.daily_readings_dir):
-            for year_month_dir in os.listdir(self.daily_readings_dir):
+            # Oldest first: a month's archive starts from the last values of the one before.
+            for year_month_dir in sorted(os.listdir(self.daily_readings_dir)):
                 try:
                     year = int(year_month_dir[:4])
                     month = int(year_month_dir[4:])
@@ -451,42 +1006,301 @@ class SmartMeterSystem:
                     # 仅删除 2 个月前的数据
                     if dir_date < last_month_first:
                         dir_path = os.path.join(self.daily_readings_dir, year_month_dir)
+                        # An archive written before an interruption is complete; the
+                        # directory may not be any more.
+                        if not self.cold_archive.has_month(dir_date.date()):
+                            self.cold_archive.pack(dir_date.date(), list_daily_files(dir_path))
                         shutil.rmtree(dir_path)
                 except ValueError:
                     continue
+        self.monthly_aggregates.drop_before(last_month_first)
+        self.usage_index.drop_before(last_month_first.date())
+        # Rollups outlive the raw readings, each tier by its own retention.
+        self.rollups.prune((last_month_first + datetime.timedelta(days=32)).date().replace(day=1))
+    
+    @_reading
+    def meter_exists(self, meter_id: str) -> bool:
+        """Check whether a meter is registered."""
+        return self.usage_index.has_meter(meter_id)
+    
+    @_reading
+    def query_usage(self, meter_id: str, time_range: str, date: Optional[datetime.date] = None) -> dict:
+        """Get the usage series of a meter for a time range.
+        
+        The day and month ranges are those of date, read from the daily files
+        or, once the month has expired, from the cold archive.
+        """
+        if not self.meter_exists(meter_id):
+            raise ValueError("Meter ID not found")
+        if time_range not in HISTORY_RANGES:
+            if time_range not in TIME_RANGES:
+                raise ValueError(f"Invalid time range, expected one of: {', '.join(TIME_RANGES + HISTORY_RANGES)}")
+            return self.usage_index.query(meter_id, time_range, self.get_current_time())
+        if date is None:
+            raise ValueError(f"A date is required for the {time_range} range")
+        series = self._day_usage(meter_id, date) if time_range == "day" else self._month_usage(meter_id, date)
+        series.update({
+            "meter_id": meter_id,
+            "time_range": time_range,
+            "total": round(sum(series["usage"]), 3)
+        })
+        return series
+    
+    def _meter_day(self, meter_id: str, date: datetime.date) -> Optional[Tuple[np.ndarray, np.ndarray, float]]:
+        """(minute of the day, value) of a meter's readings on date and its value before, NaN if not known."""
+        month_dir = os.path.join(self.daily_readings_dir, date.strftime("%Y%m"))
+        for daily_path in list_daily_files(month_dir):
+            if os.path.basename(daily_path)[9:17] == date.strftime("%Y%m%d"):
+                readings = read_daily_file(daily_path)
+                rows = readings.meter_slice(meter_id)
+                if rows is None:
+                    return None
+                return np.asarray(readings.minutes[rows], dtype=np.int64), np.asarray(readings.values[rows]), np.nan
+        history = self.cold_archive.meter_history(date.replace(day=1), meter_id)
+        if history is None:
+            return None
+        return history.day(date) + (history.value_before(date),)
+    
+    def _day_usage(self, meter_id: str, date: datetime.date) -> dict:
+        """Usage of a meter at every reading of a day."""
+        day = self._meter_day(meter_id, date)
+        if day is None or not len(day[1]):
+            return {"dates": [], "usage": []}
+        minutes, values, before = day
+        if np.isnan(before):
+            previous = self._meter_day(meter_id, date - datetime.timedelta(days=1))
+            # New meters count from their first reading, like the usage index.
+            before = previous[1][-1] if previous is not None and len(previous[1]) else values[0]
+        return {
+            "dates": [f"{date.isoformat()} {m // 60:02d}:{m % 60:02d}" for m in minutes.tolist()],
+            "usage": np.round(np.diff(values, prepend=before), 3).tolist()
+        }
+    
+    def _month_usage(self, meter_id: str, date: datetime.date) -> dict:
+        """Daily usage of a meter over the month of date, or its total if only that is kept."""
+        month = date.replace(day=1)
+        days = calendar.monthrange(month.year, month.month)[1]
+        history = self.cold_archive.meter_history(month, meter_id)
+        if history is None:
+            series = self.usage_index.daily_series(meter_id, (month.replace(day=d) for d in range(1, days + 1)))
+            total = self.usage_index.month_total(meter_id, month.strftime("%Y-%m"))
+            if not series["dates"] and total is not None:
+                series = {"dates": [month.strftime("%Y-%m")], "usage": [total]}
+            return series
+        day_of = history.minutes // 1440
+        ends = np.flatnonzero(np.diff(day_of, append=days)) if len(day_of) else np.zeros(0, dtype=np.int64)
+        last = history.values[ends]
+        before = history.previous if not np.isnan(history.previous) else (history.values[0] if len(last) else 0)
+        return {
+            "dates": [month.replace(day=int(d) + 1).isoformat() for d in day_of[ends].tolist()],
+            "usage": np.round(np.diff(last, prepend=before), 3).tolist()
+        }
     
+    @_reading
+    def query_rollups(self, tier: str, start: datetime.date, end: datetime.date,
+                      meter_id: Optional[str] = None, group_by: Optional[str] = None) -> dict:
+        """Usage of a meter, or totals per area/dwelling, from a rollup tier."""
+        if group_by is None and not self.meter_exists(meter_id):
+            raise ValueError("Meter ID not found")
+        if start > end:
+            raise ValueError("start must not be after end")
+        return self.rollups.query(tier, start, end, meter_id=meter_id, group_by=group_by)
+    
+    @_reading
+    def query_analytics(self, start: datetime.date, end: datetime.date, by: List[str],
+                        filters: Optional[Dict[str, str]] = None) -> dict:
+        """Daily kWh per account from the analytics cube, sliced and grouped by DIMENSIONS."""
+        if start > end:
+            raise ValueError("start must not be after end")
+        return self.rollups.cube.query(start, end, by, filters, region_of=self.area_catalog.region_of)
+    
+    @_reading
+    def query_alerts(self, start: datetime.date, end: datetime.date, kind: Optional[str] = None,
+                     meter_id: Optional[str] = None) -> dict:
+        """Anomalies flagged on the days of start..end."""
+        if meter_id is not None and not self.meter_exists(meter_id):
+            raise ValueError("Meter ID not found")
+        if start > end:
+            raise ValueError("start must not be after end")
+        return self.anomalies.query(start, end, kind=kind, meter_id=meter_id)
+    
+    @_writing
     def reset_system(self):
         """Reset the entire system to its initial state, clearing all readings and accounts."""
         try:
             # 清空 `daily_readings` 和 `monthly_readings` 目录
-            for directory in [self.daily_readings_dir, self.monthly_readings_dir]:
+            for directory in [self.daily_readings_dir, self.monthly_readings_dir, self.rollup_dir, self.alert_dir,
+                              self.cold_archive.cold_dir]:
                 if os.path.exists(directory):
                     shutil.rmtree(directory)
                 os.makedirs(directory)
 
             # 重置账户文件
-            with open(self.accounts_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
+            self.account_registry.clear()
 
             # 重新设定时间
+            self.state.reset()
             self.save_current_time(datetime.datetime(2024, 5, 1))
 
             # 清空缓存
-            self.latest_readings.clear()
-            self.daily_cache.clear()
+            if self.generator is not None:
+                self.generator.close()
+            self.reading_store.reset()
+            self.monthly_aggregates.clear()
+            self.usage_index.clear()
+            self.rollups.clear_cache()
+            self.anomalies.clear()
+            self.cold_archive.clear_cache()
 
             return True
         except Exception as e:
             print(f"Reset failed: {str(e)}")
             return False
 
+    def close(self):
+        """Release the generator's worker processes, the sinks and the write-ahead log."""
+        if self.generator is not None:
+            self.generator.close()
+        for sink in self.sinks:
+            sink.close()
+        self.state.close()
+
 
 # Flask application setup
 app = Flask(__name__, 
     template_folder='templates',  # Specify the templates directory
     static_folder='static'         # Specify the static files directory
 )
-meter_system = SmartMeterSystem(os.path.dirname(os.path.abspath(__file__)))
+# Built on first use, so importing this module (tests, manage.py) opens no data directory.
+_meter_system: Optional[SmartMeterSystem] = None
+_job_manager: Optional[JobManager] = None
+_startup_lock = threading.Lock()
+
+def get_meter_system() -> SmartMeterSystem:
+    """The system the routes serve, configured from the METER_* environment.
+    
+    METER_BASE_DIR selects the directory holding data/ and static/ (default:
+    next to this file).
+    """
+    global _meter_system
+    if _meter_system is None:
+        with _startup_lock:
+            if _meter_system is None:
+                system = SmartMeterSystem(
+                    os.environ.get("METER_BASE_DIR") or os.path.dirname(os.path.abspath(__file__)),
+                    seed=int(os.environ["METER_SEED"]) if os.environ.get("METER_SEED") else None,
+                    storage_format=os.environ.get("METER_STORAGE_FORMAT", "json"),
+                    workers=int(os.environ.get("METER_WORKERS", "1")),
+                    export=os.environ.get("METER_EXPORT"),
+                    sync_interval=float(os.environ.get("METER_SYNC_INTERVAL", "0.05")),
+                    consumption_model=os.environ.get("METER_MODEL", "uniform"),
+                    cache_entries=int(os.environ.get("METER_CACHE_ENTRIES", "1024"))
+                )
+                atexit.register(system.close)
+                _meter_system = system
+    return _meter_system
+
+def get_job_manager() -> JobManager:
+    """The background jobs of the served system, kept under its data directory."""
+    global _job_manager
+    if _job_manager is None:
+        data_dir = get_meter_system().data_dir
+        with _startup_lock:
+            if _job_manager is None:
+                _job_manager = JobManager(os.path.join(data_dir, "jobs"))
+    return _job_manager
+
+def set_meter_system(system: Optional[SmartMeterSystem]):
+    """Serve another system (None: build the configured one again on next use)."""
+    global _meter_system, _job_manager
+    with _startup_lock:
+        _meter_system, _job_manager = system, None
+
+def _served(read: Callable[[SmartMeterSystem], float]) -> Callable[[], float]:
+    """A gauge reading the served system; left out of /metrics until one is built."""
+    def gauge() -> float:
+        system = _meter_system
+        if system is None:
+            raise LookupError("No system is served yet")
+        return read(system)
+    return gauge
+
+# Registered once for the process, whichever system set_meter_system() installs.
+METRICS.gauge("buffered_readings", _served(lambda system: len(system.reading_store)),
+              "Readings buffered for the current day.")
+METRICS.gauge("reading_store_bytes", _served(lambda system: system.reading_store.memory_footprint()["total_bytes"]),
+              "Memory of the reading buffer, latest values and meter index.")
+METRICS.gauge("registered_meters", _served(lambda system: len(system.account_registry)), "Registered meters.")
+METRICS.gauge("usage_index_days", _served(lambda system: len(system.usage_index.dates)), "Days held by the usage index.")
+METRICS.gauge("aggregate_months_cached", _served(lambda system: system.monthly_aggregates.cached_months()),
+              "Running monthly aggregates held in memory.")
+METRICS.gauge("cube_months_cached", _served(lambda system: system.rollups.cube.cached_months()),
+              "Analytics cube months held in memory.")
+METRICS.gauge("result_cache_entries", _served(lambda system: len(system.response_cache)), "Cached read endpoint responses.")
+METRICS.gauge("result_cache_bytes", _served(lambda system: system.response_cache.size), "Size of the cached responses.")
+
+# Spans and counters are on unless METER_METRICS=0; METER_PROFILING=1 lets a
+# request ask for a profile of itself with ?profile=cprofile or ?profile=sample.
+METRICS.enabled = os.environ.get("METER_METRICS", "1") != "0"
+PROFILING_ENABLED = os.environ.get("METER_PROFILING") == "1"
+
+@app.before_request
+def start_request_instrumentation():
+    if METRICS.enabled:
+        g.request_started = time.perf_counter()
+    kind = request.args.get("profile")
+    if kind and PROFILING_ENABLED:
+        try:
+            g.profiler = make_profiler(kind)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+@app.after_request
+def finish_request_instrumentation(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        # The profile replaces the body; the status is kept.
+        response = Response(profiler.stop(), status=response.status_code, mimetype="text/plain")
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.endpoint or "unknown"
+        METRICS.observe("http_request_seconds", time.perf_counter() - started, (("endpoint", endpoint),))
+        METRICS.count("http_requests_total", endpoint=endpoint, status=str(response.status_code))
+    return response
+
+def cached_response(view):
+    """Serve a read endpoint from the system's response_cache.
+
+    Responses are keyed by the endpoint and its query parameters, and are
+    only reused while the state version they were computed at is current;
+    registering, collecting and resetting move the version on. Server errors
+    and profiled requests are not cached.
+    """
+    @functools.wraps(view)
+    def cached(**kwargs):
+        if g.get("profiler") is not None:
+            return view(**kwargs)
+        key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+        system = get_meter_system()
+        cache = system.response_cache
+        with system.lock.read():
+            version = system.lock.version
+            entry = cache.get(key, version)
+            if entry is None:
+                response = app.make_response(view(**kwargs))
+                if response.status_code >= 500:
+                    return response
+                entry = (response.get_data(), response.status_code, response.mimetype)
+                cache.put(key, version, entry, len(entry[0]))
+        body, status, mimetype = entry
+        return app.response_class(body, status=status, mimetype=mimetype)
+    return cached
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text exposition of spans, counters and cache sizes."""
+    get_meter_system()
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def index():
@@ -498,6 +1312,11 @@ def collect():
     """Render the collection page."""
     return render_template('collect.html')
 
+@app.route('/query')
+def query():
+    """Render the usage query page."""
+    return render_template('query.html')
+
 @app.route("/register", methods=["GET", "POST"])
 def register():
     # GET request: Display the registration page.
@@ -507,7 +1326,7 @@ def register():
     # POST request: Process the registration logic.
     try:
         data = request.get_json()
-        account = meter_system.register_meter(
+        account = get_meter_system().register_meter(
             data["meterId"],
             data["area"],
             data["dwelling"]
@@ -516,9 +1335,29 @@ def register():
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 400
 
+@app.route("/register/bulk", methods=["POST"])
+def register_bulk():
+    """Register many meters from a JSON array or an NDJSON stream."""
+    try:
+        if request.mimetype in ("application/x-ndjson", "application/ndjson"):
+            records = [
+                json.loads(line) for line in request.stream.read().decode("utf-8").splitlines() if line.strip()
+            ]
+        else:
+            records = request.get_json()
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            return jsonify({"success": False, "message": "Expected a list of meter records"}), 400
+        accounts = get_meter_system().register_meters_bulk(records)
+        return jsonify({"success": True, "registered": len(accounts)})
+    except BulkRegistrationError as e:
+        return jsonify({"success": False, "message": str(e), "errors": e.errors[:100]}), 400
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
 @app.route("/current_time", methods=["GET"])
+@cached_response
 def get_current_time():
-    current_time = meter_system.get_current_time()
+    current_time = get_meter_system().get_current_time()
     return jsonify({
         "Current Simulation Time": {
             "Date": current_time.strftime("%Y-%m-%d"),
@@ -539,37 +1378,147 @@ def meter_reading():
             value = int(data.get('value', 1))
         except (TypeError, ValueError):
             return jsonify({"error": "Invalid value format"}), 400
+        fast_forward = bool(data.get('fast_forward', False))
             
-        result = meter_system.collect_readings(unit, value)
+        result = get_meter_system().collect_readings(unit, value, fast_forward=fast_forward)
         return jsonify(result), 200
         
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
-        import traceback
-        print("Error in meter_reading:", str(e))
-        print(traceback.format_exc())
+        app.logger.exception("Error in meter_reading")
         return jsonify({
             "error": "Internal server error",
             "message": str(e)
         }), 500
 
+@app.route("/jobs/collect", methods=["POST"])
+def start_collection_job():
+    """Start collecting readings in the background and return the job ID."""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    unit = data.get('unit', 'days')
+    try:
+        value = int(data.get('value', 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid value format"}), 400
+    fast_forward = bool(data.get('fast_forward', False))
+    system = get_meter_system()
+    try:
+        system.check_collection(unit, value)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    job = get_job_manager().submit(
+        "collect_readings",
+        {"unit": unit, "value": value, "fast_forward": fast_forward},
+        lambda report_progress: system.collect_readings(
+            unit, value, on_progress=report_progress, fast_forward=fast_forward
+        )
+    )
+    return jsonify({"job_id": job.job_id, "status": job.status, "status_url": f"/jobs/{job.job_id}"}), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Get the status and progress of a background job."""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/validate_meter", methods=["POST"])
+def validate_meter():
+    """Check that a meter ID is registered."""
+    data = request.get_json(silent=True) or {}
+    meter_id = data.get("meterId", "")
+    if not get_meter_system().meter_exists(meter_id):
+        return jsonify({"valid": False, "message": "Meter ID not found"}), 404
+    return jsonify({"valid": True, "meterId": meter_id})
+
+@app.route("/query_usage", methods=["GET"])
+@cached_response
+def query_usage():
+    """Get the usage of a meter for a time range."""
+    meter_id = request.args.get("meter_id", "")
+    time_range = request.args.get("time_range", "today")
+    try:
+        date = datetime.date.fromisoformat(request.args["date"]) if "date" in request.args else None
+    except ValueError:
+        return jsonify({"error": "date must be a date (YYYY-MM-DD)"}), 400
+    try:
+        return jsonify(get_meter_system().query_usage(meter_id, time_range, date=date))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/rollups", methods=["GET"])
+@cached_response
+def query_rollups():
+    """Get hourly/daily/monthly usage of a meter, or per area or dwelling type."""
+    try:
+        start = datetime.date.fromisoformat(request.args.get("start", ""))
+        end = datetime.date.fromisoformat(request.args.get("end", ""))
+    except ValueError:
+        return jsonify({"error": "start and end must be dates (YYYY-MM-DD)"}), 400
+    try:
+        return jsonify(get_meter_system().query_rollups(
+            request.args.get("tier", "daily"), start, end,
+            meter_id=request.args.get("meter_id"), group_by=request.args.get("group_by")
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/analytics", methods=["GET"])
+@cached_response
+def query_analytics():
+    """Count/sum/avg/min/max/percentiles of daily kWh per account, by date, month, region, area or dwelling."""
+    try:
+        start = datetime.date.fromisoformat(request.args.get("start", ""))
+        end = datetime.date.fromisoformat(request.args.get("end", ""))
+    except ValueError:
+        return jsonify({"error": "start and end must be dates (YYYY-MM-DD)"}), 400
+    by = [name.strip() for name in request.args.get("by", "").split(",") if name.strip()]
+    filters = {name: request.args[name] for name in DIMENSIONS if name in request.args}
+    try:
+        return jsonify(get_meter_system().query_analytics(start, end, by, filters))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/alerts", methods=["GET"])
+@cached_response
+def query_alerts():
+    """Zero-consumption streaks, spikes and peer outliers flagged between start and end."""
+    try:
+        start = datetime.date.fromisoformat(request.args.get("start", ""))
+        end = datetime.date.fromisoformat(request.args.get("end", ""))
+    except ValueError:
+        return jsonify({"error": "start and end must be dates (YYYY-MM-DD)"}), 400
+    try:
+        return jsonify(get_meter_system().query_alerts(
+            start, end, kind=request.args.get("kind"), meter_id=request.args.get("meter_id")
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
 @app.route("/api/areas", methods=["GET"])
 def get_areas():
-    """Get area data from a JSON file."""
-    area_data_file = os.path.join(app.static_folder, 'js', 'area_data.json')
+    """Get area data, revalidated by ETag or Last-Modified."""
     try:
-        with open(area_data_file, 'r', encoding='utf-8') as f:
-            return jsonify(json.load(f))
+        body, etag, last_modified = get_meter_system().area_catalog.payload()
     except FileNotFoundError:
         return jsonify({"error": "Area data file not found"}), 404
-    except json.JSONDecodeError:
+    except ValueError:
         return jsonify({"error": "Invalid area data format"}), 500
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/reset')
 def reset():
     """Reset the system."""
-    if meter_system.reset_system():
+    if get_meter_system().reset_system():
         return """
         <script>
             alert('Reset Success!');
@@ -0,0 +1,94 @@
+import datetime
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from durability import file_stamp
+
+
+@dataclass(frozen=True)
+class Area:
+    """One entry of area_data.json."""
+    area_id: str
+    name: str
+    region: str
+
+
+class AreaCatalog:
+    """area_data.json, parsed once and reloaded when the file changes.
+
+    Areas are indexed by areaId, name and region. The file's JSON is kept
+    pre-encoded with an ETag and Last-Modified time, so /api/areas can be
+    served and revalidated without touching the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self.by_id: Dict[str, Area] = {}
+        self.by_name: Dict[str, Area] = {}
+        self.by_region: Dict[str, List[Area]] = {}
+        self.body = b""
+        self.etag = ""
+        self.last_modified: Optional[datetime.datetime] = None
+
+    def _reload_if_changed(self):
+        """Reload if the file was modified since it was last read.
+
+        Raises FileNotFoundError if the file is missing and ValueError if it
+        is not valid area data.
+        """
+        stamp = file_stamp(self.path)
+        if stamp is None:
+            raise FileNotFoundError(f"Area data file not found: {self.path}")
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._load(stamp)
+
+    def _load(self, stamp):
+        with open(self.path, "rb") as f:
+            body = f.read()
+        data = json.loads(body)
+        if not isinstance(data, dict) or not isinstance(data.get("areas"), list):
+            raise ValueError("Invalid area data format")
+        by_id, by_name, by_region = {}, {}, {}
+        for item in data["areas"]:
+            try:
+                area = Area(str(item["areaId"]), item["area"], item.get("region", ""))
+            except (KeyError, TypeError, AttributeError):
+                raise ValueError("Invalid area data format")
+            by_id[area.area_id] = area
+            by_name[area.name] = area
+            by_region.setdefault(area.region, []).append(area)
+        self.by_id, self.by_name, self.by_region = by_id, by_name, by_region
+        self.body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.last_modified = datetime.datetime.fromtimestamp(stamp[1] / 1e9, datetime.timezone.utc)
+        self._stamp = stamp
+
+    def payload(self) -> Tuple[bytes, str, datetime.datetime]:
+        """The encoded area data with its ETag and Last-Modified time."""
+        self._reload_if_changed()
+        with self._lock:
+            return self.body, self.etag, self.last_modified
+
+    def lookup(self, key: str) -> Optional[Area]:
+        """The area with this areaId or name."""
+        self._reload_if_changed()
+        return self.by_id.get(key) or self.by_name.get(key)
+
+    def names(self) -> set:
+        self._reload_if_changed()
+        return set(self.by_name)
+
+    def regions(self) -> List[str]:
+        self._reload_if_changed()
+        return sorted(self.by_region)
+
+    def region_of(self, key: str) -> Optional[str]:
+        area = self.lookup(key)
+        return area.region if area else None
@@ -0,0 +1,569 @@
+import argparse
+import calendar
+import datetime
+import functools
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from consumption import CONSUMPTION_MODELS, SLOT_MINUTES, SLOTS_PER_DAY
+from storage import DAILY_STORAGES, DailyReadings
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def synthetic_day(meters: int, seed: int = 0) -> DailyReadings:
+    """One day of half-hourly readings for a synthetic fleet."""
+    rng = np.random.RandomState(seed)
+    minutes = SLOT_MINUTES.astype(np.int16)
+    values = rng.uniform(0, 1000, size=meters)[:, None] + np.cumsum(rng.uniform(0, 1, size=(meters, SLOTS_PER_DAY)), axis=1)
+    return DailyReadings(
+        date=datetime.date(2024, 6, 1),
+        meter_ids=[f"{i // 1000000:03d}-{i // 1000 % 1000:03d}-{i % 1000:03d}" for i in range(meters)],
+        starts=np.arange(0, meters * SLOTS_PER_DAY + 1, SLOTS_PER_DAY, dtype=np.int64),
+        minutes=np.tile(minutes, meters),
+        values=values.ravel()
+    )
+
+
+def bench_storage(args) -> dict:
+    """Compare write/read time and size of the daily storage formats."""
+    readings = synthetic_day(args.meters)
+    work_dir = tempfile.mkdtemp(prefix="meter_bench_")
+    results = {}
+    try:
+        for name, storage in sorted(DAILY_STORAGES.items()):
+            path = os.path.join(work_dir, f"readings_20240601{storage.extension}")
+            start = time.perf_counter()
+            storage.write_day(path, readings)
+            write_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded = storage.read_day(path)
+            open_seconds = time.perf_counter() - start
+            # Touch every column so lazily mapped formats pay for the data too.
+            float(loaded.last_values().sum())
+            read_seconds = time.perf_counter() - start
+
+            size = os.path.getsize(path)
+            results[name] = {
+                "write_seconds": round(write_seconds, 4),
+                "open_seconds": round(open_seconds, 4),
+                "read_seconds": round(read_seconds, 4),
+                "bytes": size,
+                "bytes_per_reading": round(size / len(readings), 2)
+            }
+    finally:
+        shutil.rmtree(work_dir)
+    return {"meters": args.meters, "readings": len(readings), "formats": results}
+
+
+def _percentile_ms(latencies, q) -> float:
+    return round(1000 * float(np.percentile(latencies, q)), 3) if latencies else 0.0
+
+
+def _load_reader(base_dir: str, meter_ids, start_at: float, duration: float) -> dict:
+    """Worker process issuing usage queries and clock reads until the deadline."""
+    from app import SmartMeterSystem
+
+    system = SmartMeterSystem(base_dir)
+    rng = random.Random(os.getpid())
+    latencies = []
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if rng.random() < 0.2:
+            system.get_current_time()
+        else:
+            system.query_usage(rng.choice(meter_ids), rng.choice(("today", "last_7_days", "this_month")))
+        latencies.append(time.perf_counter() - start)
+    return {"reads": len(latencies), "p50_ms": _percentile_ms(latencies, 50), "p99_ms": _percentile_ms(latencies, 99)}
+
+
+def _load_writer(base_dir: str, writer: int, start_at: float, duration: float) -> dict:
+    """Worker process registering a meter and collecting one hour per tick."""
+    from app import SmartMeterSystem
+
+    system = SmartMeterSystem(base_dir)
+    registered = ticks = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        system.register_meter(f"9{writer:02d}-{registered // 1000:03d}-{registered % 1000:03d}", "Bishan", "3")
+        registered += 1
+        system.collect_readings("hours", 1)
+        ticks += 1
+    return {"registered": registered, "ticks": ticks}
+
+
+def _check_consistency(base_dir: str, expected_meters: int, expected_time: datetime.datetime) -> dict:
+    """Reload the data directory and check it against what the writers reported."""
+    from app import SmartMeterSystem
+    from storage import list_daily_files, read_daily_file
+
+    system = SmartMeterSystem(base_dir)
+    current_time = system.get_current_time()
+    duplicate_readings = 0
+    for month in sorted(os.listdir(system.daily_readings_dir)):
+        for path in list_daily_files(os.path.join(system.daily_readings_dir, month)):
+            readings = read_daily_file(path)
+            keys = readings.meter_index().astype(np.int64) * 1440 + readings.minutes
+            duplicate_readings += len(keys) - len(np.unique(keys))
+    return {
+        "accounts": len(system.load_accounts()),
+        "expected_accounts": expected_meters,
+        "current_time": current_time.isoformat(),
+        "expected_time": expected_time.isoformat(),
+        "duplicate_readings": duplicate_readings,
+        "aggregate_mismatches": len(system.verify_monthly_aggregates(current_time)),
+        "consistent": (len(system.load_accounts()) == expected_meters and current_time == expected_time
+                       and not duplicate_readings and not system.verify_monthly_aggregates(current_time))
+    }
+
+
+def bench_loadtest(args) -> dict:
+    """Concurrent reader and writer processes sharing one data directory."""
+    from app import SmartMeterSystem
+
+    rounds = []
+    for readers in (int(n) for n in args.readers.split(",")):
+        base_dir = tempfile.mkdtemp(prefix="meter_load_")
+        try:
+            os.makedirs(os.path.join(base_dir, "static", "js"))
+            shutil.copy(os.path.join(BASE_DIR, "static", "js", "area_data.json"),
+                        os.path.join(base_dir, "static", "js", "area_data.json"))
+            system = SmartMeterSystem(base_dir, seed=0)
+            meter_ids = [f"{i // 1000:03d}-{i % 1000:03d}-000" for i in range(args.meters)]
+            system.register_meters_bulk([{"meterId": m, "area": "Bishan", "dwelling": "3"} for m in meter_ids])
+            system.collect_readings("days", 3)
+            start_time = system.get_current_time()
+
+            start_at = time.time() + 1.0
+            with ProcessPoolExecutor(max_workers=readers + args.writers) as pool:
+                reader_jobs = [pool.submit(_load_reader, base_dir, meter_ids, start_at, args.duration)
+                               for _ in range(readers)]
+                writer_jobs = [pool.submit(_load_writer, base_dir, w, start_at, args.duration)
+                               for w in range(args.writers)]
+                reader_results = [job.result() for job in reader_jobs]
+                writer_results = [job.result() for job in writer_jobs]
+
+            reads = sum(r["reads"] for r in reader_results)
+            ticks = sum(w["ticks"] for w in writer_results)
+            registered = sum(w["registered"] for w in writer_results)
+            rounds.append({
+                "readers": readers,
+                "writers": args.writers,
+                "reads_per_second": round(reads / args.duration, 1),
+                "reader_p50_ms": max(r["p50_ms"] for r in reader_results),
+                "reader_p99_ms": max(r["p99_ms"] for r in reader_results),
+                "writes_per_second": round(ticks / args.duration, 1),
+                "check": _check_consistency(
+                    base_dir, args.meters + registered, start_time + datetime.timedelta(hours=ticks)
+                )
+            })
+        finally:
+            shutil.rmtree(base_dir)
+    return {"meters": args.meters, "duration_seconds": args.duration, "cpus": os.cpu_count(), "rounds": rounds}
+
+
+# Advances run one after another from 2024-05-01, so the quarter crosses the
+# month starts that archive May and June. The fast-forwarded year only
+# summarizes the months the cleanup would delete by its end.
+ADVANCES = {
+    "day": ("days", 1, False), "month": ("months", 1, False), "quarter": ("months", 3, False),
+    "year_fast_forward": ("months", 12, True)
+}
+
+
+class StageTimer:
+    """Wall time and call count per stage, collected by wrapping methods of one system."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def _add(self, stage: str, seconds: float):
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+
+    def wrap(self, owner, name: str, stage: str):
+        method = getattr(owner, name)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._add(stage, time.perf_counter() - start)
+        setattr(owner, name, timed)
+
+    def wrap_generator(self, owner, name: str, stage: str):
+        """Time a generator method, counting only the time spent producing its items (one call each)."""
+        method = getattr(owner, name)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            items = method(*args, **kwargs)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    self.seconds[stage] += time.perf_counter() - start
+                    return
+                self._add(stage, time.perf_counter() - start)
+                yield item
+        setattr(owner, name, timed)
+
+    def take(self) -> dict:
+        """Stage timings since the last call."""
+        stages = {stage: {"seconds": round(seconds, 4), "calls": self.calls[stage]}
+                  for stage, seconds in sorted(self.seconds.items())}
+        self.seconds.clear()
+        self.calls.clear()
+        return stages
+
+
+def _instrument(system) -> StageTimer:
+    """Time the collection, fast-forward, flush, archiving and report stages of a system.
+
+    Stages nest: archive includes reports and cleanup, which includes cold_pack.
+    """
+    timer = StageTimer()
+    timer.wrap_generator(system, "_generate_blocks", "generate")
+    timer.wrap(system, "_fast_forward_month", "fast_forward")
+    for sink in system.sinks:
+        callback = getattr(sink, "_on_day", None)
+        name = callback.__qualname__ if callback is not None else type(sink).__name__
+        timer.wrap(sink, "on_day", f"flush:{name}")
+        callback = getattr(sink, "_on_fast_forward", None)
+        if callback is not None:
+            timer.wrap(sink, "on_fast_forward", f"summarize:{callback.__qualname__}")
+    timer.wrap(system, "_archive_and_prepare_monthly_data", "archive")
+    timer.wrap(system, "_build_monthly_reports", "reports")
+    timer.wrap(system, "_cleanup_old_readings", "cleanup")
+    timer.wrap(system.cold_archive, "pack", "cold_pack")
+    timer.wrap(system.state, "log", "wal_log")
+    timer.wrap(system.state, "checkpoint", "checkpoint")
+    return timer
+
+
+def _tree(directory: str) -> dict:
+    """(mtime, size) of every file below a directory."""
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _write_syscall_bytes() -> int:
+    """Bytes this process passed to write calls so far (Linux only, else None)."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _time_queries(system, meter_ids, rng: random.Random, queries: int) -> dict:
+    """Latency of usage, rollup and analytics queries against the current state."""
+    current = system.get_current_time().date()
+    month_start = current.replace(day=1)
+    kinds = {
+        "usage": lambda: system.query_usage(rng.choice(meter_ids), rng.choice(("today", "last_7_days", "this_month"))),
+        "rollups_by_area": lambda: system.query_rollups("daily", month_start, current, group_by="area"),
+        "analytics_region_dwelling": lambda: system.query_analytics(
+            datetime.date(2024, 5, 1), current, ["region", "dwelling"]
+        ),
+    }
+    results = {}
+    for kind, query in kinds.items():
+        latencies = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            query()
+            latencies.append(time.perf_counter() - start)
+        results[kind] = {"p50_ms": _percentile_ms(latencies, 50), "p99_ms": _percentile_ms(latencies, 99)}
+    return results
+
+
+def _cold_archive_stats(system, meter_ids, rng: random.Random, queries: int) -> dict:
+    """Compression of every cold month and the latency of random historical lookups."""
+    archive = system.cold_archive
+    months = archive.months()
+    result = {"months": []}
+    for month in months:
+        stats = archive.stats(month)
+        stats["month"] = month.strftime("%Y-%m")
+        stats["compression_ratio"] = round(stats["source_bytes"] / stats["archive_bytes"], 2)
+        result["months"].append(stats)
+    if not months:
+        return result
+    archive.clear_cache()
+    start = time.perf_counter()
+    archive.meter_history(months[0], meter_ids[0])
+    result["first_lookup_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    def random_day() -> datetime.date:
+        month = rng.choice(months)
+        return month + datetime.timedelta(days=rng.randrange(calendar.monthrange(month.year, month.month)[1]))
+
+    kinds = {
+        "meter_history": lambda: archive.meter_history(rng.choice(months), rng.choice(meter_ids)),
+        "usage_day": lambda: system.query_usage(rng.choice(meter_ids), "day", random_day()),
+        "usage_month": lambda: system.query_usage(rng.choice(meter_ids), "month", rng.choice(months)),
+    }
+    for kind, query in kinds.items():
+        latencies = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            query()
+            latencies.append(time.perf_counter() - start)
+        result[kind] = {"p50_ms": _percentile_ms(latencies, 50), "p99_ms": _percentile_ms(latencies, 99)}
+    return result
+
+
+def _new_base_dir(prefix: str) -> str:
+    """A temporary base directory with a copy of the area data."""
+    base_dir = tempfile.mkdtemp(prefix=prefix)
+    area_file = os.path.join(base_dir, "static", "js", "area_data.json")
+    os.makedirs(os.path.dirname(area_file))
+    shutil.copy(os.path.join(BASE_DIR, "static", "js", "area_data.json"), area_file)
+    return base_dir
+
+
+def _register_fleet(system, meters: int) -> list:
+    """Register meters spread over every area and dwelling type; returns their IDs."""
+    from app import DWELLING_TYPES
+
+    areas = sorted(system.area_catalog.names())
+    dwellings = sorted(DWELLING_TYPES)
+    meter_ids = [f"{i // 1000000:03d}-{i // 1000 % 1000:03d}-{i % 1000:03d}" for i in range(meters)]
+    system.register_meters_bulk([
+        {"meterId": meter_id, "area": areas[i % len(areas)], "dwelling": dwellings[i % len(dwellings)]}
+        for i, meter_id in enumerate(meter_ids)
+    ])
+    return meter_ids
+
+
+def _suite_fleet(meters: int, advances, seed: int, storage_format: str, workers: int, queries: int,
+                 model: str = "uniform") -> dict:
+    """Run every advance for one fleet; called in a fresh process so peak RSS is per fleet."""
+    from app import SmartMeterSystem
+
+    base_dir = _new_base_dir("meter_suite_")
+    try:
+        system = SmartMeterSystem(base_dir, seed=seed, storage_format=storage_format, workers=workers,
+                                  consumption_model=model)
+        start = time.perf_counter()
+        meter_ids = _register_fleet(system, meters)
+        result = {"meters": meters, "register_seconds": round(time.perf_counter() - start, 4), "advances": []}
+
+        timer = _instrument(system)
+        rng = random.Random(seed)
+        for advance in advances:
+            unit, value, fast_forward = ADVANCES[advance]
+            before, written_before = _tree(system.data_dir), _write_syscall_bytes()
+            start_time = system.get_current_time()
+            start = time.perf_counter()
+            collected = system.collect_readings(unit, value, fast_forward=fast_forward)
+            seconds = time.perf_counter() - start
+            stages = timer.take()
+            after, written_after = _tree(system.data_dir), _write_syscall_bytes()
+            changed = [path for path, stamp in after.items() if before.get(path) != stamp]
+            result["advances"].append({
+                "advance": advance,
+                "from": start_time.isoformat(),
+                "to": collected["new_time"],
+                "readings": collected["readings_count"],
+                "fast_forwarded": collected["fast_forwarded"],
+                "seconds": round(seconds, 4),
+                "readings_per_second": round(collected["readings_count"] / seconds) if seconds > 0 else 0,
+                "stages": stages,
+                "files_written": len(changed),
+                "bytes_written": sum(after[path][1] for path in changed),
+                "write_syscall_bytes": (written_after - written_before
+                                        if written_before is not None and written_after is not None else None),
+                "data_dir_bytes": sum(size for _, size in after.values()),
+                "peak_rss_mb": _peak_rss_mb(),
+                "reading_store": system.reading_store.memory_footprint(),
+                "queries": _time_queries(system, meter_ids, rng, queries)
+            })
+        result["cold_archive"] = _cold_archive_stats(system, meter_ids, rng, queries)
+        system.close()
+        return result
+    finally:
+        shutil.rmtree(base_dir)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Stages that run in the worker pool: generation and the encoding of JSON daily files.
+POOLED_STAGES = ("generate", "encode_day")
+
+
+def _workers_run(meters: int, days: int, workers: int, seed: int, storage_format: str) -> dict:
+    """Time one collection with a number of workers; called in a fresh process."""
+    from app import SmartMeterSystem
+
+    base_dir = _new_base_dir("meter_workers_")
+    try:
+        system = SmartMeterSystem(base_dir, seed=seed, storage_format=storage_format, workers=workers)
+        _register_fleet(system, meters)
+        timer = _instrument(system)
+        if workers == 1 and hasattr(system.daily_storage, "encode_meters"):
+            # Only timed serially: the pool cannot pickle the wrapper.
+            timer.wrap(system.daily_storage, "encode_meters", "encode_day")
+        start = time.perf_counter()
+        system.collect_readings("days", days)
+        seconds = time.perf_counter() - start
+        stages = timer.take()
+        system.close()
+        # Identical for every run with the same seed and worker count.
+        digest = hashlib.sha256()
+        for root, _, names in sorted(os.walk(system.daily_readings_dir)):
+            for name in sorted(names):
+                with open(os.path.join(root, name), "rb") as f:
+                    digest.update(f.read())
+        return {"workers": workers, "seconds": round(seconds, 4), "stages": stages,
+                "daily_files_sha256": digest.hexdigest()}
+    finally:
+        shutil.rmtree(base_dir)
+
+
+def bench_workers(args) -> dict:
+    """Collection time per worker count, against the limit set by the stages run serially."""
+    runs = []
+    for workers in (int(n) for n in args.workers.split(",")):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            runs.append(pool.submit(
+                _workers_run, args.meters, args.days, workers, args.seed, args.storage_format
+            ).result())
+    serial = runs[0]
+    pooled = sum(serial["stages"].get(stage, {}).get("seconds", 0.0) for stage in POOLED_STAGES)
+    share = pooled / serial["seconds"] if serial["seconds"] > 0 else 0.0
+    for run in runs:
+        run["speedup"] = round(serial["seconds"] / run["seconds"], 2) if run["seconds"] > 0 else None
+        # Amdahl's law for the share of the first run spent in pooled stages.
+        run["speedup_limit"] = round(1 / ((1 - share) + share * serial["workers"] / run["workers"]), 2)
+    return {
+        "cpus": os.cpu_count(),
+        "meters": args.meters,
+        "days": args.days,
+        "storage_format": args.storage_format,
+        "pooled_share": round(share, 3),
+        "runs": runs
+    }
+
+
+def bench_suite(args) -> dict:
+    """Collection, archiving and query stages over day/month/quarter advances per fleet size."""
+    advances = [advance.strip() for advance in args.advances.split(",")]
+    unknown = [advance for advance in advances if advance not in ADVANCES]
+    if unknown:
+        raise SystemExit(f"Unknown advances {unknown}, expected some of: {', '.join(ADVANCES)}")
+    fleets = []
+    for meters in (int(n) for n in args.fleets.split(",")):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            fleets.append(pool.submit(
+                _suite_fleet, meters, advances, args.seed, args.storage_format, args.workers, args.queries,
+                args.model
+            ).result())
+    result = {
+        "commit": _git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "storage_format": args.storage_format,
+        "workers": args.workers,
+        "model": args.model,
+        "fleets": fleets
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Smart meter performance benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    storage = commands.add_parser("storage", help="Daily reading storage formats")
+    storage.add_argument("--meters", type=int, default=10000)
+    storage.set_defaults(handler=bench_storage)
+
+    load = commands.add_parser("loadtest", help="Parallel readers and serialized writers across processes")
+    load.add_argument("--meters", type=int, default=200)
+    load.add_argument("--readers", default="1,2,4", help="Comma-separated reader process counts")
+    load.add_argument("--writers", type=int, default=2, help="Writer processes per round")
+    load.add_argument("--duration", type=float, default=3.0, help="Seconds per round")
+    load.set_defaults(handler=bench_loadtest)
+
+    suite = commands.add_parser("suite", help="Stage timings, peak RSS and bytes written per fleet size")
+    suite.add_argument("--fleets", default="1000,10000,100000", help="Comma-separated fleet sizes")
+    suite.add_argument("--advances", default="day,month,quarter",
+                       help=f"Comma-separated advances, run in order ({', '.join(ADVANCES)})")
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--storage-format", default="binary", choices=sorted(DAILY_STORAGES))
+    suite.add_argument("--workers", type=int, default=1)
+    suite.add_argument("--model", default="uniform", choices=sorted(CONSUMPTION_MODELS))
+    suite.add_argument("--queries", type=int, default=20, help="Queries of each kind after every advance")
+    suite.add_argument("--output", help="Also write the JSON results to this file")
+    suite.set_defaults(handler=bench_suite)
+
+    workers = commands.add_parser("workers", help="Collection speed-up per worker count")
+    workers.add_argument("--meters", type=int, default=20000)
+    workers.add_argument("--days", type=int, default=2)
+    workers.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts, the first is the baseline")
+    workers.add_argument("--seed", type=int, default=0)
+    workers.add_argument("--storage-format", default="json", choices=sorted(DAILY_STORAGES))
+    workers.set_defaults(handler=bench_workers)
+
+    args = parser.parse_args(argv)
+    print(json.dumps(args.handler(args), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
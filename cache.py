@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from metrics import METRICS
+
+
+class ResultCache:
+    """Results of read-only requests, valid for one version of the state.
+
+    Entries are kept in least-recently-used order and bounded both in number
+    and in total size. Every entry belongs to the version it was computed at;
+    the first lookup at a newer version drops them all, so a result is never
+    served after the state it was computed from has changed.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[object, int]]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached results (bytes, as given to put())."""
+        return self._bytes
+
+    def _switch(self, version: int):
+        if version != self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key: Hashable, version: int):
+        """The result cached for key at this version, or None."""
+        with self._lock:
+            self._switch(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                METRICS.count("result_cache_total", outcome="miss")
+                return None
+            self._entries.move_to_end(key)
+        METRICS.count("result_cache_total", outcome="hit")
+        return entry[0]
+
+    def put(self, key: Hashable, version: int, result, size: int):
+        """Cache a result computed at version, evicting the least recently used ones."""
+        if not self.max_entries or size > self.max_bytes:
+            return
+        with self._lock:
+            self._switch(version)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                METRICS.count("result_cache_evictions_total")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -0,0 +1,272 @@
+import datetime
+import os
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from durability import atomic_write, file_stamp
+from metrics import METRICS
+from storage import DailyReadings, read_daily_file
+
+
+@dataclass
+class MeterHistory:
+    """The readings of one meter over an archived month."""
+    month: datetime.date
+    minutes: np.ndarray  # int64, minutes since the start of the month
+    values: np.ndarray   # float64, cumulative meter value
+    previous: float      # value before the month, NaN if unknown
+
+    def day(self, date: datetime.date) -> Tuple[np.ndarray, np.ndarray]:
+        """(minute of the day, value) of the readings on date."""
+        offset = (date - self.month).days * 1440
+        rows = slice(*np.searchsorted(self.minutes, [offset, offset + 1440]))
+        return self.minutes[rows] - offset, self.values[rows]
+
+    def value_before(self, date: datetime.date) -> float:
+        """Latest value before date, NaN if unknown."""
+        end = np.searchsorted(self.minutes, (date - self.month).days * 1440)
+        return float(self.values[end - 1]) if end else self.previous
+
+
+def _shuffle(column: np.ndarray) -> bytes:
+    """Bytes of a column grouped by significance, which compresses small integers well."""
+    return np.ascontiguousarray(column.view(np.uint8).reshape(-1, column.itemsize).T).tobytes()
+
+
+def _unshuffle(data: bytes, dtype: str) -> np.ndarray:
+    itemsize = np.dtype(dtype).itemsize
+    return np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1).T).view(dtype).ravel()
+
+
+class _MonthIndex:
+    """Header and per-meter index of a cold file, kept in memory for lookups."""
+
+    def __init__(self, path: str, header, meter_ids: List[str], offsets: np.ndarray, counts: np.ndarray,
+                 first_minute: np.ndarray, first_wh: np.ndarray, last: np.ndarray, previous: np.ndarray,
+                 data_offset: int):
+        self.path = path
+        self.header = header
+        self.meter_index = {meter_id: k for k, meter_id in enumerate(meter_ids)}
+        self.meter_ids = meter_ids
+        self.offsets = offsets
+        self.counts = counts
+        self.first_minute = first_minute
+        self.first_wh = first_wh
+        self.last = last
+        self.previous = previous
+        self.data_offset = data_offset
+        self.stamp = file_stamp(path)
+
+
+class ColdArchive:
+    """Expired months of daily readings, one compressed columnar file per month.
+
+    cold/readings_YYYYMM.rca holds a 56-byte header, then per meter: the
+    offset of its block in the data section (int64[m + 1]), its number of
+    readings (uint32[m]), the minute of the month of its first reading
+    (uint32[m]), its first value in Wh (int64[m], the 3-decimal precision
+    of the daily files), its last value and its value before the month
+    (float64[m] each), then the meter IDs as newline-separated UTF-8 and the
+    data section. A meter's block is the deltas from one reading to the next
+    of its times (uint16 minutes) and values (int32 Wh, or int64 if a month
+    needs it), byte-shuffled and zlib-compressed. Readings only grow, so the
+    deltas are small and a lookup decompresses one meter's block.
+    """
+
+    MAGIC = b"SMCA"
+    VERSION = 1
+    EXTENSION = ".rca"
+    HEADER = np.dtype([
+        ("magic", "S4"), ("version", "<u4"), ("month", "<i4"), ("meters", "<u4"),
+        ("readings", "<u8"), ("ids_bytes", "<u8"), ("data_bytes", "<u8"), ("source_bytes", "<u8"),
+        ("value_bytes", "<u4"), ("reserved", "<u4")
+    ])
+    # Meters gathered at once while packing; bounds the memory of a month.
+    CHUNK_METERS = 4096
+    # Faster than the default level for about 3% more bytes, as the deltas are small.
+    LEVEL = 1
+
+    def __init__(self, cold_dir: str):
+        self.cold_dir = cold_dir
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, _MonthIndex] = {}
+
+    def path_for(self, month: datetime.date) -> str:
+        return os.path.join(self.cold_dir, f"readings_{month.strftime('%Y%m')}{self.EXTENSION}")
+
+    def has_month(self, month: datetime.date) -> bool:
+        return os.path.exists(self.path_for(month))
+
+    def months(self) -> List[datetime.date]:
+        if not os.path.isdir(self.cold_dir):
+            return []
+        return sorted(
+            datetime.datetime.strptime(name[9:15], "%Y%m").date() for name in os.listdir(self.cold_dir)
+            if name.startswith("readings_") and name.endswith(self.EXTENSION)
+        )
+
+    @METRICS.timed("cold_pack")
+    def pack(self, month: datetime.date, daily_files: List[str]) -> Optional[str]:
+        """Write a month's daily files (in date order) to its cold file; None if they hold no readings."""
+        days = [read_daily_file(path) for path in daily_files]
+        days = [day for day in days if len(day)]
+        if not days:
+            return None
+        lookup: Dict[str, int] = {}
+        positions = [
+            np.fromiter((lookup.setdefault(m, len(lookup)) for m in day.meter_ids), dtype=np.int64,
+                        count=len(day.meter_ids))
+            for day in days
+        ]
+        meter_ids = list(lookup)
+        previous_month = (month - datetime.timedelta(days=1)).replace(day=1)
+        previous = self.last_values(previous_month, meter_ids)
+
+        counts = np.zeros(len(meter_ids), dtype=np.uint32)
+        first_minute = np.zeros(len(meter_ids), dtype=np.uint32)
+        first_wh = np.zeros(len(meter_ids), dtype=np.int64)
+        last = np.full(len(meter_ids), np.nan)
+        chunks = []
+        for first in range(0, len(meter_ids), self.CHUNK_METERS):
+            meter, minutes, values = self._gather(
+                month, days, positions, first, min(first + self.CHUNK_METERS, len(meter_ids))
+            )
+            wh = np.round(values * 1000).astype(np.int64)
+            # Every meter has readings, so the chunk's meters are first..first + len(ends).
+            ends = np.flatnonzero(np.diff(meter, append=-1)) + 1
+            starts = np.concatenate(([0], ends[:-1]))
+            rows = slice(first, first + len(ends))
+            counts[rows] = ends - starts
+            first_minute[rows] = minutes[starts]
+            first_wh[rows] = wh[starts]
+            last[rows] = values[ends - 1]
+            # Deltas to the previous reading of the same meter, 0 for its first.
+            time_deltas = np.diff(minutes, prepend=0)
+            value_deltas = np.diff(wh, prepend=0)
+            time_deltas[starts] = 0
+            value_deltas[starts] = 0
+            chunks.append((starts, ends, time_deltas.astype("<u2"), value_deltas))
+        value_dtype = "<i4" if all(
+            np.abs(deltas).max(initial=0) < 2 ** 31 for _, _, _, deltas in chunks
+        ) else "<i8"
+        blocks: List[bytes] = []
+        for starts, ends, time_deltas, value_deltas in chunks:
+            value_deltas = value_deltas.astype(value_dtype)
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                blocks.append(zlib.compress(
+                    _shuffle(time_deltas[start:end]) + _shuffle(value_deltas[start:end]), self.LEVEL
+                ))
+
+        offsets = np.zeros(len(meter_ids) + 1, dtype="<i8")
+        np.cumsum([len(block) for block in blocks], out=offsets[1:])
+        ids = "\n".join(meter_ids).encode("utf-8")
+        header = np.zeros(1, dtype=self.HEADER)
+        header[0] = (self.MAGIC, self.VERSION, month.toordinal(), len(meter_ids), int(counts.sum()), len(ids),
+                     int(offsets[-1]), sum(os.path.getsize(path) for path in daily_files),
+                     np.dtype(value_dtype).itemsize, 0)
+        path = self.path_for(month)
+        os.makedirs(self.cold_dir, exist_ok=True)
+        # The daily files are deleted afterwards, so the archive must be on disk first.
+        with atomic_write(path, "wb", sync=True) as f:
+            f.write(header.tobytes())
+            f.write(offsets.tobytes())
+            f.write(counts.astype("<u4").tobytes())
+            f.write(first_minute.astype("<u4").tobytes())
+            f.write(first_wh.astype("<i8").tobytes())
+            f.write(last.astype("<f8").tobytes())
+            f.write(previous.astype("<f8").tobytes())
+            f.write(ids)
+            for block in blocks:
+                f.write(block)
+        with self._lock:
+            self._indexes.pop(path, None)
+        return path
+
+    @staticmethod
+    def _gather(month: datetime.date, days: List[DailyReadings], positions: List[np.ndarray],
+                first: int, end: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(meter position, minute of the month, value) of meters first..end, by meter and time."""
+        meters, minutes, values = [], [], []
+        for day, day_positions in zip(days, positions):
+            selected = np.flatnonzero((day_positions >= first) & (day_positions < end))
+            if not len(selected):
+                continue
+            lengths = day.starts[selected + 1] - day.starts[selected]
+            rows = np.repeat(day.starts[selected] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            meters.append(np.repeat(day_positions[selected], lengths))
+            minutes.append(np.asarray(day.minutes[rows], dtype=np.int64) + (day.date - month).days * 1440)
+            values.append(np.asarray(day.values[rows], dtype=np.float64))
+        meter = np.concatenate(meters)
+        # Days are in order and sorted by time, so a stable sort by meter keeps each meter's time order.
+        order = np.argsort(meter, kind="stable")
+        return meter[order], np.concatenate(minutes)[order], np.concatenate(values)[order]
+
+    def _index(self, month: datetime.date) -> Optional[_MonthIndex]:
+        path = self.path_for(month)
+        stamp = file_stamp(path)
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is not None and index.stamp == stamp:
+                return index
+        if stamp is None:
+            return None
+        with open(path, "rb") as f:
+            header = np.frombuffer(f.read(self.HEADER.itemsize), dtype=self.HEADER)[0]
+            if header["magic"] != self.MAGIC or header["version"] != self.VERSION:
+                raise ValueError(f"Not a cold archive file: {path}")
+            meters = int(header["meters"])
+            offsets = np.frombuffer(f.read(8 * (meters + 1)), dtype="<i8")
+            counts = np.frombuffer(f.read(4 * meters), dtype="<u4")
+            first_minute = np.frombuffer(f.read(4 * meters), dtype="<u4")
+            first_wh = np.frombuffer(f.read(8 * meters), dtype="<i8")
+            last = np.frombuffer(f.read(8 * meters), dtype="<f8")
+            previous = np.frombuffer(f.read(8 * meters), dtype="<f8")
+            ids = f.read(int(header["ids_bytes"])).decode("utf-8")
+            index = _MonthIndex(path, header, ids.split("\n") if ids else [], offsets, counts, first_minute,
+                                first_wh, last, previous, f.tell())
+        with self._lock:
+            self._indexes[path] = index
+        return index
+
+    def last_values(self, month: datetime.date, meter_ids: List[str]) -> np.ndarray:
+        """Last value of each meter in an archived month, NaN where unknown."""
+        index = self._index(month)
+        if index is None:
+            return np.full(len(meter_ids), np.nan)
+        rows = np.fromiter((index.meter_index.get(m, -1) for m in meter_ids), dtype=np.int64, count=len(meter_ids))
+        return np.where(rows >= 0, index.last[rows], np.nan)
+
+    def meter_history(self, month: datetime.date, meter_id: str) -> Optional[MeterHistory]:
+        """One meter's readings of an archived month, or None if it has none there."""
+        with METRICS.span("cold_lookup"):
+            index = self._index(month)
+            k = index.meter_index.get(meter_id) if index is not None else None
+            if k is None:
+                return None
+            count = int(index.counts[k])
+            with open(index.path, "rb") as f:
+                f.seek(index.data_offset + int(index.offsets[k]))
+                raw = zlib.decompress(f.read(int(index.offsets[k + 1] - index.offsets[k])))
+            value_dtype = "<i4" if int(index.header["value_bytes"]) == 4 else "<i8"
+            minutes = int(index.first_minute[k]) + np.cumsum(_unshuffle(raw[:2 * count], "<u2"), dtype=np.int64)
+            values = (int(index.first_wh[k]) + np.cumsum(_unshuffle(raw[2 * count:], value_dtype), dtype=np.int64)) / 1000
+            return MeterHistory(month, minutes, values, float(index.previous[k]))
+
+    def stats(self, month: datetime.date) -> Optional[dict]:
+        """Sizes of an archived month: readings, daily files packed, cold file."""
+        index = self._index(month)
+        if index is None:
+            return None
+        return {
+            "readings": int(index.header["readings"]),
+            "source_bytes": int(index.header["source_bytes"]),
+            "archive_bytes": os.path.getsize(index.path),
+        }
+
+    def clear_cache(self):
+        with self._lock:
+            self._indexes = {}
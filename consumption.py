@@ -0,0 +1,213 @@
+import datetime
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Reading times of a day: 01:30 .. 23:30, every 30 minutes.
+SLOT_MINUTES = np.arange(90, 24 * 60, 30)
+SLOTS_PER_DAY = len(SLOT_MINUTES)
+
+# Weight of each of a day's later increments in the sum of its readings.
+_LATER_WEIGHTS = np.arange(SLOTS_PER_DAY - 1, 0, -1, dtype=np.float64)
+
+
+def day_slot_times(date: datetime.date) -> List[datetime.datetime]:
+    midnight = datetime.datetime.combine(date, datetime.time())
+    return [midnight + datetime.timedelta(minutes=int(m)) for m in SLOT_MINUTES]
+
+
+@dataclass
+class MeterProfiles:
+    """Per-meter inputs of a consumption model, aligned with a list of meters."""
+    dwelling: np.ndarray  # int, index into the model's dwelling types
+    scale: np.ndarray     # float, the household's consumption relative to its type
+
+    def __len__(self) -> int:
+        return len(self.scale)
+
+    def take(self, index) -> "MeterProfiles":
+        return MeterProfiles(self.dwelling[index], self.scale[index])
+
+
+class ConsumptionModel:
+    """Base class of the models that draw the consumption between two readings.
+
+    Models work on whole blocks: increments() returns slots x meters at once
+    and every per-slot or per-meter input is looked up with array indexing.
+    """
+    name = ""
+
+    def profiles(self, accounts: List[dict]) -> MeterProfiles:
+        """Per-meter inputs for a list of accounts, computed once per collection."""
+        count = len(accounts)
+        return MeterProfiles(np.zeros(count, dtype=np.int64), np.ones(count))
+
+    def increments(self, rng: np.random.RandomState, slot_times: Sequence[datetime.datetime],
+                   profiles: MeterProfiles) -> np.ndarray:
+        """Consumption (kWh) since the previous reading at every slot (slots x meters)."""
+        raise NotImplementedError
+
+    def slot_moments(self, slot_times: Sequence[datetime.datetime],
+                     profiles: MeterProfiles) -> Tuple[np.ndarray, np.ndarray]:
+        """Mean and variance of increments() (slots x meters)."""
+        raise NotImplementedError
+
+    def day_moments(self, dates: Sequence[datetime.date],
+                    profiles: MeterProfiles) -> Tuple[np.ndarray, ...]:
+        """Moments of the increments after a day's first one (days x meters each).
+
+        These are the mean and variance of their sum S, the mean and variance
+        of W (each weighted by the number of the day's readings it is part
+        of) and the covariance of S and W.
+        """
+        moments = np.empty((5, len(dates), len(profiles)))
+        weights = _LATER_WEIGHTS[:, None]
+        for d, date in enumerate(dates):
+            mean, var = self.slot_moments(day_slot_times(date)[1:], profiles)
+            moments[:, d] = (mean.sum(axis=0), var.sum(axis=0), (weights * mean).sum(axis=0),
+                             (weights ** 2 * var).sum(axis=0), (weights * var).sum(axis=0))
+        return tuple(moments)
+
+
+class UniformModel(ConsumptionModel):
+    """U(0, 1) kWh per reading for every meter (the original generator).
+
+    Seeded runs draw exactly the stream of the former random.uniform() loop.
+    """
+    name = "uniform"
+
+    def increments(self, rng, slot_times, profiles):
+        return rng.uniform(0, 1, size=(len(slot_times), len(profiles)))
+
+    def slot_moments(self, slot_times, profiles):
+        shape = (len(slot_times), len(profiles))
+        return np.full(shape, 0.5), np.full(shape, 1 / 12)
+
+    def day_moments(self, dates, profiles):
+        shape = (len(dates), len(profiles))
+        return tuple(np.full(shape, value) for value in (
+            0.5 * _LATER_WEIGHTS.size, _LATER_WEIGHTS.size / 12, 0.5 * _LATER_WEIGHTS.sum(),
+            (_LATER_WEIGHTS ** 2).sum() / 12, _LATER_WEIGHTS.sum() / 12
+        ))
+
+
+def _bump(centre: float, width: float) -> np.ndarray:
+    """Daily load bump around centre (hours) over the 48 half hours, wrapping at midnight."""
+    hours = (np.arange(48) + 0.5) / 2
+    distance = np.abs(hours - centre)
+    distance = np.minimum(distance, 24 - distance)
+    return np.exp(-0.5 * (distance / width) ** 2)
+
+
+class LoadProfileModel(ConsumptionModel):
+    """Daily load curves per dwelling type, scaled by weekday/weekend, season and household.
+
+    Every dwelling type has an average daily consumption and a weekday and
+    weekend curve: a base load, a morning peak, daytime use and an evening
+    peak, plus air-conditioning at night that grows with the dwelling. Months
+    have a seasonal factor and every meter a stable household scale derived
+    from its ID. Each increment is its expected value times gamma noise with
+    mean 1.
+    """
+    name = "profile"
+
+    # Dwelling type: (average kWh per day, night air-conditioning weight).
+    DWELLINGS: Dict[str, Tuple[float, float]] = {
+        "1": (4.6, 0.2),   # 1-room / 2-room
+        "5": (8.3, 0.4),   # 3-room
+        "6": (11.7, 0.6),  # 4-room
+        "4": (14.3, 0.8),  # 5-room and Executive
+        "2": (16.7, 1.0),  # Private Apartments and Condominiums
+        "3": (36.7, 1.4),  # Landed Properties
+    }
+    # Accounts with another dwelling type are modelled as 4-room flats.
+    DEFAULT_DWELLING = "6"
+    WEEKEND_FACTOR = 1.1
+    # January .. December; the hot months run the air-conditioning longer.
+    SEASON = np.array([0.93, 0.95, 1.0, 1.05, 1.09, 1.08, 1.05, 1.04, 1.03, 1.01, 0.96, 0.92])
+    # Households span about 0.6x to 1.6x their type's average.
+    HOUSEHOLD_SPREAD = 0.5
+    # Coefficient of variation of a single increment.
+    NOISE_CV = 0.5
+
+    def __init__(self):
+        self.dwelling_types = list(self.DWELLINGS)
+        self._dwelling_index = {dwelling: i for i, dwelling in enumerate(self.dwelling_types)}
+        weekday = 0.35 + 0.9 * _bump(7.0, 1.0) + 0.45 * _bump(13.0, 3.0) + 1.6 * _bump(20.5, 1.8)
+        weekend = 0.35 + 0.6 * _bump(9.5, 1.5) + 0.9 * _bump(14.0, 3.5) + 1.5 * _bump(20.0, 2.0)
+        night = _bump(1.0, 2.5)
+        # Expected kWh of the reading at each half hour (weekday/weekend x dwelling x 48).
+        self.slot_energy = np.zeros((2, len(self.dwelling_types), 48))
+        for weekend_day, shape in enumerate((weekday, weekend)):
+            factor = self.WEEKEND_FACTOR if weekend_day else 1.0
+            for d, (daily_kwh, aircon) in enumerate(self.DWELLINGS.values()):
+                self.slot_energy[weekend_day, d] = self._reading_energy(shape + aircon * night, daily_kwh * factor)
+
+    @staticmethod
+    def _reading_energy(curve: np.ndarray, daily_kwh: float) -> np.ndarray:
+        """Energy per reading slot from a load curve over the 48 half hours.
+
+        A reading measures the half hour that ends at it; the first one of the
+        day (01:30) also covers the maintenance hour and the half hour before.
+        """
+        energy = np.roll(curve, 1)
+        first = SLOT_MINUTES[0] // 30
+        energy[first] = curve[-1] + curve[:first].sum()
+        energy[:first] = 0
+        return energy * daily_kwh / energy.sum()
+
+    def profiles(self, accounts):
+        fallback = self._dwelling_index[self.DEFAULT_DWELLING]
+        dwelling = np.fromiter(
+            (self._dwelling_index.get(str(account.get("dwelling")), fallback) for account in accounts),
+            dtype=np.int64, count=len(accounts)
+        )
+        hashes = np.fromiter(
+            (zlib.crc32(account["meter_ID"].encode("utf-8")) for account in accounts),
+            dtype=np.float64, count=len(accounts)
+        )
+        # Log-uniform around 1, normalized so that the type's average holds.
+        spread = self.HOUSEHOLD_SPREAD
+        scale = np.exp(spread * (2 * (hashes + 0.5) / 2 ** 32 - 1)) * spread / np.sinh(spread)
+        return MeterProfiles(dwelling, scale)
+
+    def slot_moments(self, slot_times, profiles):
+        minutes = np.fromiter((t.hour * 60 + t.minute for t in slot_times), dtype=np.int64, count=len(slot_times))
+        weekend = np.fromiter((t.weekday() >= 5 for t in slot_times), dtype=np.int64, count=len(slot_times))
+        season = self.SEASON[np.fromiter((t.month - 1 for t in slot_times), dtype=np.int64, count=len(slot_times))]
+        mean = self.slot_energy[weekend[:, None], profiles.dwelling[None, :], (minutes // 30)[:, None]]
+        mean *= season[:, None] * profiles.scale[None, :]
+        return mean, (mean * self.NOISE_CV) ** 2
+
+    def day_moments(self, dates, profiles):
+        # A day's moments are per-type sums scaled by the day's season and the household.
+        later = (SLOT_MINUTES[1:] // 30)
+        energy = self.slot_energy[:, :, later]
+        var = energy ** 2 * self.NOISE_CV ** 2
+        sums = np.stack((energy.sum(axis=2), var.sum(axis=2), (_LATER_WEIGHTS * energy).sum(axis=2),
+                         (_LATER_WEIGHTS ** 2 * var).sum(axis=2), (_LATER_WEIGHTS * var).sum(axis=2)))
+        weekend = np.array([date.weekday() >= 5 for date in dates], dtype=np.int64)
+        factor = self.SEASON[np.array([date.month - 1 for date in dates], dtype=np.int64)][:, None] * profiles.scale
+        by_day = sums[:, weekend[:, None], profiles.dwelling[None, :]]
+        powers = np.array([1, 2, 1, 2, 2])[:, None, None]
+        return tuple(by_day * factor ** powers)
+
+    def increments(self, rng, slot_times, profiles):
+        mean, _ = self.slot_moments(slot_times, profiles)
+        shape = 1 / self.NOISE_CV ** 2
+        return mean * rng.gamma(shape, 1 / shape, size=mean.shape)
+
+
+CONSUMPTION_MODELS: Dict[str, ConsumptionModel] = {
+    model.name: model for model in (UniformModel(), LoadProfileModel())
+}
+
+
+def get_consumption_model(name: str) -> ConsumptionModel:
+    """Look up a consumption model by name."""
+    try:
+        return CONSUMPTION_MODELS[name]
+    except KeyError:
+        raise ValueError(f"Unknown consumption model: {name}") from None
@@ -0,0 +1,286 @@
+import datetime
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from durability import atomic_write
+
+DIMENSIONS = ("date", "month", "region", "area", "dwelling")
+PERCENTILES = (50, 90, 99)
+
+# Upper edges of the percentile sketch bins: one bin below zero, one from 0 to
+# 0.01 kWh, log-spaced bins (about 6% wide) up to 1000 kWh and one above.
+SKETCH_EDGES = np.concatenate(([0.0], np.geomspace(0.01, 1000.0, 200)))
+SKETCH_BINS = len(SKETCH_EDGES) + 1
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+class CubeMonth:
+    """Cells of one month: (day, area, dwelling) with count, sum, min, max and a sketch."""
+
+    def __init__(self, keys: Optional[List[Tuple[str, str]]] = None):
+        # (area, dwelling) of every key index used by the cells.
+        self.keys: List[Tuple[str, str]] = keys or []
+        self.day = np.zeros(0, dtype=np.int16)
+        self.key = np.zeros(0, dtype=np.int32)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0)
+        self.low = np.zeros(0)
+        self.high = np.zeros(0)
+        self.sketch = np.zeros((0, SKETCH_BINS), dtype=np.uint32)
+
+    def key_codes(self, keys: List[Tuple[str, str]], codes: np.ndarray) -> np.ndarray:
+        """Key index of every meter from its group in keys, -1 for unknown meters (code -1)."""
+        lookup = {key: i for i, key in enumerate(self.keys)}
+        key_map = np.full(len(keys) + 1, -1, dtype=np.int32)
+        for code in np.unique(codes[codes >= 0]).tolist():
+            key_map[code] = lookup.setdefault(keys[code], len(lookup))
+        self.keys = list(lookup)
+        return key_map[codes]
+
+    def replace_days(self, days: List[int], codes: np.ndarray, usage: np.ndarray):
+        """Recompute the cells of some days from the usage of every meter (days x meters, NaN = no data)."""
+        keep = ~np.isin(self.day, days)
+        columns = ("day", "key", "count", "total", "low", "high", "sketch")
+        kept = {name: getattr(self, name)[keep] for name in columns}
+
+        # One cell per (day, key), numbered in day order and key order within a day.
+        width = max(int(codes.max()) + 1, 1) if len(codes) else 1
+        usage = np.asarray(usage, dtype=np.float64)
+        valid = (codes >= 0)[None, :] & ~np.isnan(usage)
+        day_rows, meters = np.nonzero(valid)
+        values = usage[day_rows, meters]
+        cell_ids, cells = np.unique(day_rows * width + codes[meters], return_inverse=True)
+        cells = cells.ravel()
+        count = np.bincount(cells, minlength=len(cell_ids))
+        total = np.bincount(cells, weights=values, minlength=len(cell_ids))
+        order = np.argsort(cells, kind="stable")
+        starts = np.cumsum(count) - count
+        low = np.minimum.reduceat(values[order], starts) if len(values) else np.zeros(0)
+        high = np.maximum.reduceat(values[order], starts) if len(values) else np.zeros(0)
+        bins = np.searchsorted(SKETCH_EDGES, values, side="right")
+        sketch = np.bincount(cells * SKETCH_BINS + bins, minlength=len(cell_ids) * SKETCH_BINS)
+        sketch = sketch.reshape(len(cell_ids), SKETCH_BINS).astype(np.uint32)
+
+        self.day = np.concatenate((kept["day"], np.asarray(days, dtype=np.int16)[cell_ids // width]))
+        self.key = np.concatenate((kept["key"], (cell_ids % width).astype(np.int32)))
+        self.count = np.concatenate((kept["count"], count))
+        self.total = np.concatenate((kept["total"], total))
+        self.low = np.concatenate((kept["low"], low))
+        self.high = np.concatenate((kept["high"], high))
+        self.sketch = np.concatenate((kept["sketch"], sketch))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Sketches are mostly empty bins, so the file is compressed.
+        with atomic_write(path, "wb") as f:
+            np.savez_compressed(
+                f, keys=np.array(["\t".join(key) for key in self.keys], dtype=str), day=self.day, key=self.key,
+                count=self.count, total=self.total, low=self.low, high=self.high, sketch=self.sketch
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "CubeMonth":
+        with np.load(path) as data:
+            month = cls([tuple(key.split("\t")) for key in data["keys"].tolist()])
+            for name in ("day", "key", "count", "total", "low", "high", "sketch"):
+                setattr(month, name, data[name])
+        return month
+
+
+def sketch_percentiles(sketch: np.ndarray, count: np.ndarray, low: np.ndarray, high: np.ndarray,
+                       percentiles: Sequence[float]) -> np.ndarray:
+    """Estimate percentiles (cells x percentiles) from summed sketches.
+
+    Values are interpolated within their bin and clamped to the cell's min/max.
+    """
+    lower = np.concatenate(([-np.inf], SKETCH_EDGES))
+    upper = np.concatenate((SKETCH_EDGES, [np.inf]))
+    cumulative = np.cumsum(sketch, axis=1)
+    result = np.empty((len(count), len(percentiles)))
+    for j, percentile in enumerate(percentiles):
+        rank = np.maximum(percentile / 100.0 * count, 1)
+        bins = np.minimum((cumulative < rank[:, None]).sum(axis=1), SKETCH_BINS - 1)
+        below = np.where(bins > 0, cumulative[np.arange(len(count)), np.maximum(bins - 1, 0)], 0)
+        inside = np.maximum(sketch[np.arange(len(count)), bins], 1)
+        start = np.maximum(lower[bins], low)
+        end = np.minimum(upper[bins], high)
+        result[:, j] = np.clip(start + (end - start) * (rank - below) / inside, low, high)
+    return result
+
+
+class ConsumptionCube:
+    """Daily kWh per account aggregated by date, area and dwelling type.
+
+    cube/cube_YYYYMM.npz holds a month of cells with the number of accounts,
+    the sum, min and max of their usage and a histogram sketch for
+    percentiles. Cells are replaced whenever a day's daily rollup changes.
+    Regions come from the area catalog when querying, and every dimension
+    can be sliced or rolled up.
+    """
+
+    def __init__(self, cube_dir: str):
+        self.cube_dir = cube_dir
+        self._months: Dict[str, CubeMonth] = {}
+
+    def _path(self, month: str) -> str:
+        return os.path.join(self.cube_dir, f"cube_{month}.npz")
+
+    def _month(self, month: str) -> Optional[CubeMonth]:
+        cached = self._months.get(month)
+        if cached is None and os.path.exists(self._path(month)):
+            cached = self._months[month] = CubeMonth.load(self._path(month))
+        return cached
+
+    def set_day(self, date: datetime.date, usage: np.ndarray, keys: List[Tuple[str, str]],
+                codes: np.ndarray) -> str:
+        """Replace the cells of a day; returns the file written."""
+        return self.set_days([date], np.asarray(usage)[None, :], keys, codes)[0]
+
+    def set_days(self, dates: List[datetime.date], usage: np.ndarray, keys: List[Tuple[str, str]],
+                 codes: np.ndarray) -> List[str]:
+        """Replace the cells of several days (usage is days x meters); returns the files written.
+
+        codes is the (area, dwelling) group of every meter in keys, -1 if unknown.
+        """
+        by_month: Dict[str, List[int]] = {}
+        for row, date in enumerate(dates):
+            by_month.setdefault(date.strftime("%Y%m"), []).append(row)
+        usage = np.asarray(usage)
+        for month_key, rows in by_month.items():
+            month = self._month(month_key) or CubeMonth()
+            month.replace_days([dates[row].day for row in rows], month.key_codes(keys, codes), usage[rows])
+            month.save(self._path(month_key))
+            self._months[month_key] = month
+        return [self._path(month_key) for month_key in by_month]
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.cube_dir)
+
+    def clear_cache(self):
+        self._months = {}
+
+    def cached_months(self) -> int:
+        return len(self._months)
+
+    def query(self, start: datetime.date, end: datetime.date, by: Sequence[str] = (),
+              filters: Optional[Dict[str, str]] = None,
+              region_of: Callable[[str], Optional[str]] = lambda area: None) -> dict:
+        """Aggregate the cells of start..end, grouped by some DIMENSIONS.
+
+        filters slice on region, area or dwelling values. Every group reports
+        count (account-days), sum, avg, min, max and percentiles of daily kWh.
+        """
+        filters = {name: value for name, value in (filters or {}).items() if value}
+        for name in list(by) + list(filters):
+            if name not in DIMENSIONS:
+                raise ValueError(f"Invalid dimension {name}, expected one of: {', '.join(DIMENSIONS)}")
+
+        # Stack the cells of every month in range with a cube-wide key index.
+        keys: Dict[Tuple[str, str], int] = {}
+        parts = []
+        month = start.replace(day=1)
+        while month <= end:
+            cells = self._month(month.strftime("%Y%m"))
+            if cells is not None and len(cells.day):
+                key_map = np.fromiter((keys.setdefault(key, len(keys)) for key in cells.keys),
+                                      dtype=np.int64, count=len(cells.keys))
+                ordinal = month.toordinal() - 1 + cells.day.astype(np.int64)
+                parts.append((ordinal, key_map[cells.key], cells))
+            month = (month + datetime.timedelta(days=32)).replace(day=1)
+        result = {"start": start.isoformat(), "end": end.isoformat(), "by": list(by), "filters": filters, "cells": []}
+        if not parts:
+            return result
+        ordinal = np.concatenate([part[0] for part in parts])
+        key = np.concatenate([part[1] for part in parts])
+        count = np.concatenate([part[2].count for part in parts])
+        total = np.concatenate([part[2].total for part in parts])
+        low = np.concatenate([part[2].low for part in parts])
+        high = np.concatenate([part[2].high for part in parts])
+        sketch = np.concatenate([part[2].sketch for part in parts])
+
+        # Per-key labels of the key dimensions.
+        key_list = list(keys)
+        labels = {
+            "area": np.array([area for area, _ in key_list], dtype=object),
+            "dwelling": np.array([dwelling for _, dwelling in key_list], dtype=object),
+        }
+        regions = {area: region_of(area) or "Unknown" for area in set(labels["area"])}
+        labels["region"] = np.array([regions[area] for area in labels["area"]], dtype=object)
+
+        mask = (ordinal >= start.toordinal()) & (ordinal <= end.toordinal())
+        for name, value in filters.items():
+            if name in labels:
+                mask &= np.isin(key, np.flatnonzero(labels[name] == value))
+            else:
+                mask &= self._codes(name, ordinal) == self._codes(name, np.array([self._ordinal(name, value)]))[0]
+        if not mask.any():
+            return result
+
+        ordinal, key = ordinal[mask], key[mask]
+        columns = []
+        for name in by:
+            if name in labels:
+                _, codes = np.unique(labels[name], return_inverse=True)
+                columns.append(codes.ravel()[key])
+            else:
+                columns.append(self._codes(name, ordinal))
+        if columns:
+            groups, cells = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+            cells = cells.ravel()
+        else:
+            groups, cells = np.zeros((1, 0), dtype=np.int64), np.zeros(len(ordinal), dtype=np.int64)
+
+        n = len(groups)
+        group_count = np.bincount(cells, weights=count[mask], minlength=n).astype(np.int64)
+        group_total = np.bincount(cells, weights=total[mask], minlength=n)
+        group_low = np.full(n, np.inf)
+        np.minimum.at(group_low, cells, low[mask])
+        group_high = np.full(n, -np.inf)
+        np.maximum.at(group_high, cells, high[mask])
+        order = np.argsort(cells, kind="stable")
+        _, firsts = np.unique(cells[order], return_index=True)
+        group_sketch = np.add.reduceat(sketch[np.flatnonzero(mask)[order]], firsts, axis=0, dtype=np.int64)
+        percentiles = sketch_percentiles(group_sketch, group_count, group_low, group_high, PERCENTILES)
+
+        for g, first in enumerate(order[firsts].tolist()):
+            row = {}
+            for name in by:
+                if name in labels:
+                    row[name] = labels[name][key[first]]
+                else:
+                    row[name] = self._label(name, int(ordinal[first]))
+            row.update({
+                "count": int(group_count[g]),
+                "sum": round(float(group_total[g]), 3),
+                "avg": round(float(group_total[g] / group_count[g]), 3),
+                "min": round(float(group_low[g]), 3),
+                "max": round(float(group_high[g]), 3),
+            })
+            row.update({f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, percentiles[g])})
+            result["cells"].append(row)
+        return result
+
+    @staticmethod
+    def _codes(name: str, ordinal: np.ndarray) -> np.ndarray:
+        """Date ordinals, or months since 1970 for the month dimension."""
+        if name == "date":
+            return ordinal
+        days = (ordinal - _EPOCH_ORDINAL).astype("datetime64[D]")
+        return days.astype("datetime64[M]").astype(np.int64)
+
+    @staticmethod
+    def _ordinal(name: str, value: str) -> int:
+        try:
+            if name == "month":
+                return datetime.date.fromisoformat(value + "-01").toordinal()
+            return datetime.date.fromisoformat(value).toordinal()
+        except ValueError:
+            raise ValueError(f"Invalid {name}: {value}")
+
+    @staticmethod
+    def _label(name: str, ordinal: int) -> str:
+        date = datetime.date.fromordinal(ordinal)
+        return date.strftime("%Y-%m") if name == "month" else date.isoformat()
@@ -0,0 +1,278 @@
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import IO, Iterator, List, Optional
+
+import numpy as np
+
+from metrics import METRICS
+
+
+def fsync_directory(directory: str):
+    """Make renames inside a directory durable."""
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def file_stamp(path: str):
+    """Identity of a file's current contents, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def fsync_file(path: str):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = "w", sync: bool = False, **open_kwargs) -> Iterator[IO]:
+    """Open a temporary file that replaces path only once it was written completely.
+
+    Readers see either the old or the new contents, never a truncated file.
+    With sync the data and the rename are also fsynced.
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, mode, **open_kwargs) as f:
+            yield f
+            if METRICS.enabled:
+                kind = os.path.splitext(path)[1].lstrip(".") or "other"
+                METRICS.count("bytes_written_total", f.tell(), kind=kind)
+                METRICS.count("files_written_total", kind=kind)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if sync:
+        fsync_directory(os.path.dirname(path))
+
+
+@dataclass
+class RecoveredState:
+    """Simulation state found on disk at startup."""
+    time: Optional[datetime.datetime] = None
+    meter_ids: List[str] = field(default_factory=list)
+    latest: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    # Files written since the checkpoint, oldest first.
+    files: List[str] = field(default_factory=list)
+
+
+class SimulationState:
+    """Write-ahead log of collection ticks plus checkpoints of the latest readings.
+
+    Every point where collection could safely resume is appended to
+    state.wal as {"seq", "time", "files"}, listing the files written since
+    the previous record. latest_readings.npz holds the latest value of every
+    meter as of a logged point; once it is written the log is truncated.
+    On startup the last logged time is the simulation time, and the latest
+    values are the checkpoint plus the last readings of the logged files.
+
+    Log records reach the OS on every append but are fsynced in groups: at
+    most once per sync_interval seconds, after the files they list.
+    """
+
+    def __init__(self, data_dir: str, sync_interval: float = 0.05, checkpoint_every: int = 256):
+        self.data_dir = data_dir
+        self.wal_file = os.path.join(data_dir, "state.wal")
+        self.checkpoint_file = os.path.join(data_dir, "latest_readings.npz")
+        self.sync_interval = sync_interval
+        self.checkpoint_every = checkpoint_every
+
+        self._lock = threading.RLock()
+        self._wal: Optional[IO] = None
+        self._seq = 0
+        self._records = 0
+        self._pending_files: List[str] = []
+        self._unsynced_files: List[str] = []
+        self._unsynced_records = 0
+        self._synced_at = time.monotonic()
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def needs_checkpoint(self) -> bool:
+        return self._records >= self.checkpoint_every
+
+    def _checkpoint_seq(self) -> int:
+        if not os.path.exists(self.checkpoint_file):
+            return 0
+        with np.load(self.checkpoint_file) as checkpoint:
+            return int(checkpoint["seq"])
+
+    def _replay(self, state: RecoveredState, checkpoint_seq: int, after_seq: int) -> bool:
+        """Apply the records after after_seq to state; a torn last record is cut off.
+
+        Returns whether the record after_seq itself was found.
+        """
+        self._seq = after_seq
+        self._records = 0
+        found = False
+        if not os.path.exists(self.wal_file):
+            return found
+        valid_bytes = 0
+        with open(self.wal_file, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                valid_bytes += len(line)
+                if record["seq"] > checkpoint_seq:
+                    self._records += 1
+                found = found or record["seq"] == after_seq
+                if record["seq"] <= after_seq:
+                    continue
+                self._seq = record["seq"]
+                state.time = datetime.datetime.fromisoformat(record["time"])
+                state.files.extend(os.path.join(self.data_dir, path) for path in record["files"])
+        if valid_bytes < os.path.getsize(self.wal_file):
+            # Appending after a torn record would corrupt the next one.
+            with open(self.wal_file, "r+b") as f:
+                f.truncate(valid_bytes)
+                os.fsync(f.fileno())
+        return found
+
+    def recover(self) -> RecoveredState:
+        """Read the checkpoint and replay the log."""
+        with self._lock:
+            self._close_log()
+            state = RecoveredState()
+            checkpoint_seq = 0
+            if os.path.exists(self.checkpoint_file):
+                with np.load(self.checkpoint_file) as checkpoint:
+                    state.time = datetime.datetime.fromisoformat(str(checkpoint["time"]))
+                    state.meter_ids = checkpoint["meter_ids"].tolist()
+                    state.latest = checkpoint["latest"]
+                    checkpoint_seq = int(checkpoint["seq"])
+            self._replay(state, checkpoint_seq, checkpoint_seq)
+            return state
+
+    def catch_up(self) -> Optional[RecoveredState]:
+        """The records another process appended since the last one seen here.
+
+        None if a checkpoint has truncated some of them away or the log was
+        reset; the state must then be recovered from scratch.
+        """
+        with self._lock:
+            # The other process may have truncated or removed the log.
+            self._close_log()
+            seq = self._seq
+            checkpoint_seq = self._checkpoint_seq()
+            if checkpoint_seq > seq:
+                return None
+            state = RecoveredState()
+            if not self._replay(state, checkpoint_seq, seq) and checkpoint_seq != seq:
+                # The log was reset.
+                return None
+            return state
+
+    def track(self, path: str):
+        """Note a file written since the last record."""
+        with self._lock:
+            path = os.path.relpath(path, self.data_dir)
+            if path not in self._pending_files:
+                self._pending_files.append(path)
+
+    def log(self, resume_time: datetime.datetime):
+        """Append a record: everything up to resume_time has been written."""
+        with self._lock:
+            if self._wal is None:
+                os.makedirs(self.data_dir, exist_ok=True)
+                self._wal = open(self.wal_file, "a", encoding="utf-8")
+            self._seq += 1
+            self._records += 1
+            record = {"seq": self._seq, "time": resume_time.isoformat(), "files": self._pending_files}
+            line = json.dumps(record) + "\n"
+            self._wal.write(line)
+            METRICS.count("bytes_written_total", len(line), kind="wal")
+            self._wal.flush()
+            self._unsynced_files.extend(p for p in self._pending_files if p not in self._unsynced_files)
+            self._pending_files = []
+            self._unsynced_records += 1
+        self.commit()
+
+    def commit(self, force: bool = False):
+        """Group commit: fsync now if forced or sync_interval has passed, else soon."""
+        with self._lock:
+            if not self._unsynced_records:
+                return
+            if force or time.monotonic() - self._synced_at >= self.sync_interval:
+                self.sync()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.sync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self):
+        """fsync the files listed in unsynced records, then the log itself."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._unsynced_records:
+                return
+            with METRICS.span("group_commit"):
+                directories = set()
+                for path in self._unsynced_files:
+                    path = os.path.join(self.data_dir, path)
+                    if os.path.exists(path):
+                        fsync_file(path)
+                        directories.add(os.path.dirname(path))
+                for directory in directories:
+                    fsync_directory(directory)
+                os.fsync(self._wal.fileno())
+            self._unsynced_files = []
+            self._unsynced_records = 0
+            self._synced_at = time.monotonic()
+
+    def checkpoint(self, resume_time: datetime.datetime, meter_ids: List[str], latest: np.ndarray):
+        """Persist the latest readings as of resume_time and truncate the log."""
+        with self._lock:
+            self.sync()
+            with atomic_write(self.checkpoint_file, "wb", sync=True) as f:
+                np.savez(f, meter_ids=np.array(meter_ids, dtype=str), latest=latest[:len(meter_ids)],
+                         time=np.array(resume_time.isoformat()), seq=np.array(self._seq))
+            if self._wal is not None:
+                self._wal.seek(0)
+                self._wal.truncate()
+                os.fsync(self._wal.fileno())
+            elif os.path.exists(self.wal_file):
+                os.remove(self.wal_file)
+            self._records = 0
+
+    def _close_log(self):
+        if self._wal is not None:
+            self.sync()
+            self._wal.close()
+            self._wal = None
+
+    def close(self):
+        with self._lock:
+            self._close_log()
+
+    def reset(self):
+        """Forget the log and the checkpoint."""
+        with self._lock:
+            self.close()
+            self._pending_files = []
+            for path in (self.wal_file, self.checkpoint_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._seq = 0
+            self._records = 0
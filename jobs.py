@@ -0,0 +1,197 @@
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from durability import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Progress is written to a job's file at most this often (seconds); status
+# changes are written at once.
+PROGRESS_SAVE_INTERVAL = 0.5
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """Whether another process with this pid is running."""
+    if not isinstance(pid, int) or pid == os.getpid() or os.name == "nt":
+        # On Windows signal 0 would interrupt the process instead of probing it.
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@dataclass
+class Job:
+    """A background task and its latest reported progress."""
+    job_id: str
+    kind: str
+    params: dict
+    status: str = "queued"
+    created_at: str = field(default_factory=lambda: datetime.datetime.now().isoformat(timespec="seconds"))
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    progress: dict = field(default_factory=dict)
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobManager:
+    """Runs jobs one at a time on a background thread and keeps recent ones.
+
+    With jobs_dir, every job is also saved as <job_id>.json whenever it
+    changes, so any worker process serving the same data can report it.
+    Unfinished jobs of processes that are gone are marked failed on startup,
+    and only the max_jobs most recent finished jobs are kept on disk.
+    """
+
+    def __init__(self, jobs_dir: Optional[str] = None, max_jobs: int = 100):
+        self.jobs_dir = jobs_dir
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job")
+        if jobs_dir is not None:
+            os.makedirs(jobs_dir, exist_ok=True)
+            self._mark_interrupted()
+            self._prune_files()
+
+    def _path(self, job_id: str) -> Optional[str]:
+        if self.jobs_dir is None or not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return None
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job: Job):
+        path = self._path(job.job_id)
+        if path is not None:
+            with atomic_write(path, "w", encoding="utf-8") as f:
+                # The owner's pid tells later processes whether the job can still finish.
+                json.dump(dict(job.to_dict(), pid=os.getpid()), f)
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        path = self._path(job_id)
+        saved = self._read(path) if path is not None else None
+        if saved is None:
+            return None
+        saved.pop("pid", None)
+        try:
+            return Job(**saved)
+        except TypeError:
+            return None
+
+    def _saved_jobs(self) -> List[Tuple[str, dict]]:
+        """(path, contents) of every job file, oldest first."""
+        paths = [
+            os.path.join(self.jobs_dir, name) for name in os.listdir(self.jobs_dir)
+            if name.endswith(".json") and self._path(name[:-5]) is not None
+        ]
+        saved = [(path, self._read(path)) for path in paths]
+        return sorted(((path, job) for path, job in saved if job is not None),
+                      key=lambda item: item[1].get("created_at") or "")
+
+    def _mark_interrupted(self):
+        """Fail the queued and running jobs whose process has exited."""
+        for path, saved in self._saved_jobs():
+            if saved.get("status") not in ("queued", "running") or _process_alive(saved.get("pid")):
+                continue
+            saved.update(status="failed", error="Interrupted: the server stopped before the job finished",
+                         finished_at=datetime.datetime.now().isoformat(timespec="seconds"))
+            with atomic_write(path, "w", encoding="utf-8") as f:
+                json.dump(saved, f)
+
+    def _prune_files(self):
+        """Remove the oldest finished job files beyond max_jobs."""
+        finished = [path for path, saved in self._saved_jobs() if saved.get("status") not in ("queued", "running")]
+        for path in finished[:max(0, len(finished) - self.max_jobs)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, kind: str, params: dict, task: Callable[[Callable[[dict], None]], dict]) -> Job:
+        """Queue task(report_progress) and return its job."""
+        job = Job(job_id=uuid.uuid4().hex, kind=kind, params=params)
+        self._save(job)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, task)
+        return job
+
+    def _run(self, job: Job, task: Callable[[Callable[[dict], None]], dict]):
+        saved_at = time.monotonic()
+
+        def report_progress(progress: dict):
+            nonlocal saved_at
+            job.progress = progress
+            if time.monotonic() - saved_at >= PROGRESS_SAVE_INTERVAL:
+                self._save(job)
+                saved_at = time.monotonic()
+
+        job.status = "running"
+        job.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self._save(job)
+        try:
+            job.result = task(report_progress)
+            job.status = "succeeded"
+        except Exception as e:
+            logger.exception("Job %s failed", job.job_id)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.datetime.now().isoformat(timespec="seconds")
+            self._save(job)
+            if self.jobs_dir is not None:
+                self._prune_files()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job of this process, or one another process saved under jobs_dir."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None else self._load(job_id)
+
+    def list(self) -> Dict[str, Job]:
+        with self._lock:
+            return dict(self._jobs)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,202 @@
+import contextlib
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from durability import atomic_write
+
+
+class ValidationError(ValueError):
+    """Raised by a writer that rejected its input before changing anything.
+
+    SystemLock.write lets it through without publishing a new version; any
+    other exception may leave a partial change and forces a reload.
+    """
+
+
+class ReadWriteLock:
+    """Any number of readers or a single writer, for the threads of one process.
+
+    Waiting writers keep new readers out so writes are not starved. The
+    writer may re-enter either side, and readers may nest reads.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def owns_write(self) -> bool:
+        return self._writer == threading.get_ident()
+
+    def _read_depth(self) -> int:
+        return getattr(self._local, "depth", 0)
+
+    def held(self) -> bool:
+        """Whether the current thread holds either side of the lock."""
+        return self.owns_write() or self._read_depth() > 0
+
+    @contextlib.contextmanager
+    def read(self) -> Iterator[None]:
+        if self.owns_write():
+            yield
+            return
+        depth = self._read_depth()
+        if not depth:
+            with self._cond:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if not depth:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self) -> Iterator[None]:
+        if self.owns_write():
+            yield
+            return
+        if self._read_depth():
+            raise RuntimeError("A read lock cannot be upgraded to a write lock")
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = threading.get_ident()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, shared by every process using it."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[None]:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.05)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+class SystemLock:
+    """Single writer across threads and processes, parallel readers within a process.
+
+    Writers hold the thread lock exclusively plus lock_file, and replace the
+    token in version_file when they are done. A process that finds a token
+    it did not write calls refresh(full) holding both locks before going on,
+    so every worker sees the writes of the others. full is set when nothing
+    was loaded yet or a write failed halfway, and the state must be reloaded
+    from scratch.
+
+    version counts the changes of the in-memory state: it goes up after every
+    write and every refresh, so a result computed under read() stays valid
+    for as long as version has not moved.
+    """
+
+    def __init__(self, lock_file: str, version_file: str, refresh: Callable[[bool], None]):
+        self.file_lock = FileLock(lock_file)
+        self.version_file = version_file
+        self.refresh = refresh
+        self._rw = ReadWriteLock()
+        # None until the state has been loaded, and again after a failed write.
+        self._version: Optional[str] = None
+        self.version = 0
+
+    def _read_version(self) -> Optional[str]:
+        try:
+            with open(self.version_file, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _publish(self) -> str:
+        token = uuid.uuid4().hex
+        with atomic_write(self.version_file, "w", encoding="utf-8") as f:
+            f.write(token)
+        return token
+
+    def _stale(self) -> bool:
+        return self._version is None or self._read_version() != self._version
+
+    def _refresh_if_stale(self):
+        if self._stale():
+            self.refresh(self._version is None)
+            self._version = self._read_version() or self._publish()
+            self.version += 1
+
+    def sync(self):
+        """Bring the in-memory state up to date with the data directory."""
+        with self._rw.write(), self.file_lock.acquire():
+            self._refresh_if_stale()
+
+    @contextlib.contextmanager
+    def read(self) -> Iterator[None]:
+        if not self._rw.held() and self._stale():
+            self.sync()
+        with self._rw.read():
+            yield
+
+    @contextlib.contextmanager
+    def write(self) -> Iterator[None]:
+        """Hold the writer lock; other processes reload afterwards."""
+        if self._rw.owns_write():
+            yield
+            return
+        with self._rw.write(), self.file_lock.acquire():
+            self._refresh_if_stale()
+            try:
+                yield
+            except ValidationError:
+                raise
+            except BaseException:
+                # The in-memory state may be half updated; reload it from disk next time.
+                self._version = None
+                self._publish()
+                self.version += 1
+                raise
+            self._version = self._publish()
+            self.version += 1
@@ -0,0 +1,85 @@
+import argparse
+import csv
+import datetime
+import os
+import sys
+
+from storage import DAILY_STORAGES, convert_daily_files
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def convert_readings(args):
+    """Rewrite the existing daily reading files in another storage format."""
+    daily_readings_dir = os.path.join(args.base_dir, "data", "daily_readings")
+    written = convert_daily_files(daily_readings_dir, args.to, remove_source=not args.keep_source)
+    print(f"Converted {len(written)} daily files to {args.to}")
+
+
+def verify_aggregates(args):
+    """Check a month's running aggregates against a full recompute."""
+    from app import SmartMeterSystem
+
+    month = datetime.datetime.strptime(args.month, "%Y-%m")
+    mismatches = SmartMeterSystem(args.base_dir).verify_monthly_aggregates(month)
+    if mismatches:
+        print(f"{len(mismatches)} meters differ: {', '.join(mismatches[:10])}")
+        return 1
+    print(f"Running aggregates for {args.month} match the daily files")
+    return 0
+
+
+def import_meters(args):
+    """Register the meters listed in a CSV file (meter_ID,area,dwelling)."""
+    from app import BulkRegistrationError, SmartMeterSystem
+
+    with open(args.csv_file, "r", encoding="utf-8", newline="") as f:
+        header = f.readline()
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        f.seek(0)
+        records = list(csv.DictReader(f, delimiter=delimiter))
+
+    system = SmartMeterSystem(args.base_dir)
+    batch_size = args.batch_size or len(records) or 1
+    registered = 0
+    for start in range(0, len(records), batch_size):
+        try:
+            registered += len(system.register_meters_bulk(records[start:start + batch_size]))
+        except BulkRegistrationError as e:
+            for error in e.errors[:20]:
+                print(f"row {start + error['row'] + 2}: {error['meterId']}: {error['error']}")
+            print(f"Batch starting at row {start + 2} rejected; {registered} meters registered")
+            return 1
+    # Persist the seeded zero readings.
+    with system.lock.write():
+        if len(system.reading_store):
+            system._process_daily_data(system.reading_store.last_time())
+    print(f"Registered {registered} meters")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Smart meter data maintenance tasks.")
+    parser.add_argument("--base-dir", default=BASE_DIR, help="Directory that contains data/")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert-readings", help="Convert readings_YYYYMMDD.* files")
+    convert.add_argument("--to", required=True, choices=sorted(DAILY_STORAGES), help="Target storage format")
+    convert.add_argument("--keep-source", action="store_true", help="Keep the files that were converted")
+    convert.set_defaults(handler=convert_readings)
+
+    verify = commands.add_parser("verify-aggregates", help="Recompute a month and compare")
+    verify.add_argument("--month", required=True, help="Month to check, YYYY-MM")
+    verify.set_defaults(handler=verify_aggregates)
+
+    importer = commands.add_parser("import-meters", help="Register meters from a CSV file")
+    importer.add_argument("csv_file", help="CSV with meter_ID, area and dwelling columns")
+    importer.add_argument("--batch-size", type=int, default=0, help="Meters per transaction (default: all)")
+    importer.set_defaults(handler=import_meters)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import bisect
+import contextlib
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+# Upper bounds (seconds) of the span duration histogram buckets.
+SPAN_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: Labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Metrics:
+    """Counters, gauges and duration histograms in the Prometheus text format.
+
+    While disabled, span() hands out one shared no-op context manager and
+    count()/observe() return at once, so instrumented code pays about one
+    attribute check.
+    """
+
+    def __init__(self, prefix: str = "meter", enabled: bool = True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # Per label set: bucket counts (the last one above every bound), then sum and count.
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._help[name] = (kind, help_text)
+
+    def count(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, labels: Labels = ()):
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(labels)
+            if values is None:
+                values = series[labels] = [0] * (len(SPAN_BUCKETS) + 3)
+            values[bisect.bisect_left(SPAN_BUCKETS, seconds)] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def span(self, name: str, **labels):
+        """Time a block into the span_seconds histogram, labelled span=name."""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, "span_seconds", (("span", name),) + tuple(sorted(labels.items())))
+
+    def timed(self, name: str):
+        """Decorator form of span()."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def gauge(self, name: str, read: Callable[[], float], help_text: str):
+        """A value read when the metrics are rendered, e.g. a cache size."""
+        self.describe(name, "gauge", help_text)
+        self._gauges[name] = read
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    @staticmethod
+    def _labels(labels: Labels, extra: str = "") -> str:
+        parts = [
+            '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, value in labels
+        ]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    @staticmethod
+    def _number(value: float) -> str:
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+    def _header(self, lines: List[str], name: str, default_kind: str):
+        kind, help_text = self._help.get(name, (default_kind, ""))
+        if help_text:
+            lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {labels: list(v) for labels, v in series.items()}
+                          for name, series in self._histograms.items()}
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, "counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{self.prefix}_{name}{self._labels(labels)} {self._number(value)}")
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, "histogram")
+            full = f"{self.prefix}_{name}"
+            for labels, values in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket in zip(SPAN_BUCKETS + (float("inf"),), values):
+                    cumulative += bucket
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                    lines.append(f"{full}_bucket{self._labels(labels, le)} {cumulative}")
+                lines.append(f"{full}_sum{self._labels(labels)} {values[-2]:.6f}")
+                lines.append(f"{full}_count{self._labels(labels)} {values[-1]}")
+        for name, read in sorted(self._gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            self._header(lines, name, "gauge")
+            lines.append(f"{self.prefix}_{name} {self._number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by the instrumented modules.
+METRICS = Metrics()
+METRICS.describe("span_seconds", "histogram", "Time spent in instrumented stages.")
+METRICS.describe("readings_generated_total", "counter", "Meter readings generated.")
+METRICS.describe("bytes_written_total", "counter", "Bytes written to data files, by file type.")
+METRICS.describe("files_written_total", "counter", "Data files written, by file type.")
+METRICS.describe("http_requests_total", "counter", "HTTP requests by endpoint and status.")
+METRICS.describe("http_request_seconds", "histogram", "HTTP request duration by endpoint.")
+METRICS.describe("result_cache_total", "counter", "Read endpoint cache lookups, by outcome.")
+METRICS.describe("result_cache_evictions_total", "counter", "Responses evicted from the read endpoint cache.")
+METRICS.describe("anomalies_total", "counter", "Meter-days flagged by the anomaly detector, by kind.")
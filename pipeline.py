@@ -0,0 +1,196 @@
+import datetime
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Callable, List, Optional, TextIO
+
+import numpy as np
+
+from generation import ShardedGenerator
+from metrics import METRICS
+from storage import DailyReadings, DailyStorage, existing_daily_file, read_daily_file
+
+
+@dataclass
+class ReadingBlock:
+    """Readings of several meters for consecutive slots of one day (slots x meters)."""
+    slot_times: List[datetime.datetime]
+    meter_ids: List[str]
+    meter_index: np.ndarray
+    values: np.ndarray
+
+    @property
+    def size(self) -> int:
+        return self.values.size
+
+
+@dataclass
+class MaintenanceWindow:
+    """The 00:00-01:00 maintenance hour at the start of a day."""
+    time: datetime.datetime
+
+
+@dataclass
+class WindowEnd:
+    """End of one (at most one day long) generation window."""
+    time: datetime.datetime
+
+
+@dataclass
+class MonthStart:
+    """First maintenance hour of a month, when older months are archived."""
+    time: datetime.datetime
+
+
+@dataclass
+class FastForwardMonth:
+    """A whole month summarized per day instead of generated reading by reading.
+
+    first, last and total hold the first value, last value and sum of every
+    day's readings (days x meters); previous is the latest value before the
+    month.
+    """
+    month: datetime.datetime
+    meter_ids: List[str]
+    meter_index: np.ndarray
+    previous: np.ndarray
+    first: np.ndarray
+    last: np.ndarray
+    total: np.ndarray
+    slots_per_day: int
+
+    @property
+    def days(self) -> int:
+        return len(self.last)
+
+    @property
+    def size(self) -> int:
+        """Number of readings the month stands for."""
+        return self.last.size * self.slots_per_day
+
+    @property
+    def end(self) -> datetime.datetime:
+        return self.month + datetime.timedelta(days=self.days)
+
+    @property
+    def final(self) -> np.ndarray:
+        return self.last[-1]
+
+    @property
+    def usage(self) -> np.ndarray:
+        """Consumption of every day (days x meters)."""
+        return np.diff(np.vstack((self.previous[None, :], self.last)), axis=0)
+
+
+@dataclass
+class SafePoint:
+    """Everything before time has reached the sinks; collection can resume from time.
+
+    checkpoint forces a checkpoint, needed when the latest values changed
+    without any daily file being written.
+    """
+    time: datetime.datetime
+    checkpoint: bool = False
+
+
+class ReadingSink:
+    """Consumer of the reading pipeline; every hook is optional."""
+
+    def on_block(self, block: ReadingBlock):
+        pass
+
+    def on_day(self, readings: DailyReadings):
+        pass
+
+    def on_month_start(self, time: datetime.datetime):
+        pass
+
+    def on_fast_forward(self, month: FastForwardMonth):
+        pass
+
+    def flush(self):
+        """Called when a collection finishes."""
+        pass
+
+    def close(self):
+        pass
+
+
+class DailyFileSink(ReadingSink):
+    """Writes each flushed day to its daily file, appending to a partial day.
+
+    With workers, formats that can (encode_meters) are encoded one meter
+    range per worker and the main process writes the joined file.
+    """
+
+    def __init__(self, storage: DailyStorage, path_for: Callable[[datetime.date], str],
+                 workers: Optional[ShardedGenerator] = None):
+        self.storage = storage
+        self.path_for = path_for
+        self.workers = workers
+
+    def on_day(self, readings: DailyReadings):
+        daily_file = self.path_for(readings.date)
+        os.makedirs(os.path.dirname(daily_file), exist_ok=True)
+        # The partial day may have been written in another format before a conversion.
+        existing = existing_daily_file(daily_file)
+        if existing is not None:
+            with METRICS.span("read_day", format=self.storage.name):
+                readings = read_daily_file(existing).merged(readings)
+        with METRICS.span("write_day", format=self.storage.name):
+            if self.workers is not None and hasattr(self.storage, "encode_meters"):
+                parts = self.workers.map(self.storage.encode_meters, readings.shards(self.workers.workers))
+                self.storage.write_encoded(daily_file, parts)
+            else:
+                self.storage.write_day(daily_file, readings)
+        if existing is not None and existing != daily_file:
+            os.remove(existing)
+
+
+class CallbackSink(ReadingSink):
+    """Forwards flushed days, and optionally fast-forwarded months, to functions."""
+
+    def __init__(self, on_day: Callable[[DailyReadings], None],
+                 on_fast_forward: Optional[Callable[[FastForwardMonth], None]] = None):
+        self._on_day = on_day
+        self._on_fast_forward = on_fast_forward
+
+    def on_day(self, readings: DailyReadings):
+        self._on_day(readings)
+
+    def on_fast_forward(self, month: FastForwardMonth):
+        if self._on_fast_forward is not None:
+            self._on_fast_forward(month)
+
+
+class NdjsonSink(ReadingSink):
+    """Streams every reading as one JSON object per line.
+
+    Fast-forwarded months have no individual readings and are not exported.
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    @classmethod
+    def open(cls, target: str) -> "NdjsonSink":
+        """Sink writing to a file path (appending), or to stdout for "-"."""
+        return cls(sys.stdout if target == "-" else open(target, "a", encoding="utf-8"))
+
+    def on_block(self, block: ReadingBlock):
+        ids = [json.dumps(meter_id) for meter_id in block.meter_ids]
+        for reading_time, row in zip(block.slot_times, np.round(block.values, 3).tolist()):
+            time_str = reading_time.isoformat()
+            self.stream.write("".join(
+                f'{{"meter_ID": {meter_id}, "reading_time": "{time_str}", "meter_value": {value}}}\n'
+                for meter_id, value in zip(ids, row)
+            ))
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
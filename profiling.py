@@ -0,0 +1,73 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+PROFILERS = ("cprofile", "sample")
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval from a helper thread.
+
+    The result is in the collapsed-stack format used by flame graph tools:
+    one "outer;...;inner count" line per distinct stack, busiest first.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stopped.set()
+        self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class DeterministicProfiler:
+    """cProfile of the calling thread, reported as the top functions by cumulative time."""
+
+    def __init__(self, limit: int = 60):
+        self.limit = limit
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self) -> str:
+        self._profile.disable()
+        out = io.StringIO()
+        pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(self.limit)
+        return out.getvalue()
+
+
+def make_profiler(kind: str):
+    """A started profiler of one of PROFILERS."""
+    if kind == "cprofile":
+        profiler = DeterministicProfiler()
+    elif kind == "sample":
+        profiler = SamplingProfiler()
+    else:
+        raise ValueError(f"Invalid profiler, expected one of: {', '.join(PROFILERS)}")
+    profiler.start()
+    return profiler
@@ -0,0 +1,157 @@
+import datetime
+import sys
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Reading times are stored as whole minutes since the simulation start.
+STORE_EPOCH = datetime.datetime(2024, 5, 1)
+
+
+@dataclass
+class ReadingBatch:
+    """Column view of the readings flushed from a ReadingStore."""
+    meter_ids: List[str]
+    meter_index: np.ndarray  # int32, position in meter_ids
+    offsets: np.ndarray      # int32, minutes since STORE_EPOCH
+    values: np.ndarray       # float64, cumulative meter value
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def time_to_offset(reading_time: datetime.datetime) -> int:
+    """Convert a reading time to minutes since STORE_EPOCH."""
+    return int((reading_time - STORE_EPOCH).total_seconds() // 60)
+
+
+def offset_to_time(offset: int) -> datetime.datetime:
+    """Convert minutes since STORE_EPOCH to a reading time."""
+    return STORE_EPOCH + datetime.timedelta(minutes=int(offset))
+
+
+class ReadingStore:
+    """Array-backed buffer of pending readings and the latest value per meter.
+
+    Each buffered reading costs 16 bytes (int32 meter index, int32 minute
+    offset, float64 value) instead of a MeterReading object holding an ISO
+    time string.
+    """
+
+    BYTES_PER_READING = 4 + 4 + 8
+
+    def __init__(self, capacity: int = 1024):
+        self.meter_index: Dict[str, int] = {}
+        self.meter_ids: List[str] = []
+        self.latest = np.zeros(0, dtype=np.float64)
+        # Size of the meter ID strings, kept so the footprint is cheap to read.
+        self._id_bytes = 0
+
+        self._meter = np.empty(capacity, dtype=np.int32)
+        self._offset = np.empty(capacity, dtype=np.int32)
+        self._value = np.empty(capacity, dtype=np.float64)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add_meter(self, meter_id: str) -> int:
+        """Return the index of a meter, assigning a new one if needed."""
+        index = self.meter_index.get(meter_id)
+        if index is None:
+            index = len(self.meter_ids)
+            self.meter_index[meter_id] = index
+            self.meter_ids.append(meter_id)
+            self._id_bytes += sys.getsizeof(meter_id)
+            if index >= len(self.latest):
+                grown = np.zeros(max(16, 2 * len(self.latest)), dtype=np.float64)
+                grown[:len(self.latest)] = self.latest
+                self.latest = grown
+        return index
+
+    def indices(self, meter_ids: List[str]) -> np.ndarray:
+        """Map meter IDs to store indices, registering unknown ones."""
+        # Meters are usually listed in registration order, the store's order.
+        if self.meter_ids[:len(meter_ids)] == meter_ids:
+            return np.arange(len(meter_ids), dtype=np.int32)
+        return np.fromiter((self.add_meter(meter_id) for meter_id in meter_ids), dtype=np.int32)
+
+    def _reserve(self, count: int):
+        required = self._size + count
+        if required <= len(self._value):
+            return
+        capacity = max(required, 2 * len(self._value))
+        for name in ("_meter", "_offset", "_value"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def append(self, meter_id: str, reading_time: datetime.datetime, meter_value: float):
+        """Buffer a single reading and make it the meter's latest value."""
+        index = self.add_meter(meter_id)
+        self._reserve(1)
+        self._meter[self._size] = index
+        self._offset[self._size] = time_to_offset(reading_time)
+        self._value[self._size] = meter_value
+        self._size += 1
+        self.latest[index] = meter_value
+
+    def append_block(self, slot_times: List[datetime.datetime], meter_index: np.ndarray, values: np.ndarray):
+        """Buffer a slots x meters block of readings in slot-major order."""
+        count = values.size
+        if not count:
+            return
+        self._reserve(count)
+        end = self._size + count
+        offsets = np.fromiter((time_to_offset(t) for t in slot_times), dtype=np.int32, count=len(slot_times))
+        self._meter[self._size:end] = np.tile(meter_index, len(slot_times))
+        self._offset[self._size:end] = np.repeat(offsets, len(meter_index))
+        self._value[self._size:end] = values.ravel()
+        self._size = end
+        self.latest[meter_index] = values[-1]
+
+    def last_time(self) -> Optional[datetime.datetime]:
+        """Time of the most recently buffered reading."""
+        if not self._size:
+            return None
+        return offset_to_time(self._offset[self._size - 1])
+
+    def flush(self) -> ReadingBatch:
+        """Return the buffered readings and clear the buffer."""
+        batch = ReadingBatch(
+            meter_ids=list(self.meter_ids),
+            meter_index=self._meter[:self._size].copy(),
+            offsets=self._offset[:self._size].copy(),
+            values=self._value[:self._size].copy()
+        )
+        self.clear()
+        return batch
+
+    def clear(self):
+        """Drop the buffered readings, keeping meters and latest values."""
+        self._size = 0
+
+    def reset(self):
+        """Forget all meters, latest values and buffered readings."""
+        self.meter_index.clear()
+        self.meter_ids.clear()
+        self.latest = np.zeros(0, dtype=np.float64)
+        self._id_bytes = 0
+        self.clear()
+
+    def memory_footprint(self) -> dict:
+        """Approximate memory used by the store, in bytes."""
+        buffer_bytes = self._meter.nbytes + self._offset.nbytes + self._value.nbytes
+        index_bytes = sys.getsizeof(self.meter_index) + sys.getsizeof(self.meter_ids) + self._id_bytes
+        return {
+            "meters": len(self.meter_ids),
+            "pending_readings": self._size,
+            "bytes_per_reading": self.BYTES_PER_READING,
+            "buffer_bytes": buffer_bytes,
+            "buffer_used_bytes": self._size * self.BYTES_PER_READING,
+            "latest_bytes": self.latest.nbytes,
+            "index_bytes": index_bytes,
+            "total_bytes": buffer_bytes + self.latest.nbytes + index_bytes
+        }
@@ -0,0 +1,475 @@
+import calendar
+import datetime
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from accounts import AccountRegistry
+from cube import ConsumptionCube
+from durability import atomic_write
+from storage import DailyReadings
+
+TIERS = ("hourly", "daily", "monthly")
+GROUP_KEYS = ("area", "dwelling")
+
+# Days each tier is kept for; None keeps it forever.
+DEFAULT_RETENTION: Dict[str, Optional[int]] = {"hourly": 92, "daily": 400, "monthly": None}
+
+
+class RollupTable:
+    """Consumption of many meters over the buckets of one period (meters x buckets).
+
+    Buckets without data are NaN. last holds the latest cumulative value of
+    every meter, used as the baseline of readings flushed afterwards.
+    """
+
+    def __init__(self, buckets: int):
+        self.meter_ids: List[str] = []
+        self.meter_index: Dict[str, int] = {}
+        self.usage = np.full((0, buckets), np.nan, dtype=np.float32)
+        self.last = np.zeros(0)
+        # Per (area, dwelling) totals, filled in when the table is saved.
+        self.groups: List[Tuple[str, str]] = []
+        self.group_usage = np.zeros((0, buckets))
+        self.group_meters = np.zeros(0, dtype=np.int64)
+        # Group of every row in the registry's numbering, extended as rows are
+        # added and recomputed when the registry changes.
+        self._group_version: Optional[int] = None
+        self._group_keys: List[Tuple[str, str]] = []
+        self._group_codes = np.zeros(0, dtype=np.int64)
+        self._group_rows: Optional[np.ndarray] = None
+        # meter_ids as saved, extended when meters are added.
+        self._id_array = np.zeros(0, dtype=str)
+
+    def rows(self, meter_ids: List[str]) -> np.ndarray:
+        """Row of every meter, -1 if the table has none."""
+        # Days usually list the meters in the same order as the table.
+        if self.meter_ids[:len(meter_ids)] == meter_ids:
+            return np.arange(len(meter_ids))
+        return np.fromiter((self.meter_index.get(m, -1) for m in meter_ids), dtype=np.int64, count=len(meter_ids))
+
+    def indices(self, meter_ids: List[str]) -> np.ndarray:
+        """Rows of meter_ids, adding the meters the table does not have yet."""
+        if self.meter_ids[:len(meter_ids)] == meter_ids:
+            return np.arange(len(meter_ids))
+        new = [m for m in dict.fromkeys(meter_ids) if m not in self.meter_index]
+        if new:
+            self.meter_index.update(zip(new, range(len(self.meter_ids), len(self.meter_ids) + len(new))))
+            self.meter_ids.extend(new)
+            grow = len(new)
+            self.usage = np.vstack((self.usage, np.full((grow, self.usage.shape[1]), np.nan, dtype=np.float32)))
+            self.last = np.concatenate((self.last, np.full(grow, np.nan)))
+        return self.rows(meter_ids)
+
+    def set_column(self, bucket: int, meter_ids: List[str], usage: np.ndarray):
+        rows = self.indices(meter_ids)
+        self.usage[rows, bucket] = usage
+
+    def group_codes(self, groups: AccountRegistry) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        """(area, dwelling) groups and the group of every row, -1 for meters without an account."""
+        if self._group_version != groups.version:
+            self._group_codes = np.zeros(0, dtype=np.int64)
+        known = len(self._group_codes)
+        if known < len(self.meter_ids):
+            self._group_keys, codes = groups.group_codes(self.meter_ids[known:])
+            self._group_codes = np.concatenate((self._group_codes, codes))
+            self._group_version = groups.version
+            self._group_rows = None
+        return self._group_keys, self._group_codes
+
+    def _summarize_groups(self, groups: AccountRegistry):
+        keys, codes = self.group_codes(groups)
+        # Meters without an account are summed up as ("", "").
+        keys = keys + [("", "")]
+        codes = np.where(codes < 0, len(keys) - 1, codes)
+        meters = np.bincount(codes, minlength=len(keys))
+        present = np.flatnonzero(meters)
+        self.groups = [keys[g] for g in present.tolist()]
+        self.group_meters = meters[present]
+        if not len(present):
+            self.group_usage = np.zeros((0, self.usage.shape[1]))
+            return
+        # Rows sorted by group, each group's rows summed in one pass. Group totals
+        # stay in float64: summed over many meters, float32 loses whole kWh.
+        if self._group_rows is None:
+            self._group_rows = np.argsort(codes, kind="stable")
+        rows = self._group_rows
+        starts = np.cumsum(self.group_meters) - self.group_meters
+        self.group_usage = np.add.reduceat(
+            np.nan_to_num(self.usage[rows]), starts, axis=0, dtype=np.float64
+        )
+
+    def save(self, path: str, groups: AccountRegistry):
+        self._summarize_groups(groups)
+        if len(self._id_array) != len(self.meter_ids):
+            self._id_array = np.array(self.meter_ids, dtype=str)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path, "wb") as f:
+            np.savez(
+                f, meter_ids=self._id_array, usage=self.usage, last=self.last,
+                groups=np.array(["\t".join(key) for key in self.groups], dtype=str),
+                group_usage=self.group_usage, group_meters=self.group_meters
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "RollupTable":
+        with np.load(path) as data:
+            table = cls(data["usage"].shape[1])
+            table._id_array = data["meter_ids"]
+            table.meter_ids = table._id_array.tolist()
+            table.usage = data["usage"]
+            table.last = data["last"]
+            table.groups = [tuple(key.split("\t")) for key in data["groups"].tolist()]
+            table.group_usage = data["group_usage"].astype(np.float64)
+            table.group_meters = data["group_meters"]
+        table.meter_index = {meter_id: i for i, meter_id in enumerate(table.meter_ids)}
+        return table
+
+
+class RollupStore:
+    """Hourly, daily and monthly consumption tiers, updated as days are flushed.
+
+    hourly/YYYYMM/hourly_YYYYMMDD.npz holds a day (24 buckets),
+    daily/daily_YYYYMM.npz a month (one bucket per day) and
+    monthly/monthly_YYYY.npz a year (12 buckets). Usage since a meter's
+    previous reading is counted in the hour its reading ends. Every tier also
+    keeps totals per (area, dwelling), numbered by the account registry, and
+    is pruned by its own retention. The tables of the latest day, month and
+    year written stay in memory between flushes.
+    The daily tier feeds the analytics cube, which is kept for good.
+    Fast-forwarded days only have daily usage; baseline/baseline_YYYYMMDD.npz
+    keeps the latest values after them, pruned like the hourly tier.
+    """
+
+    def __init__(self, rollup_dir: str, groups: AccountRegistry,
+                 retention: Optional[Dict[str, Optional[int]]] = None):
+        self.rollup_dir = rollup_dir
+        self.groups = groups
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.cube = ConsumptionCube(os.path.join(rollup_dir, "cube"))
+        # Latest hourly table, the baseline of the next flushed day.
+        self._latest: Optional[Tuple[datetime.date, RollupTable]] = None
+        # (path, table) last written per tier.
+        self._tables: Dict[str, Tuple[str, RollupTable]] = {}
+
+    def _hourly_path(self, date: datetime.date) -> str:
+        return os.path.join(self.rollup_dir, "hourly", date.strftime("%Y%m"), f"hourly_{date.strftime('%Y%m%d')}.npz")
+
+    def _daily_path(self, date: datetime.date) -> str:
+        return os.path.join(self.rollup_dir, "daily", f"daily_{date.strftime('%Y%m')}.npz")
+
+    def _monthly_path(self, date: datetime.date) -> str:
+        return os.path.join(self.rollup_dir, "monthly", f"monthly_{date.year}.npz")
+
+    def _baseline_path(self, date: datetime.date) -> str:
+        return os.path.join(self.rollup_dir, "baseline", f"baseline_{date.strftime('%Y%m%d')}.npz")
+
+    def _table(self, tier: str, path: str, buckets: int) -> RollupTable:
+        """A tier's table for path, kept in memory while it is the latest one of the tier."""
+        cached = self._tables.get(tier)
+        if cached is None or cached[0] != path:
+            table = RollupTable.load(path) if os.path.exists(path) else RollupTable(buckets)
+            cached = self._tables[tier] = (path, table)
+        return cached[1]
+
+    def _hourly_dates(self) -> List[datetime.date]:
+        hourly_dir = os.path.join(self.rollup_dir, "hourly")
+        if not os.path.isdir(hourly_dir):
+            return []
+        return sorted(
+            datetime.datetime.strptime(name[7:15], "%Y%m%d").date()
+            for month in os.listdir(hourly_dir) if os.path.isdir(os.path.join(hourly_dir, month))
+            for name in os.listdir(os.path.join(hourly_dir, month)) if name.startswith("hourly_")
+        )
+
+    def _baseline_dates(self) -> List[datetime.date]:
+        baseline_dir = os.path.join(self.rollup_dir, "baseline")
+        if not os.path.isdir(baseline_dir):
+            return []
+        return sorted(
+            datetime.datetime.strptime(name[9:17], "%Y%m%d").date()
+            for name in os.listdir(baseline_dir) if name.startswith("baseline_")
+        )
+
+    def _baseline_table(self, date: datetime.date) -> Optional[RollupTable]:
+        """Hourly table, or fast-forward baseline, of the latest day before date."""
+        if self._latest is not None and self._latest[0] < date:
+            return self._latest[1]
+        earlier = sorted(
+            [(d, self._hourly_path(d)) for d in self._hourly_dates() if d < date]
+            + [(d, self._baseline_path(d)) for d in self._baseline_dates() if d < date]
+        )
+        return RollupTable.load(earlier[-1][1]) if earlier else None
+
+    def _rolled_up_columns(self, tier: str) -> Dict[str, List[int]]:
+        """Buckets with data of every kept table of a tier, by file name."""
+        tier_dir = os.path.join(self.rollup_dir, tier)
+        if not os.path.isdir(tier_dir):
+            return {}
+        columns = {}
+        for name in sorted(os.listdir(tier_dir)):
+            if name.endswith(".npz"):
+                usage = RollupTable.load(os.path.join(tier_dir, name)).usage
+                columns[name] = np.flatnonzero(~np.isnan(usage).all(axis=0)).tolist()
+        return columns
+
+    def missing_days(self, dates: Iterable[datetime.date]) -> List[datetime.date]:
+        """Those of dates that no tier has rolled up, in date order.
+
+        A day counts as rolled up if it has an hourly table, a fast-forward
+        baseline or a daily bucket, or, once its month's daily table has been
+        pruned, if the monthly tier has its month.
+        """
+        covered = set(self._hourly_dates()) | set(self._baseline_dates())
+        daily = self._rolled_up_columns("daily")
+        for name, days in daily.items():
+            first = datetime.datetime.strptime(name[6:12], "%Y%m").date()
+            covered.update(first.replace(day=day + 1) for day in days)
+        months = {
+            (int(name[8:12]), month + 1)
+            for name, columns in self._rolled_up_columns("monthly").items() for month in columns
+        }
+        return sorted(
+            date for date in set(dates)
+            if date not in covered and not (
+                (date.year, date.month) in months and f"daily_{date.strftime('%Y%m')}.npz" not in daily
+            )
+        )
+
+    def fast_forwarded_from(self, date: datetime.date) -> bool:
+        """Whether fast-forwarded days from date on have been rolled up."""
+        return any(d >= date for d in self._baseline_dates())
+
+    def add_day(self, readings: DailyReadings) -> List[str]:
+        """Fold (part of) a flushed day into every tier; returns the files written."""
+        date = readings.date
+        if not len(readings):
+            return []
+        hourly_path = self._hourly_path(date)
+        day = self._table("hourly", hourly_path, 24)
+        rows = day.indices(readings.meter_ids)
+
+        # Each meter continues from this day's earlier part, else from the day before.
+        baseline = day.last[rows]
+        missing = np.isnan(baseline)
+        previous = self._baseline_table(date) if missing.any() else None
+        if previous is not None:
+            previous_rows = previous.rows(readings.meter_ids)
+            fill = missing & (previous_rows >= 0)
+            baseline[fill] = previous.last[previous_rows[fill]]
+        first = readings.first_values()
+        baseline = np.where(np.isnan(baseline), first, baseline)
+
+        values = np.asarray(readings.values, dtype=np.float64)
+        before = np.empty_like(values)
+        before[1:] = values[:-1]
+        before[readings.starts[:-1]] = baseline
+        hours = np.clip((np.asarray(readings.minutes, dtype=np.int64) - 1) // 60, 0, 23)
+        cells = np.repeat(rows, np.diff(readings.starts)) * 24 + hours
+        usage = np.bincount(cells, weights=values - before, minlength=day.usage.size).reshape(day.usage.shape)
+        touched = np.zeros(day.usage.size, dtype=bool)
+        touched[cells] = True
+        touched = touched.reshape(day.usage.shape)
+        day.usage[touched] = np.nan_to_num(day.usage[touched]) + usage[touched]
+        day.last[rows] = readings.last_values()
+        day.save(hourly_path, self.groups)
+        self._latest = (date, day) if self._latest is None or self._latest[0] <= date else self._latest
+        return [hourly_path] + self._roll_up(date, day)
+
+    def _roll_up(self, date: datetime.date, day: RollupTable) -> List[str]:
+        """Recompute the day's bucket in the daily tier and the month's in the monthly tier."""
+        daily_path = self._daily_path(date)
+        month = self._table("daily", daily_path, 31)
+        month.set_column(date.day - 1, day.meter_ids, np.nansum(day.usage, axis=1))
+        month.save(daily_path, self.groups)
+        cube_path = self.cube.set_day(date, month.usage[:, date.day - 1], *month.group_codes(self.groups))
+        return [daily_path, cube_path, self._roll_up_month(date, month)]
+
+    def _roll_up_month(self, date: datetime.date, month: RollupTable) -> str:
+        """Recompute the month's bucket in the monthly tier from its daily table."""
+        monthly_path = self._monthly_path(date)
+        year = self._table("monthly", monthly_path, 12)
+        year.set_column(date.month - 1, month.meter_ids, np.nansum(month.usage, axis=1))
+        year.save(monthly_path, self.groups)
+        return monthly_path
+
+    def add_days(self, first: datetime.date, meter_ids: List[str], usage: np.ndarray,
+                 last: np.ndarray) -> List[str]:
+        """Set the usage of consecutive days of one month (days x meters) without hourly data.
+
+        last is every meter's value after the last day, the baseline of the
+        next flushed day. Returns the files written.
+        """
+        dates = [first + datetime.timedelta(days=d) for d in range(len(usage))]
+        baseline = RollupTable(0)
+        rows = baseline.indices(meter_ids)
+        baseline.last[rows] = last
+        # Written first, so that discard_from() finds the days after an interruption.
+        baseline_path = self._baseline_path(dates[-1])
+        baseline.save(baseline_path, self.groups)
+        if self._latest is None or self._latest[0] <= dates[-1]:
+            self._latest = (dates[-1], baseline)
+
+        daily_path = self._daily_path(first)
+        month = self._table("daily", daily_path, 31)
+        rows, columns = month.indices(meter_ids), [date.day - 1 for date in dates]
+        month.usage[np.ix_(rows, columns)] = usage.T
+        month.save(daily_path, self.groups)
+        cube_paths = self.cube.set_days(dates, month.usage[:, columns].T, *month.group_codes(self.groups))
+        return [baseline_path, daily_path] + cube_paths + [self._roll_up_month(first, month)]
+
+    def discard_from(self, date: datetime.date):
+        """Drop the rolled-up data of date and later days."""
+        self._latest = None
+        self._tables = {}
+        for day in self._hourly_dates():
+            if day >= date:
+                os.remove(self._hourly_path(day))
+        for day in self._baseline_dates():
+            if day >= date:
+                os.remove(self._baseline_path(day))
+        daily_dir = os.path.join(self.rollup_dir, "daily")
+        if not os.path.isdir(daily_dir):
+            return
+        for name in sorted(os.listdir(daily_dir)):
+            if not name.endswith(".npz") or self._period_end("daily", name) < date:
+                continue
+            daily_path = os.path.join(daily_dir, name)
+            month = RollupTable.load(daily_path)
+            first = datetime.datetime.strptime(name[6:12], "%Y%m").date()
+            columns = [
+                day for day in np.flatnonzero(~np.isnan(month.usage).all(axis=0)).tolist()
+                if first.replace(day=day + 1) >= date
+            ]
+            if not columns:
+                continue
+            month.usage[:, columns] = np.nan
+            month.save(daily_path, self.groups)
+            self.cube.set_days([first.replace(day=day + 1) for day in columns], month.usage[:, columns].T,
+                               *month.group_codes(self.groups))
+            self._roll_up_month(first, month)
+
+    def daily_usage(self, start: datetime.date, end: datetime.date
+                    ) -> Iterator[Tuple[datetime.date, List[str], np.ndarray]]:
+        """(date, meter_ids, usage) of every day of start..end in the daily tier."""
+        month = start.replace(day=1)
+        while month <= end:
+            daily_path = self._daily_path(month)
+            if os.path.exists(daily_path):
+                table = RollupTable.load(daily_path)
+                for day in np.flatnonzero(~np.isnan(table.usage).all(axis=0)).tolist():
+                    date = month.replace(day=day + 1)
+                    if start <= date <= end:
+                        yield date, table.meter_ids, table.usage[:, day]
+            month = (month + datetime.timedelta(days=32)).replace(day=1)
+
+    def build_cube(self):
+        """Fill the analytics cube from every kept daily rollup."""
+        daily_dir = os.path.join(self.rollup_dir, "daily")
+        os.makedirs(self.cube.cube_dir, exist_ok=True)
+        if not os.path.isdir(daily_dir):
+            return
+        for name in sorted(os.listdir(daily_dir)):
+            if not name.endswith(".npz"):
+                continue
+            month = RollupTable.load(os.path.join(daily_dir, name))
+            first = datetime.datetime.strptime(name[6:12], "%Y%m").date()
+            keys, codes = month.group_codes(self.groups)
+            for day in np.flatnonzero(~np.isnan(month.usage).all(axis=0)).tolist():
+                self.cube.set_day(first.replace(day=day + 1), month.usage[:, day], keys, codes)
+
+    def prune(self, today: datetime.date):
+        """Delete the periods that every tier's retention has expired."""
+        self._latest = None
+        self._tables = {}
+        # Fast-forward baselines go with the hourly tables they stand in for.
+        retention = dict(self.retention, baseline=self.retention["hourly"])
+        for tier, days in retention.items():
+            if days is None:
+                continue
+            cutoff = today - datetime.timedelta(days=days)
+            tier_dir = os.path.join(self.rollup_dir, tier)
+            for root, _, names in os.walk(tier_dir, topdown=False):
+                for name in names:
+                    if name.endswith(".npz") and self._period_end(tier, name) < cutoff:
+                        os.remove(os.path.join(root, name))
+                if root != tier_dir and not os.listdir(root):
+                    os.rmdir(root)
+
+    @staticmethod
+    def _period_end(tier: str, name: str) -> datetime.date:
+        stamp = name.split("_")[1][:-4]
+        if tier in ("hourly", "baseline"):
+            return datetime.datetime.strptime(stamp, "%Y%m%d").date()
+        if tier == "daily":
+            year, month = int(stamp[:4]), int(stamp[4:])
+            return datetime.date(year, month, calendar.monthrange(year, month)[1])
+        return datetime.date(int(stamp), 12, 31)
+
+    def clear_cache(self):
+        self._latest = None
+        self._tables = {}
+        self.cube.clear_cache()
+
+    def _periods(self, tier: str, start: datetime.date, end: datetime.date) -> Iterable[Tuple[str, List[str]]]:
+        """(path, bucket labels) of every period of a tier overlapping start..end."""
+        if tier == "hourly":
+            day = start
+            while day <= end:
+                yield self._hourly_path(day), [f"{day.isoformat()} {h:02d}:00" for h in range(24)]
+                day += datetime.timedelta(days=1)
+        elif tier == "daily":
+            month = start.replace(day=1)
+            while month <= end:
+                days = calendar.monthrange(month.year, month.month)[1]
+                yield self._daily_path(month), [month.replace(day=d).isoformat() for d in range(1, days + 1)]
+                month = (month + datetime.timedelta(days=32)).replace(day=1)
+        elif tier == "monthly":
+            for year in range(start.year, end.year + 1):
+                yield self._monthly_path(datetime.date(year, 1, 1)), [f"{year}-{m:02d}" for m in range(1, 13)]
+        else:
+            raise ValueError(f"Invalid tier, expected one of: {', '.join(TIERS)}")
+
+    def query(self, tier: str, start: datetime.date, end: datetime.date,
+              meter_id: Optional[str] = None, group_by: Optional[str] = None) -> dict:
+        """Usage per bucket of a tier for one meter, or totals per area/dwelling."""
+        if group_by is not None and group_by not in GROUP_KEYS:
+            raise ValueError(f"Invalid group_by, expected one of: {', '.join(GROUP_KEYS)}")
+        # Buckets are matched on their date, or their month in the monthly tier.
+        width = 7 if tier == "monthly" else 10
+        first, last = start.isoformat()[:width], end.isoformat()[:width]
+        labels: List[str] = []
+        usage: List[Optional[float]] = []
+        groups: Dict[str, List[float]] = {}
+        for path, period_labels in self._periods(tier, start, end):
+            keep = [k for k, label in enumerate(period_labels) if first <= label[:width] <= last]
+            if not keep or not os.path.exists(path):
+                continue
+            table = RollupTable.load(path)
+            offset = len(labels)
+            labels.extend(period_labels[k] for k in keep)
+            if group_by is None:
+                row = table.meter_index.get(meter_id)
+                values = table.usage[row, keep] if row is not None else np.full(len(keep), np.nan)
+                usage.extend(None if np.isnan(v) else round(float(v), 3) for v in values.tolist())
+                continue
+            position = GROUP_KEYS.index(group_by)
+            for key, row in zip(table.groups, table.group_usage[:, keep].tolist()):
+                series = groups.setdefault(key[position], [])
+                series.extend([0.0] * (offset + len(keep) - len(series)))
+                for k, value in enumerate(row):
+                    series[offset + k] += value
+        result = {"tier": tier, "start": start.isoformat(), "end": end.isoformat(), "labels": labels}
+        if group_by is None:
+            result.update({"meter_id": meter_id, "usage": usage,
+                           "total": round(sum(v for v in usage if v is not None), 3)})
+        else:
+            result.update({
+                "group_by": group_by,
+                "groups": {
+                    name: [round(v, 3) for v in series + [0.0] * (len(labels) - len(series))]
+                    for name, series in sorted(groups.items())
+                }
+            })
+        return result
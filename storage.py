@@ -0,0 +1,373 @@
+import csv
+import datetime
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from durability import atomic_write
+from reading_store import ReadingBatch
+
+
+@dataclass
+class DailyReadings:
+    """One day of readings as columns, grouped by meter and sorted by time.
+
+    The readings of meter_ids[k] occupy rows starts[k]:starts[k + 1].
+    """
+    date: datetime.date
+    meter_ids: List[str]
+    starts: np.ndarray   # int64, len(meter_ids) + 1
+    minutes: np.ndarray  # int16, minute of the day
+    values: np.ndarray   # float64, cumulative meter value
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @classmethod
+    def from_columns(cls, date: datetime.date, meter_ids: List[str], meter_index: np.ndarray,
+                     minutes: np.ndarray, values: np.ndarray) -> "DailyReadings":
+        """Group unordered columns by meter (in order of first appearance) and time."""
+        meter_index = np.asarray(meter_index)
+        if not len(meter_index):
+            return cls(date, [], np.zeros(1, dtype=np.int64),
+                       np.zeros(0, dtype=np.int16), np.zeros(0, dtype=np.float64))
+        present, first_pos, counts = np.unique(meter_index, return_index=True, return_counts=True)
+        appearance = np.argsort(first_pos, kind="stable")
+        rank = np.empty(len(present), dtype=np.int64)
+        rank[appearance] = np.arange(len(present))
+        group = rank[np.searchsorted(present, meter_index)]
+        order = np.lexsort((minutes, group))
+        starts = np.zeros(len(present) + 1, dtype=np.int64)
+        np.cumsum(counts[appearance], out=starts[1:])
+        return cls(
+            date=date,
+            meter_ids=[meter_ids[i] for i in present[appearance].tolist()],
+            starts=starts,
+            minutes=np.asarray(minutes, dtype=np.int16)[order],
+            values=np.asarray(values, dtype=np.float64)[order]
+        )
+
+    @classmethod
+    def from_batch(cls, date: datetime.date, batch: ReadingBatch) -> "DailyReadings":
+        """Build a day from readings flushed out of a ReadingStore."""
+        return cls.from_columns(date, batch.meter_ids, batch.meter_index, batch.offsets % 1440, batch.values)
+
+    def merged(self, later: "DailyReadings") -> "DailyReadings":
+        """Combine with readings of the same day that were flushed afterwards."""
+        lookup = {meter_id: i for i, meter_id in enumerate(self.meter_ids)}
+        later_index = np.fromiter(
+            (lookup.setdefault(meter_id, len(lookup)) for meter_id in later.meter_ids),
+            dtype=np.int32, count=len(later.meter_ids)
+        )
+        return DailyReadings.from_columns(
+            self.date, list(lookup),
+            np.concatenate((self.meter_index(), later_index[later.meter_index()])),
+            np.concatenate((self.minutes, later.minutes)),
+            np.concatenate((self.values, later.values))
+        )
+
+    def select(self, rows: np.ndarray) -> "DailyReadings":
+        """The readings of the rows where a boolean mask is set."""
+        return DailyReadings.from_columns(
+            self.date, self.meter_ids, self.meter_index()[rows], self.minutes[rows], self.values[rows]
+        )
+
+    def shards(self, count: int) -> List["DailyReadings"]:
+        """The readings split into up to count contiguous ranges of meters."""
+        count = max(min(count, len(self.meter_ids)), 1)
+        bounds = [len(self.meter_ids) * i // count for i in range(count + 1)]
+        shards = []
+        for first, end in zip(bounds, bounds[1:]):
+            rows = slice(int(self.starts[first]), int(self.starts[end]))
+            shards.append(DailyReadings(self.date, self.meter_ids[first:end],
+                                        self.starts[first:end + 1] - self.starts[first],
+                                        self.minutes[rows], self.values[rows]))
+        return shards
+
+    def meter_slice(self, meter_id: str) -> Optional[slice]:
+        """Rows holding one meter's readings."""
+        try:
+            k = self.meter_ids.index(meter_id)
+        except ValueError:
+            return None
+        return slice(int(self.starts[k]), int(self.starts[k + 1]))
+
+    def first_values(self) -> np.ndarray:
+        """First reading of the day per meter."""
+        return self.values[self.starts[:-1]]
+
+    def last_values(self) -> np.ndarray:
+        """Last reading of the day per meter."""
+        return self.values[self.starts[1:] - 1]
+
+    def min_values(self) -> np.ndarray:
+        """Lowest reading of the day per meter."""
+        return np.minimum.reduceat(self.values, self.starts[:-1]) if len(self.values) else self.values
+
+    def max_values(self) -> np.ndarray:
+        """Highest reading of the day per meter."""
+        return np.maximum.reduceat(self.values, self.starts[:-1]) if len(self.values) else self.values
+
+    def meter_index(self) -> np.ndarray:
+        """Position in meter_ids of every row."""
+        return np.repeat(np.arange(len(self.meter_ids), dtype=np.int32), np.diff(self.starts))
+
+
+def _time_labels(minutes: np.ndarray) -> List[str]:
+    labels = {m: f"{m // 60:02d}:{m % 60:02d}" for m in np.unique(minutes).tolist()}
+    return [labels[m] for m in minutes.tolist()]
+
+
+def _parse_minutes(labels) -> np.ndarray:
+    lookup = {label: int(label[:2]) * 60 + int(label[3:5]) for label in set(labels)}
+    return np.fromiter((lookup[label] for label in labels), dtype=np.int16, count=len(labels))
+
+
+class DailyStorage:
+    """Base class for the on-disk format of daily reading files."""
+    name = ""
+    extension = ""
+
+    def write_day(self, path: str, readings: DailyReadings):
+        raise NotImplementedError
+
+    def read_day(self, path: str) -> DailyReadings:
+        raise NotImplementedError
+
+
+class JsonDailyStorage(DailyStorage):
+    """Pretty-printed JSON keyed by meter ID (the original format)."""
+    name = "json"
+    extension = ".json"
+
+    def write_day(self, path: str, readings: DailyReadings):
+        self.write_encoded(path, [self.encode_meters(readings)])
+
+    def encode_meters(self, readings: DailyReadings) -> str:
+        """The file entries of the readings' meters, to be joined by write_encoded().
+
+        Formatted here rather than by json.dump(indent=2), whose pure-Python
+        encoder took seconds per day for large fleets; the bytes are the same.
+        """
+        date = json.dumps(readings.date.strftime("%Y-%m-%d"))
+        labels = [
+            f'      {{\n        "time": {json.dumps(label)},\n        "value": '
+            for label in _time_labels(readings.minutes)
+        ]
+        # json writes finite floats with repr, the others as NaN/Infinity.
+        encode = repr if np.isfinite(readings.values).all() else json.dumps
+        values = [encode(round(value, 3)) for value in readings.values.tolist()]
+        starts = readings.starts.tolist()
+        meters = []
+        for k, meter_id in enumerate(readings.meter_ids):
+            rows = range(starts[k], starts[k + 1])
+            listed = (
+                "[\n" + ",\n".join([labels[i] + values[i] + "\n      }" for i in rows]) + "\n    ]" if rows else "[]"
+            )
+            meters.append(
+                f'  {json.dumps(meter_id, ensure_ascii=False)}: {{\n    "date": {date},\n    "readings": {listed}\n  }}'
+            )
+        return ",\n".join(meters)
+
+    def write_encoded(self, path: str, parts: List[str]):
+        """Write a day from the encode_meters() of its meter ranges, in order."""
+        parts = [part for part in parts if part]
+        with atomic_write(path, "w", encoding="utf-8") as f:
+            f.write("{\n" + ",\n".join(parts) + "\n}" if parts else "{}")
+
+    def read_day(self, path: str) -> DailyReadings:
+        with open(path, "r", encoding="utf-8") as f:
+            daily_data = json.load(f)
+        meter_ids, meter_index, labels, values = [], [], [], []
+        date = daily_file_date(path)
+        for k, (meter_id, meter_data) in enumerate(daily_data.items()):
+            meter_ids.append(meter_id)
+            date = datetime.date.fromisoformat(meter_data["date"])
+            for reading in meter_data["readings"]:
+                meter_index.append(k)
+                labels.append(reading["time"])
+                values.append(reading["value"])
+        return DailyReadings.from_columns(
+            date, meter_ids, np.array(meter_index, dtype=np.int32), _parse_minutes(labels),
+            np.array(values, dtype=np.float64)
+        )
+
+
+class CsvDailyStorage(DailyStorage):
+    """Legacy `date,time,meter_ID,meter_value` files, `,` or `;` separated."""
+    name = "csv"
+    extension = ".csv"
+
+    def write_day(self, path: str, readings: DailyReadings):
+        date_str = readings.date.strftime("%Y-%m-%d")
+        labels = _time_labels(readings.minutes)
+        meter_index = readings.meter_index().tolist()
+        # Legacy files list every meter for one time slot before the next slot.
+        order = np.lexsort((readings.meter_index(), readings.minutes)).tolist()
+        values = readings.values.tolist()
+        with atomic_write(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["date", "time", "meter_ID", "meter_value"])
+            writer.writerows(
+                [date_str, labels[i], readings.meter_ids[meter_index[i]], round(values[i], 3)] for i in order
+            )
+
+    def read_day(self, path: str) -> DailyReadings:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            header = f.readline()
+            delimiter = ";" if header.count(";") > header.count(",") else ","
+            rows = [row for row in csv.reader(f, delimiter=delimiter) if row]
+        date = datetime.date.fromisoformat(rows[0][0]) if rows else daily_file_date(path)
+        meter_lookup: Dict[str, int] = {}
+        meter_index = np.fromiter(
+            (meter_lookup.setdefault(row[2], len(meter_lookup)) for row in rows), dtype=np.int32, count=len(rows)
+        )
+        return DailyReadings.from_columns(
+            date, list(meter_lookup), meter_index, _parse_minutes([row[1] for row in rows]),
+            np.array([float(row[3]) for row in rows], dtype=np.float64)
+        )
+
+
+class BinaryDailyStorage(DailyStorage):
+    """Columnar little-endian layout that can be read through numpy.memmap.
+
+    Layout: a 32-byte header, then values (float64[n]), per-meter row
+    starts (int64[m + 1]), minutes (int16[n]) and finally the meter IDs as
+    newline-separated UTF-8.
+    """
+    name = "binary"
+    extension = ".rdb"
+
+    MAGIC = b"SMRD"
+    VERSION = 1
+    HEADER = np.dtype([
+        ("magic", "S4"), ("version", "<u4"), ("date", "<i4"), ("meters", "<u4"),
+        ("readings", "<u8"), ("ids_bytes", "<u8")
+    ])
+
+    def write_day(self, path: str, readings: DailyReadings):
+        ids = "\n".join(readings.meter_ids).encode("utf-8")
+        header = np.zeros(1, dtype=self.HEADER)
+        header[0] = (self.MAGIC, self.VERSION, readings.date.toordinal(), len(readings.meter_ids),
+                     len(readings), len(ids))
+        # Replacing the file keeps memory maps of the previous version valid.
+        with atomic_write(path, "wb") as f:
+            f.write(header.tobytes())
+            # Keep the 3-decimal precision of the text formats.
+            f.write(np.round(readings.values, 3).astype("<f8").tobytes())
+            f.write(readings.starts.astype("<i8").tobytes())
+            f.write(readings.minutes.astype("<i2").tobytes())
+            f.write(ids)
+
+    def read_day(self, path: str) -> DailyReadings:
+        """Map the columns of a binary day file without parsing them."""
+        header = np.fromfile(path, dtype=self.HEADER, count=1)[0]
+        if header["magic"] != self.MAGIC or header["version"] != self.VERSION:
+            raise ValueError(f"Not a daily reading file: {path}")
+        readings, meters = int(header["readings"]), int(header["meters"])
+        offset = self.HEADER.itemsize
+        values = np.memmap(path, dtype="<f8", mode="r", offset=offset, shape=(readings,)) \
+            if readings else np.zeros(0, dtype=np.float64)
+        offset += 8 * readings
+        starts = np.memmap(path, dtype="<i8", mode="r", offset=offset, shape=(meters + 1,))
+        offset += 8 * (meters + 1)
+        minutes = np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(readings,)) \
+            if readings else np.zeros(0, dtype=np.int16)
+        offset += 2 * readings
+        with open(path, "rb") as f:
+            f.seek(offset)
+            ids = f.read(int(header["ids_bytes"])).decode("utf-8")
+        return DailyReadings(
+            date=datetime.date.fromordinal(int(header["date"])),
+            meter_ids=ids.split("\n") if ids else [],
+            starts=starts,
+            minutes=minutes,
+            values=values
+        )
+
+
+DAILY_STORAGES: Dict[str, DailyStorage] = {
+    storage.name: storage for storage in (JsonDailyStorage(), CsvDailyStorage(), BinaryDailyStorage())
+}
+
+
+def get_daily_storage(name: str) -> DailyStorage:
+    """Look up a daily storage backend by name."""
+    try:
+        return DAILY_STORAGES[name]
+    except KeyError:
+        raise ValueError(f"Unknown daily storage format: {name}") from None
+
+
+def storage_for_path(path: str) -> Optional[DailyStorage]:
+    """Backend able to read a daily file, chosen by its extension."""
+    extension = os.path.splitext(path)[1]
+    for storage in DAILY_STORAGES.values():
+        if storage.extension == extension:
+            return storage
+    return None
+
+
+def daily_file_date(path: str) -> datetime.date:
+    """Date of a daily file, from its name."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return datetime.datetime.strptime(stem[-8:], "%Y%m%d").date()
+
+
+def _newest(paths: List[str]) -> str:
+    return max(paths, key=lambda path: (os.stat(path).st_mtime_ns, path))
+
+
+def list_daily_files(month_dir: str) -> List[str]:
+    """Daily reading files of a month directory in date order, any format.
+    
+    A day kept in several formats (e.g. a conversion that kept its sources)
+    is listed once, by its most recently written file.
+    """
+    if not os.path.isdir(month_dir):
+        return []
+    by_day: Dict[str, List[str]] = {}
+    for name in os.listdir(month_dir):
+        if name.startswith("readings_") and storage_for_path(name) is not None:
+            by_day.setdefault(os.path.splitext(name)[0], []).append(os.path.join(month_dir, name))
+    return sorted(paths[0] if len(paths) == 1 else _newest(paths) for paths in by_day.values())
+
+
+def existing_daily_file(path: str) -> Optional[str]:
+    """The file holding the same day as path in any format, the newest if several do."""
+    stem = os.path.splitext(path)[0]
+    paths = [stem + storage.extension for storage in DAILY_STORAGES.values()
+             if os.path.exists(stem + storage.extension)]
+    return _newest(paths) if paths else None
+
+
+def read_daily_file(path: str) -> DailyReadings:
+    """Read a daily file in whichever format it was written."""
+    storage = storage_for_path(path)
+    if storage is None:
+        raise ValueError(f"Unknown daily reading file type: {path}")
+    return storage.read_day(path)
+
+
+def convert_daily_files(daily_readings_dir: str, target: str, remove_source: bool = True) -> List[str]:
+    """Rewrite every readings_YYYYMMDD.* file under a directory in another format.
+    
+    The sources are removed unless remove_source is False; kept sources are
+    shadowed by the newer converted files (see list_daily_files).
+    """
+    storage = get_daily_storage(target)
+    written = []
+    for month in sorted(os.listdir(daily_readings_dir)):
+        month_dir = os.path.join(daily_readings_dir, month)
+        for path in list_daily_files(month_dir):
+            if path.endswith(storage.extension):
+                continue
+            target_path = os.path.splitext(path)[0] + storage.extension
+            storage.write_day(target_path, read_daily_file(path))
+            written.append(target_path)
+            if remove_source:
+                os.remove(path)
+    return written
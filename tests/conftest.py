@@ -0,0 +1,47 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# The modules live at the repository root rather than in a package.
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+def new_base_dir(directory) -> str:
+    """Make directory a base directory: an empty data directory next to a copy of the area data."""
+    shutil.copytree(os.path.join(REPO_DIR, "static", "js"), os.path.join(directory, "static", "js"))
+    os.makedirs(os.path.join(directory, "data"))
+    return str(directory)
+
+
+@pytest.fixture
+def base_dir(tmp_path):
+    """An empty data directory next to a copy of the area data."""
+    return new_base_dir(tmp_path)
+
+
+@pytest.fixture
+def make_system(base_dir):
+    """Open SmartMeterSystems on base_dir; they are closed after the test."""
+    from app import SmartMeterSystem
+
+    systems = []
+
+    def make(**kwargs):
+        kwargs.setdefault("seed", 7)
+        system = SmartMeterSystem(base_dir, **kwargs)
+        systems.append(system)
+        return system
+
+    yield make
+    for system in systems:
+        system.close()
+
+
+def register(system, count: int, area: str = "Kallang", dwelling: str = "3", prefix: str = "000"):
+    """Register count meters named <prefix>-000-NNN."""
+    return system.register_meters_bulk([
+        {"meterId": f"{prefix}-000-{i:03d}", "area": area, "dwelling": dwelling} for i in range(count)
+    ])
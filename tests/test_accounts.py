@@ -0,0 +1,77 @@
+"""The account snapshot and its append-only journal."""
+import json
+import os
+
+import pytest
+
+from accounts import AccountRegistry
+from locking import ValidationError
+
+
+def _account(i: int, area: str = "Bishan", dwelling: str = "3") -> dict:
+    return {"meter_ID": f"000-000-{i:03d}", "area": area, "dwelling": dwelling, "register_time": "2024-05-01T00:00:00"}
+
+
+@pytest.fixture
+def accounts_file(tmp_path):
+    return str(tmp_path / "data" / "all_account.json")
+
+
+def test_journal_is_replayed_on_load(accounts_file):
+    registry = AccountRegistry(accounts_file)
+    registry.add(_account(1))
+    registry.add_many([_account(2, "Yishun"), _account(3, dwelling="5")])
+    assert os.path.exists(registry.journal_file)
+
+    reloaded = AccountRegistry(accounts_file)
+    assert reloaded.all() == registry.all()
+    assert reloaded.by_area("Bishan") == [_account(1), _account(3, dwelling="5")]
+    assert reloaded.get("000-000-002")["area"] == "Yishun"
+
+
+def test_journal_is_compacted_into_the_snapshot(accounts_file):
+    registry = AccountRegistry(accounts_file, compact_every=2)
+    registry.add(_account(1))
+    assert os.path.exists(registry.journal_file)
+    registry.add(_account(2))
+
+    assert not os.path.exists(registry.journal_file)
+    with open(accounts_file, encoding="utf-8") as f:
+        assert json.load(f) == [_account(1), _account(2)]
+    registry.add(_account(3))
+    assert AccountRegistry(accounts_file).meter_ids() == ["000-000-001", "000-000-002", "000-000-003"]
+
+
+def test_torn_last_journal_line_is_dropped(accounts_file):
+    registry = AccountRegistry(accounts_file)
+    registry.add_many([_account(1), _account(2)])
+    # An append interrupted halfway through the third entry.
+    with open(registry.journal_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(_account(3))[:20])
+
+    recovered = AccountRegistry(accounts_file)
+    assert recovered.meter_ids() == ["000-000-001", "000-000-002"]
+    # The journal was compacted away, so the next append starts on a clean line.
+    assert not os.path.exists(recovered.journal_file)
+    recovered.add(_account(3))
+    assert AccountRegistry(accounts_file).meter_ids() == ["000-000-001", "000-000-002", "000-000-003"]
+
+
+def test_refresh_picks_up_another_registry(accounts_file):
+    writer, reader = AccountRegistry(accounts_file), AccountRegistry(accounts_file)
+    writer.add(_account(1))
+    assert reader.refresh() == [_account(1)]
+    writer.compact()
+    # A rewritten snapshot is reloaded as a whole.
+    assert reader.refresh() is None
+    assert reader.meter_ids() == ["000-000-001"]
+
+
+def test_duplicate_meter_is_a_validation_error(accounts_file):
+    registry = AccountRegistry(accounts_file)
+    registry.add(_account(1))
+    with pytest.raises(ValidationError):
+        registry.add_many([_account(2), _account(1)])
+    with pytest.raises(ValidationError):
+        registry.add_many([_account(3), _account(3)])
+    assert AccountRegistry(accounts_file).meter_ids() == ["000-000-001"]
@@ -0,0 +1,83 @@
+"""Running monthly aggregates: days collected in several steps and verify mode."""
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from conftest import register
+from consumption import SLOTS_PER_DAY
+from storage import read_daily_file
+
+MAY = datetime.datetime(2024, 5, 1)
+
+
+def test_day_collected_in_several_steps_is_merged(make_system):
+    system = make_system()
+    register(system, 4)
+    system.collect_readings("hours", 30)
+    daily_file = os.path.join(system.daily_readings_dir, "202405", "readings_20240502.json")
+    morning = read_daily_file(daily_file)
+    system.collect_readings("hours", 9)
+    system.collect_readings("hours", 9)
+
+    day = read_daily_file(daily_file)
+    assert day.meter_ids == morning.meter_ids
+    assert np.diff(day.starts).tolist() == [SLOTS_PER_DAY] * 4
+    # The readings of the first step are kept in front of the later ones.
+    for meter in range(4):
+        first = day.values[day.starts[meter]:day.starts[meter + 1]]
+        kept = morning.values[morning.starts[meter]:morning.starts[meter + 1]]
+        assert first[:len(kept)].tolist() == kept.tolist()
+        assert (np.diff(first) > 0).all()
+    assert system.verify_monthly_aggregates(MAY) == []
+
+
+def test_verify_monthly_aggregates_reports_changed_meters(make_system):
+    system = make_system()
+    register(system, 4)
+    system.collect_readings("days", 3)
+    assert system.verify_monthly_aggregates(MAY) == []
+
+    aggregate = system.monthly_aggregates.get(MAY)
+    aggregate.last[aggregate.meter_index["000-000-002"]] += 1
+    system.monthly_aggregates.put(MAY, aggregate)
+    assert system.verify_monthly_aggregates(MAY) == ["000-000-002"]
+
+
+def test_verify_aggregates_command(make_system, base_dir, capsys):
+    import manage
+
+    system = make_system()
+    register(system, 4)
+    system.collect_readings("days", 3)
+    assert manage.main(["--base-dir", base_dir, "verify-aggregates", "--month", "2024-05"]) == 0
+
+    aggregate = system.monthly_aggregates.get(MAY)
+    aggregate.first[aggregate.meter_index["000-000-003"]] -= 1
+    system.monthly_aggregates.put(MAY, aggregate)
+    assert manage.main(["--base-dir", base_dir, "verify-aggregates", "--month", "2024-05"]) == 1
+    assert capsys.readouterr().out.splitlines() == [
+        "Running aggregates for 2024-05 match the daily files",
+        "1 meters differ: 000-000-003",
+    ]
+
+
+def test_verify_mode_checks_the_month_when_archiving(make_system):
+    system = make_system(verify_aggregates=True)
+    register(system, 4)
+    system.collect_readings("days", 40)
+    aggregate = system.monthly_aggregates.get(MAY)
+    aggregate.sum[aggregate.meter_index["000-000-001"]] += 1
+    system.monthly_aggregates.put(MAY, aggregate)
+    # May is archived when July starts.
+    with pytest.raises(RuntimeError, match="2024-05 differ from the daily files for 1 meters"):
+        system.collect_readings("days", 22)
+
+
+def test_verify_mode_archives_a_consistent_month(make_system):
+    system = make_system(verify_aggregates=True)
+    register(system, 4)
+    system.collect_readings("days", 62)
+    totals = os.path.join(system.monthly_readings_dir, "202405", "month_readings_202405.json")
+    assert os.path.exists(totals)
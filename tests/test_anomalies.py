@@ -0,0 +1,63 @@
+"""The anomaly detector flags injected spikes and flat lines."""
+import datetime
+
+import numpy as np
+import pytest
+
+from anomalies import LAST_SLOT_MINUTE, AnomalyDetector
+from storage import DailyReadings
+
+FIRST = datetime.date(2024, 5, 1)
+METERS = [f"000-000-{i:03d}" for i in range(10)]
+
+
+@pytest.fixture
+def detector(tmp_path):
+    return AnomalyDetector(str(tmp_path / "alerts"), lambda meter_id: ("Kallang", "3"))
+
+
+def _day(date: datetime.date, values: np.ndarray) -> DailyReadings:
+    """A complete day: every meter read at 00:30 and 23:30, ending on values."""
+    count = len(METERS)
+    return DailyReadings.from_columns(
+        date, METERS,
+        np.repeat(np.arange(count, dtype=np.int32), 2),
+        np.tile(np.array([30, LAST_SLOT_MINUTE], dtype=np.int32), count),
+        np.repeat(values, 2)
+    )
+
+
+def test_spike_is_flagged(detector):
+    rng = np.random.RandomState(0)
+    usage = rng.uniform(9, 11, size=(15, len(METERS)))
+    usage[14, 3] = 60
+    detector.add_days(FIRST, METERS, usage, usage.sum(axis=0))
+
+    spike_day = (FIRST + datetime.timedelta(days=14)).isoformat()
+    result = detector.query(FIRST, FIRST + datetime.timedelta(days=14), kind="spike")
+    assert [(a["date"], a["meter_id"], a["usage"]) for a in result["alerts"]] == [(spike_day, "000-000-003", 60.0)]
+    # Far above its peers of the same area and dwelling type as well.
+    peers = detector.query(FIRST, FIRST + datetime.timedelta(days=14), kind="peer_outlier")
+    assert [(a["date"], a["meter_id"]) for a in peers["alerts"]] == [(spike_day, "000-000-003")]
+
+
+def test_spike_needs_enough_history(detector):
+    usage = np.full((5, len(METERS)), 10.0)
+    usage[4, 3] = 60
+    detector.add_days(FIRST, METERS, usage, usage.sum(axis=0))
+    assert detector.query(FIRST, FIRST + datetime.timedelta(days=4), kind="spike")["count"] == 0
+
+
+def test_flat_line_is_flagged_after_a_streak(detector):
+    values = np.zeros(len(METERS))
+    for day in range(8):
+        usage = np.full(len(METERS), 10.0)
+        if day >= 4:
+            # Meter 5 stops consuming from the fifth day on.
+            usage[5] = 0
+        values = values + usage
+        detector.add_day(_day(FIRST + datetime.timedelta(days=day), values))
+
+    result = detector.query(FIRST, FIRST + datetime.timedelta(days=7), kind="zero_streak")
+    assert {a["meter_id"] for a in result["alerts"]} == {"000-000-005"}
+    assert [a["date"] for a in result["alerts"]] == ["2024-05-07", "2024-05-08"]
@@ -0,0 +1,36 @@
+"""Cached read endpoints are not served after the state changes."""
+import pytest
+
+import app as app_module
+from conftest import register
+
+
+@pytest.fixture
+def client(make_system):
+    system = make_system()
+    register(system, 2)
+    app_module.set_meter_system(system)
+    yield app_module.app.test_client()
+    app_module.set_meter_system(None)
+
+
+def test_collection_evicts_cached_responses(client):
+    before = client.get("/current_time").get_json()
+    assert client.get("/current_time").get_json() == before
+    cache = app_module.get_meter_system().response_cache
+    assert len(cache) == 1
+
+    assert client.post("/meter_reading", json={"unit": "days", "value": 1}).status_code == 200
+    after = client.get("/current_time").get_json()
+    assert before["Current Simulation Time"]["Date"] == "2024-05-01"
+    assert after["Current Simulation Time"]["Date"] == "2024-05-02"
+    # Only the response computed after the collection is left.
+    assert len(cache) == 1
+
+
+def test_registration_evicts_cached_responses(client):
+    query = "/query_usage?meter_id=000-000-009&time_range=today"
+    assert client.get(query).status_code == 400
+    response = client.post("/register", json={"meterId": "000-000-009", "area": "Kallang", "dwelling": "3"})
+    assert response.get_json()["success"]
+    assert client.get(query).status_code == 200
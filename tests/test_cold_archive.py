@@ -0,0 +1,72 @@
+"""Packing expired months into .rca cold files and reading them back."""
+import datetime
+import os
+
+import numpy as np
+
+from cold_archive import ColdArchive
+from conftest import register
+from storage import list_daily_files, read_daily_file
+
+MAY = datetime.date(2024, 5, 1)
+JUNE = datetime.date(2024, 6, 1)
+
+
+def _month_readings(month_dir: str, month: datetime.date):
+    """(minute of the month, value) of every meter over a month's daily files."""
+    readings = {}
+    for path in list_daily_files(month_dir):
+        day = read_daily_file(path)
+        offset = (day.date - month).days * 1440
+        for meter_id in day.meter_ids:
+            rows = day.meter_slice(meter_id)
+            minutes, values = readings.setdefault(meter_id, ([], []))
+            minutes.extend((np.asarray(day.minutes[rows], dtype=np.int64) + offset).tolist())
+            values.extend(np.asarray(day.values[rows]).tolist())
+    return readings
+
+
+def test_pack_and_read_back(make_system, tmp_path):
+    system = make_system()
+    register(system, 3)
+    system.collect_readings("days", 3)
+    register(system, 2, prefix="001")
+    system.collect_readings("days", 40)
+
+    archive = ColdArchive(str(tmp_path / "cold"))
+    for month in (MAY, JUNE):
+        month_dir = os.path.join(system.daily_readings_dir, month.strftime("%Y%m"))
+        assert archive.pack(month, list_daily_files(month_dir)) == archive.path_for(month)
+    assert archive.months() == [MAY, JUNE]
+
+    expected = {
+        month: _month_readings(os.path.join(system.daily_readings_dir, month.strftime("%Y%m")), month)
+        for month in (MAY, JUNE)
+    }
+    for month, readings in expected.items():
+        assert archive.stats(month)["readings"] == sum(len(minutes) for minutes, _ in readings.values())
+        for meter_id, (minutes, values) in readings.items():
+            history = archive.meter_history(month, meter_id)
+            assert history.minutes.tolist() == minutes
+            assert np.allclose(history.values, values, rtol=0, atol=5e-4)
+    # Each month continues from the last value of the one before.
+    for meter_id, (_, values) in expected[MAY].items():
+        assert archive.meter_history(JUNE, meter_id).previous == values[-1]
+    assert archive.meter_history(MAY, "002-000-000") is None
+    assert np.isnan(archive.last_values(MAY, ["002-000-000"])).all()
+
+
+def test_packed_month_is_still_queried(make_system):
+    system = make_system()
+    register(system, 3)
+    system.collect_readings("days", 40)
+    day = system.query_usage("000-000-001", "day", date=datetime.date(2024, 5, 10))
+    month = system.query_usage("000-000-001", "month", date=MAY)
+    assert day["usage"] and len(month["usage"]) == 31
+
+    # May is packed when July starts and its daily files are removed.
+    system.collect_readings("days", 22)
+    assert not os.path.exists(os.path.join(system.daily_readings_dir, "202405"))
+    assert system.cold_archive.has_month(MAY)
+    assert system.query_usage("000-000-001", "day", date=datetime.date(2024, 5, 10)) == day
+    assert system.query_usage("000-000-001", "month", date=MAY) == month
@@ -0,0 +1,73 @@
+"""Fast-forwarded months against readings generated slot by slot."""
+import datetime
+
+import numpy as np
+import pytest
+
+from app import SmartMeterSystem
+from conftest import new_base_dir, register
+from consumption import SLOTS_PER_DAY, day_slot_times, get_consumption_model
+from generation import cumulative_block, day_summaries
+
+DATES = [datetime.date(2024, 6, 1) + datetime.timedelta(days=d) for d in range(3)]
+
+
+def _accounts(count: int):
+    return [{"meter_ID": f"000-{i // 1000:03d}-{i % 1000:03d}", "area": "Kallang", "dwelling": str(1 + i % 6)}
+            for i in range(count)]
+
+
+@pytest.mark.parametrize("name", ["uniform", "profile"])
+def test_day_summaries_match_generated_days(name):
+    model = get_consumption_model(name)
+    profiles = model.profiles(_accounts(12000))
+    previous = np.linspace(0, 100, len(profiles))
+
+    first, last, total = day_summaries(np.random.RandomState(1), previous, model, DATES, profiles)
+    rng = np.random.RandomState(2)
+    generated = [], [], []
+    start = previous
+    for date in DATES:
+        values = cumulative_block(start, model.increments(rng, day_slot_times(date), profiles))
+        for column, summary in zip(generated, (values[0], values[-1], values.sum(axis=0))):
+            column.append(summary)
+        start = values[-1]
+
+    # Days follow on from each other, starting from the previous values.
+    assert (first[0] > previous).all()
+    assert (first <= last).all()
+    assert (first[1:] > last[:-1]).all()
+    # Compared net of the previous values, whose spread would hide the days'.
+    for summary, expected, readings in zip((first, last, total), generated, (1, 1, SLOTS_PER_DAY)):
+        summary = summary - readings * previous
+        expected = np.array(expected) - readings * previous
+        np.testing.assert_allclose(summary.mean(axis=1), expected.mean(axis=1), rtol=0.01)
+        np.testing.assert_allclose(summary.std(axis=1), expected.std(axis=1), rtol=0.05)
+
+
+def test_fast_forwarded_month_matches_stepped_month(make_system, tmp_path_factory):
+    fast = make_system(seed=3)
+    register(fast, 100)
+    fast_result = fast.collect_readings("months", 3, fast_forward=True)
+    assert fast_result["fast_forwarded"] == {"from": "2024-05-01T00:00:00", "to": "2024-06-01T00:00:00"}
+
+    stepped = SmartMeterSystem(new_base_dir(tmp_path_factory.mktemp("stepped")), seed=3)
+    try:
+        register(stepped, 100)
+        stepped_result = stepped.collect_readings("months", 3)
+        assert stepped_result["readings_count"] == fast_result["readings_count"]
+        assert stepped_result["new_time"] == fast_result["new_time"]
+
+        fast_totals = fast.usage_index.monthly["2024-05"]
+        stepped_totals = stepped.usage_index.monthly["2024-05"]
+        assert not np.isnan(fast_totals).any()
+        assert abs(fast_totals.mean() / stepped_totals.mean() - 1) < 0.01
+        assert abs(fast_totals.std() / stepped_totals.std() - 1) < 0.3
+        # The stepped months after it continue from the fast-forward's last values.
+        for meter_id in ("000-000-000", "000-000-042"):
+            fast_july = fast.query_usage(meter_id, "last_month")
+            stepped_july = stepped.query_usage(meter_id, "last_month")
+            assert fast_july["dates"] == stepped_july["dates"]
+            assert abs(fast_july["total"] / stepped_july["total"] - 1) < 0.05
+    finally:
+        stepped.close()
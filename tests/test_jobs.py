@@ -0,0 +1,72 @@
+"""Background jobs and their files under data/jobs."""
+import json
+import logging
+import os
+import subprocess
+import sys
+import uuid
+
+from jobs import Job, JobManager
+
+
+def _write_job(jobs_dir, status: str, created_at: str, pid=None) -> str:
+    job = Job(job_id=uuid.uuid4().hex, kind="collect_readings", params={}, status=status, created_at=created_at)
+    with open(os.path.join(jobs_dir, f"{job.job_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(job.to_dict(), pid=pid), f)
+    return job.job_id
+
+
+def _exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_job_is_visible_to_another_manager(tmp_path):
+    manager = JobManager(str(tmp_path))
+    job = manager.submit("sum", {"n": 3}, lambda report_progress: {"total": 6})
+    manager.shutdown()
+
+    seen = JobManager(str(tmp_path)).get(job.job_id)
+    assert (seen.status, seen.result, seen.params) == ("succeeded", {"total": 6}, {"n": 3})
+    assert JobManager(str(tmp_path)).get("../../etc/passwd") is None
+
+
+def test_failed_job_is_logged(tmp_path, caplog):
+    manager = JobManager(str(tmp_path))
+    with caplog.at_level(logging.ERROR, logger="jobs"):
+        job = manager.submit("divide", {}, lambda report_progress: 1 / 0)
+        manager.shutdown()
+    assert (job.status, job.error) == ("failed", "division by zero")
+    assert f"Job {job.job_id} failed" in caplog.text
+    assert "ZeroDivisionError" in caplog.text
+
+
+def test_unfinished_jobs_of_exited_processes_are_failed(tmp_path):
+    jobs_dir = str(tmp_path)
+    dead_pid = _exited_pid()
+    running = _write_job(jobs_dir, "running", "2024-05-01T00:00:00", pid=dead_pid)
+    queued = _write_job(jobs_dir, "queued", "2024-05-01T00:00:01", pid=dead_pid)
+    alive = _write_job(jobs_dir, "running", "2024-05-01T00:00:02", pid=os.getppid())
+
+    manager = JobManager(jobs_dir)
+    for job_id in (running, queued):
+        job = manager.get(job_id)
+        assert job.status == "failed"
+        assert job.error.startswith("Interrupted")
+    assert manager.get(alive).status == "running"
+
+
+def test_finished_job_files_are_pruned(tmp_path):
+    jobs_dir = str(tmp_path)
+    old = [_write_job(jobs_dir, "succeeded", f"2024-05-01T00:00:0{i}") for i in range(4)]
+    alive = _write_job(jobs_dir, "running", "2024-04-01T00:00:00", pid=os.getppid())
+
+    manager = JobManager(jobs_dir, max_jobs=2)
+    assert [manager.get(job_id) is not None for job_id in old] == [False, False, True, True]
+    assert manager.get(alive) is not None
+
+    manager.submit("noop", {}, lambda report_progress: {})
+    manager.shutdown()
+    assert [manager.get(job_id) is not None for job_id in old] == [False, False, False, True]
+    assert len(os.listdir(jobs_dir)) == 3
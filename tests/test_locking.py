@@ -0,0 +1,76 @@
+"""The system lock across instances sharing a data directory."""
+import datetime
+
+import pytest
+
+import app as app_module
+from conftest import register
+
+
+@pytest.fixture
+def client(make_system):
+    system = make_system()
+    app_module.set_meter_system(system)
+    yield app_module.app.test_client(), system
+    app_module.set_meter_system(None)
+
+
+def test_instance_sees_the_collection_of_another(make_system):
+    writer, reader = make_system(), make_system()
+    register(writer, 3)
+    writer.collect_readings("days", 2)
+
+    version = reader.lock.version
+    assert reader.get_current_time() == datetime.datetime(2024, 5, 3)
+    assert reader.lock.version > version
+    assert reader.account_registry.meter_ids() == writer.account_registry.meter_ids()
+    assert reader.query_usage("000-000-001", "day", date=datetime.date(2024, 5, 2)) == \
+        writer.query_usage("000-000-001", "day", date=datetime.date(2024, 5, 2))
+
+    # The reader's own writes continue from the writer's state.
+    reader.collect_readings("days", 1)
+    assert writer.get_current_time() == datetime.datetime(2024, 5, 4)
+    assert writer.verify_monthly_aggregates(datetime.datetime(2024, 5, 1)) == []
+
+
+def test_failed_write_forces_a_reload(make_system, monkeypatch):
+    system, other = make_system(), make_system()
+    register(system, 2)
+    refreshes = []
+    refresh = system.lock.refresh
+    monkeypatch.setattr(system.lock, "refresh", lambda full: (refreshes.append(full), refresh(full)))
+
+    def broken(meter_id):
+        raise ValueError("corrupt index")
+
+    version, other_version = system.lock.version, other.lock.version
+    # Fails after the account was journaled, leaving the in-memory state half updated.
+    with monkeypatch.context() as patch:
+        patch.setattr(system.usage_index, "add_meter", broken)
+        with pytest.raises(ValueError):
+            system.register_meter("000-000-009", "Bishan", "3")
+
+    assert system.lock.version > version
+    # The next access reloads everything from disk, and other instances catch up.
+    assert len(system.load_accounts()) == 3
+    assert refreshes == [True]
+    assert other.load_accounts()[-1]["meter_ID"] == "000-000-009"
+    assert other.lock.version > other_version
+
+
+def test_validation_errors_leave_the_version_and_answer_400(client):
+    test_client, system = client
+    assert test_client.post("/register", json={"meterId": "000-000-001", "area": "Bishan", "dwelling": "3"}).status_code == 200
+    version = system.lock.version
+
+    duplicate = test_client.post("/register", json={"meterId": "000-000-001", "area": "Bishan", "dwelling": "3"})
+    assert duplicate.status_code == 400
+    assert duplicate.get_json()["message"] == "Meter ID already exists"
+    bad_unit = test_client.post("/meter_reading", json={"unit": "weeks", "value": 1})
+    assert bad_unit.status_code == 400
+    assert bad_unit.get_json() == {"error": "Invalid time unit"}
+    bulk = test_client.post("/register/bulk", json=[{"meterId": "000-000-002", "area": "Atlantis", "dwelling": "3"}])
+    assert bulk.status_code == 400
+    assert bulk.get_json()["errors"][0]["error"] == "Unknown area: Atlantis"
+
+    assert system.lock.version == version
@@ -0,0 +1,37 @@
+"""The /metrics exposition."""
+import gc
+import weakref
+
+import app as app_module
+from conftest import new_base_dir, register
+from metrics import METRICS
+
+
+def _gauge(text: str, name: str):
+    values = [line.split()[1] for line in text.splitlines() if line.startswith(f"meter_{name} ")]
+    return int(values[0]) if values else None
+
+
+def test_gauges_follow_the_served_system(make_system, tmp_path_factory):
+    assert _gauge(METRICS.render(), "registered_meters") is None
+    served = make_system()
+    register(served, 3)
+    app_module.set_meter_system(served)
+    other = app_module.SmartMeterSystem(new_base_dir(tmp_path_factory.mktemp("other")))
+    try:
+        register(other, 5)
+        response = app_module.app.test_client().get("/metrics")
+        assert _gauge(response.get_data(as_text=True), "registered_meters") == 3
+        assert _gauge(response.get_data(as_text=True), "buffered_readings") == 3
+    finally:
+        other.close()
+        app_module.set_meter_system(None)
+
+
+def test_gauges_keep_no_system_alive(base_dir):
+    system = app_module.SmartMeterSystem(base_dir)
+    system.close()
+    ref = weakref.ref(system)
+    del system
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,76 @@
+"""The groupby report builders against the committed May 2024 sample reports."""
+import datetime
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import SmartMeterSystem
+from conftest import REPO_DIR
+from storage import DailyReadings, get_daily_storage
+
+SAMPLE_DIR = os.path.join(REPO_DIR, "data", "month_readings", "202405")
+MONTH = datetime.datetime(2024, 5, 1)
+
+
+def _sample(name: str) -> pd.DataFrame:
+    return pd.read_csv(os.path.join(SAMPLE_DIR, f"{name}_202405.csv"), sep=";", dtype={"meter_ID": str})
+
+
+def _write_daily_files(system: SmartMeterSystem, month_daily_dir: str):
+    """Daily files whose day usage and month totals reproduce the sample reports.
+
+    Every meter starts at 0 at registration (2024-05-01 00:00) and ends the
+    month on its sample consumption; the rest of the month is spread evenly
+    over the nights between the first and last reading of each day.
+    """
+    accounts = system.load_accounts()
+    meter_ids = [account["meter_ID"] for account in accounts]
+    analysis = _sample("area_analysis")
+    dates = sorted(analysis["DateID"].unique())
+    day_usage = analysis["kwh_per_acc"].to_numpy().reshape(len(dates), len(meter_ids))
+    totals = _sample("monthly_summary").set_index("meter_ID").loc[meter_ids, "month_consumption"].to_numpy()
+    night = (totals - day_usage.sum(axis=0)) / (len(dates) - 1)
+
+    storage = get_daily_storage("json")
+    os.makedirs(month_daily_dir, exist_ok=True)
+    first = np.zeros(len(meter_ids))
+    for day, date in enumerate(dates):
+        last = totals if day == len(dates) - 1 else first + day_usage[day]
+        start = 0 if day == 0 else 90
+        readings = DailyReadings.from_columns(
+            datetime.date.fromisoformat(date), meter_ids,
+            np.tile(np.arange(len(meter_ids), dtype=np.int32), 2),
+            np.repeat(np.array([start, 23 * 60 + 30], dtype=np.int32), len(meter_ids)),
+            np.concatenate((first, last))
+        )
+        storage.write_day(os.path.join(month_daily_dir, f"readings_{date.replace('-', '')}.json"), readings)
+        first = last + night
+
+
+@pytest.fixture
+def reports(base_dir):
+    shutil.copy(os.path.join(REPO_DIR, "data", "all_account.json"), os.path.join(base_dir, "data"))
+    system = SmartMeterSystem(base_dir)
+    month_daily_dir = os.path.join(system.daily_readings_dir, "202405")
+    _write_daily_files(system, month_daily_dir)
+    system._build_monthly_reports(MONTH, month_daily_dir)
+    monthly_dir = system.get_month_directory(system.monthly_readings_dir, MONTH)
+    return lambda name: pd.read_csv(os.path.join(monthly_dir, f"{name}_202405.csv"), sep=";",
+                                    dtype={"meter_ID": str})
+
+
+def test_monthly_summary_matches_sample(reports):
+    pd.testing.assert_frame_equal(reports("monthly_summary"), _sample("monthly_summary"))
+
+
+def test_area_monthly_summary_matches_sample(reports):
+    # The sample lists areas in registration order; the report sorts them.
+    expected = _sample("area_monthly_summary").sort_values("area", ignore_index=True)
+    pd.testing.assert_frame_equal(reports("area_monthly_summary"), expected)
+
+
+def test_area_analysis_matches_sample(reports):
+    pd.testing.assert_frame_equal(reports("area_analysis"), _sample("area_analysis"))
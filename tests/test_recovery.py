@@ -0,0 +1,85 @@
+"""Restarting from the write-ahead log after a collection died halfway."""
+import datetime
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import register
+from storage import list_daily_files, read_daily_file
+
+
+class Crash(Exception):
+    pass
+
+
+def _daily_files(system):
+    return [
+        path for month in sorted(os.listdir(system.daily_readings_dir))
+        for path in list_daily_files(os.path.join(system.daily_readings_dir, month))
+    ]
+
+
+def test_importing_app_opens_no_data_directory():
+    import app
+
+    assert app._meter_system is None
+
+
+def test_crash_during_collection_rolls_back_to_last_safe_point(make_system):
+    system = make_system()
+    register(system, 4)
+    system.collect_readings("days", 2)
+
+    # Fail the monthly aggregates of the second day of the next collection,
+    # after the first day was complete and its daily file written.
+    sink = system.sinks[1]
+    on_day, flushed = sink.on_day, []
+
+    def crashing_on_day(readings):
+        flushed.append(readings.date)
+        if len(flushed) == 2:
+            raise Crash()
+        on_day(readings)
+
+    sink.on_day = crashing_on_day
+    with pytest.raises(Crash):
+        system.collect_readings("days", 3)
+    assert flushed == [datetime.date(2024, 5, 3), datetime.date(2024, 5, 4)]
+
+    restarted = make_system()
+    assert restarted.get_current_time() == datetime.datetime(2024, 5, 4)
+    files = _daily_files(restarted)
+    # The day whose flush failed is gone; the complete days are kept.
+    assert [os.path.basename(path)[9:17] for path in files] == ["20240501", "20240502", "20240503"]
+    assert restarted.verify_monthly_aggregates(datetime.datetime(2024, 5, 1)) == []
+    last_day = read_daily_file(files[-1])
+    latest = dict(zip(restarted.reading_store.meter_ids, restarted.reading_store.latest.tolist()))
+    assert [latest[meter_id] for meter_id in last_day.meter_ids] == last_day.last_values().tolist()
+
+    # Collecting again continues from the recovered day without duplicates.
+    restarted.collect_readings("days", 2)
+    assert restarted.verify_monthly_aggregates(datetime.datetime(2024, 5, 1)) == []
+    for path in _daily_files(restarted):
+        readings = read_daily_file(path)
+        for k in range(len(readings.meter_ids)):
+            minutes = readings.minutes[readings.starts[k]:readings.starts[k + 1]]
+            assert len(np.unique(minutes)) == len(minutes)
+            assert (np.diff(readings.values[readings.starts[k]:readings.starts[k + 1]]) >= 0).all()
+
+
+def test_archived_month_totals_are_reloaded(make_system):
+    system = make_system()
+    register(system, 3)
+    system.collect_readings("months", 3, fast_forward=True)
+    assert sorted(system.usage_index.monthly) == ["2024-05"]
+    # Months archived by earlier versions into a single file are still read.
+    with open(os.path.join(system.monthly_readings_dir, "month_readings.json"), "w", encoding="utf-8") as f:
+        json.dump({"000-000-001": {"2024-04": 12.5}}, f)
+
+    restarted = make_system()
+    assert sorted(restarted.usage_index.monthly) == ["2024-04", "2024-05"]
+    for meter_id in ("000-000-000", "000-000-002"):
+        assert restarted.usage_index.month_total(meter_id, "2024-05") == system.usage_index.month_total(meter_id, "2024-05")
+    assert restarted.usage_index.month_total("000-000-001", "2024-04") == 12.5
@@ -0,0 +1,85 @@
+"""Registering meters, one at a time and in batches."""
+import datetime
+
+import pytest
+
+import manage
+from app import BulkRegistrationError, SmartMeterSystem
+from locking import ValidationError
+
+
+def test_area_id_and_name_register_the_same_area(make_system):
+    system = make_system()
+    system.register_meter("000-000-001", "Bishan", "3")
+    system.register_meter("000-000-002", "1001", "3")
+
+    assert [account["area"] for account in system.load_accounts()] == ["Bishan", "Bishan"]
+    assert system.account_registry.areas() == ["Bishan"]
+    system.collect_readings("days", 1)
+    day = datetime.date(2024, 5, 1)
+    assert list(system.query_rollups("daily", day, day, group_by="area")["groups"]) == ["Bishan"]
+
+
+def test_unknown_area_is_rejected(make_system):
+    system = make_system()
+    with pytest.raises(ValidationError, match="Unknown area"):
+        system.register_meter("000-000-001", "Atlantis", "3")
+    assert system.load_accounts() == []
+
+
+def test_bulk_registration_stores_area_names(make_system):
+    system = make_system()
+    system.register_meters_bulk([
+        {"meterId": "000-000-001", "area": "1001", "dwelling": "3"},
+        {"meter_ID": "000-000-002", "area": "Bishan", "dwelling": "4"},
+    ])
+    assert [account["area"] for account in system.load_accounts()] == ["Bishan", "Bishan"]
+
+
+def test_bulk_registration_rejects_the_whole_batch(make_system):
+    system = make_system()
+    system.register_meter("000-000-001", "Bishan", "3")
+    version = system.lock.version
+    records = [
+        {"meterId": "000-000-002", "area": "Bishan", "dwelling": "3"},
+        {"meterId": "bad-id", "area": "Bishan", "dwelling": "3"},
+        {"meterId": "000-000-003", "area": "Atlantis", "dwelling": "3"},
+        {"meterId": "000-000-004", "area": "Bishan", "dwelling": "9"},
+        {"meterId": "000-000-001", "area": "Bishan", "dwelling": "3"},
+    ]
+    with pytest.raises(BulkRegistrationError) as raised:
+        system.register_meters_bulk(records)
+
+    assert [(error["row"], error["error"]) for error in raised.value.errors] == [
+        (1, "Invalid meter ID format"),
+        (2, "Unknown area: Atlantis"),
+        (3, "Unknown dwelling type: 9"),
+        (4, "Meter ID already exists"),
+    ]
+    # Nothing was registered, not even the valid first record, and the state did not move.
+    assert system.account_registry.meter_ids() == ["000-000-001"]
+    assert "000-000-002" not in system.reading_store.meter_index
+    assert system.lock.version == version
+
+
+def test_bulk_registration_rejects_duplicates_within_a_batch(make_system):
+    system = make_system()
+    with pytest.raises(BulkRegistrationError) as raised:
+        system.register_meters_bulk([
+            {"meterId": "000-000-001", "area": "Bishan", "dwelling": "3"},
+            {"meterId": "000-000-002", "area": "Bishan", "dwelling": "3"},
+            {"meterId": "000-000-001", "area": "Yishun", "dwelling": "2"},
+        ])
+    assert raised.value.errors == [{"row": 2, "meterId": "000-000-001", "error": "Meter ID already exists"}]
+    assert system.load_accounts() == []
+
+
+def test_import_meters_stores_area_names(base_dir, tmp_path):
+    csv_file = tmp_path / "meters.csv"
+    csv_file.write_text("meter_ID;area;dwelling\n000-000-001;1001;3\n000-000-002;Bishan;2\n", encoding="utf-8")
+    assert manage.main(["--base-dir", base_dir, "import-meters", str(csv_file)]) == 0
+    system = SmartMeterSystem(base_dir)
+    try:
+        assert [account["area"] for account in system.load_accounts()] == ["Bishan", "Bishan"]
+    finally:
+        system.close()
@@ -0,0 +1,46 @@
+"""Rollup tiers: group totals and backfilling days that have no rollups."""
+import datetime
+import shutil
+
+import numpy as np
+
+from conftest import register
+from rollups import RollupTable
+
+MAY = (datetime.date(2024, 5, 1), datetime.date(2024, 5, 31))
+
+
+def test_group_totals_are_summed_in_float64(make_system):
+    system = make_system()
+    register(system, 3)
+    table = RollupTable(1)
+    # Too many kWh for float32 to keep the fraction of the total.
+    table.set_column(0, ["000-000-000", "000-000-001", "000-000-002"], np.array([2.0 ** 24, 0.5, 0.25]))
+    table._summarize_groups(system.account_registry)
+    assert table.group_usage.dtype == np.float64
+    assert table.group_usage.tolist() == [[2.0 ** 24 + 0.75]]
+
+
+def test_restart_with_checkpoint_backfills_removed_rollups(make_system):
+    system = make_system()
+    register(system, 4)
+    system.collect_readings("days", 3)
+    expected = system.query_rollups("daily", *MAY, group_by="area")
+    system.close()
+    shutil.rmtree(system.rollup_dir)
+
+    restarted = make_system()
+    assert restarted.query_rollups("daily", *MAY, group_by="area") == expected
+    assert restarted.rollups.missing_days([datetime.date(2024, 5, day) for day in (1, 2, 3)]) == []
+
+
+def test_restart_backfills_only_days_without_rollups(make_system):
+    system = make_system()
+    register(system, 4)
+    system.collect_readings("days", 3)
+    expected = system.query_rollups("hourly", *MAY, meter_id="000-000-001")
+    system.rollups.discard_from(datetime.date(2024, 5, 2))
+    system.close()
+
+    restarted = make_system()
+    assert restarted.query_rollups("hourly", *MAY, meter_id="000-000-001") == expected
@@ -0,0 +1,77 @@
+"""Daily reading files in every storage backend."""
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from pipeline import DailyFileSink
+from storage import (DAILY_STORAGES, DailyReadings, convert_daily_files, get_daily_storage, list_daily_files,
+                     read_daily_file)
+
+DAY = datetime.date(2024, 6, 1)
+
+
+def _day(meters: int = 3, minutes=(90, 120, 150), date: datetime.date = DAY, start: float = 0.0) -> DailyReadings:
+    rng = np.random.RandomState(meters)
+    values = start + np.round(np.cumsum(rng.uniform(0, 1, size=(meters, len(minutes))), axis=1), 3)
+    return DailyReadings.from_columns(
+        date, [f"000-000-{i:03d}" for i in range(meters)],
+        np.repeat(np.arange(meters, dtype=np.int32), len(minutes)),
+        np.tile(np.array(minutes, dtype=np.int16), meters), values.ravel()
+    )
+
+
+def _assert_same(actual: DailyReadings, expected: DailyReadings):
+    assert actual.date == expected.date
+    assert actual.meter_ids == expected.meter_ids
+    assert actual.starts.tolist() == expected.starts.tolist()
+    assert actual.minutes.tolist() == expected.minutes.tolist()
+    np.testing.assert_allclose(actual.values, expected.values, rtol=0, atol=5e-7)
+
+
+@pytest.mark.parametrize("name", sorted(DAILY_STORAGES))
+def test_round_trip(tmp_path, name):
+    storage = get_daily_storage(name)
+    path = str(tmp_path / f"readings_20240601{storage.extension}")
+    day = _day()
+    storage.write_day(path, day)
+    _assert_same(read_daily_file(path), day)
+
+
+@pytest.mark.parametrize("name", sorted(DAILY_STORAGES))
+def test_conversion_replaces_the_source(tmp_path, name):
+    month_dir = tmp_path / "202406"
+    os.makedirs(month_dir)
+    source = get_daily_storage("json" if name != "json" else "csv")
+    days = [_day(date=DAY + datetime.timedelta(days=d), start=10.0 * d) for d in range(3)]
+    for day in days:
+        source.write_day(str(month_dir / f"readings_{day.date:%Y%m%d}{source.extension}"), day)
+
+    written = convert_daily_files(str(tmp_path), name)
+    assert len(written) == 3
+    files = list_daily_files(str(month_dir))
+    assert [os.path.splitext(path)[1] for path in files] == [get_daily_storage(name).extension] * 3
+    for path, day in zip(files, days):
+        _assert_same(read_daily_file(path), day)
+
+
+def test_kept_sources_are_listed_once(tmp_path):
+    month_dir = tmp_path / "202406"
+    os.makedirs(month_dir)
+    get_daily_storage("json").write_day(str(month_dir / "readings_20240601.json"), _day())
+    convert_daily_files(str(tmp_path), "binary", remove_source=False)
+    assert sorted(os.listdir(month_dir)) == ["readings_20240601.json", "readings_20240601.rdb"]
+    assert list_daily_files(str(month_dir)) == [str(month_dir / "readings_20240601.rdb")]
+
+
+def test_partial_day_is_merged_across_formats(tmp_path):
+    month_dir = tmp_path / "202406"
+    os.makedirs(month_dir)
+    morning, evening = _day(minutes=(90, 120)), _day(minutes=(1380, 1410), start=100.0)
+    get_daily_storage("binary").write_day(str(month_dir / "readings_20240601.rdb"), morning)
+
+    sink = DailyFileSink(get_daily_storage("json"), lambda date: str(month_dir / f"readings_{date:%Y%m%d}.json"))
+    sink.on_day(evening)
+    assert os.listdir(month_dir) == ["readings_20240601.json"]
+    _assert_same(read_daily_file(str(month_dir / "readings_20240601.json")), morning.merged(evening))
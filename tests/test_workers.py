@@ -0,0 +1,57 @@
+"""Collections with a process pool of workers."""
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from app import SmartMeterSystem
+from conftest import new_base_dir, register
+from generation import ShardedGenerator
+from storage import DailyReadings, get_daily_storage
+
+
+def _daily_files(system):
+    files = {}
+    for root, _, names in os.walk(system.daily_readings_dir):
+        for name in names:
+            with open(os.path.join(root, name), "rb") as f:
+                files[name] = f.read()
+    return files
+
+
+def _collect(base_dir, workers: int):
+    system = SmartMeterSystem(base_dir, seed=11, workers=workers)
+    try:
+        register(system, 30)
+        system.collect_readings("hours", 30)
+        return _daily_files(system), system.reading_store.latest[:30].copy()
+    finally:
+        system.close()
+
+
+@pytest.mark.parametrize("workers", [1, 2, 4])
+def test_seeded_collections_repeat_for_each_worker_count(tmp_path_factory, workers):
+    files, latest = _collect(new_base_dir(tmp_path_factory.mktemp("first")), workers)
+    again, latest_again = _collect(new_base_dir(tmp_path_factory.mktemp("again")), workers)
+    assert sorted(files) == ["readings_20240501.json", "readings_20240502.json"]
+    assert again == files
+    np.testing.assert_array_equal(latest_again, latest)
+
+
+def test_encoded_meter_ranges_join_into_the_serial_file(tmp_path):
+    storage = get_daily_storage("json")
+    meters, minutes = 7, np.array([90, 120, 150], dtype=np.int16)
+    readings = DailyReadings(
+        datetime.date(2024, 5, 1), [f"000-000-{i:03d}" for i in range(meters)],
+        np.arange(0, 3 * meters + 1, 3), np.tile(minutes, meters), np.random.RandomState(0).uniform(0, 9, 3 * meters)
+    )
+    storage.write_day(str(tmp_path / "serial.json"), readings)
+    pool = ShardedGenerator(3)
+    try:
+        # More workers than meters leaves no range empty.
+        for shards in (3, meters, 10):
+            storage.write_encoded(str(tmp_path / "sharded.json"), pool.map(storage.encode_meters, readings.shards(shards)))
+            assert (tmp_path / "sharded.json").read_bytes() == (tmp_path / "serial.json").read_bytes()
+    finally:
+        pool.close()
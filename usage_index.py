@@ -0,0 +1,191 @@
+import bisect
+import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from storage import DailyReadings
+
+TIME_RANGES = ("today", "last_7_days", "this_month", "last_month")
+
+
+class UsageIndex:
+    """In-memory per-meter consumption rollups used to answer usage queries.
+
+    Daily consumption is kept as one float32 vector per date (indexed by
+    meter), monthly totals as one vector per month, and the readings of the
+    most recent day are kept for intraday queries.
+    """
+
+    def __init__(self):
+        self.meter_index: Dict[str, int] = {}
+        self.meter_ids: List[str] = []
+        self.registered: set = set()
+        self.dates: List[datetime.date] = []
+        self.daily: Dict[datetime.date, np.ndarray] = {}
+        self.monthly: Dict[str, np.ndarray] = {}
+
+        # Latest indexed day, used as the baseline of the next one.
+        self._latest_day: Optional[DailyReadings] = None
+        self._latest_rows: Dict[str, int] = {}
+        self._latest_last = np.zeros(0)
+        self._baseline = np.zeros(0)
+
+    def add_meter(self, meter_id: str):
+        """Mark a meter as registered."""
+        self.registered.add(meter_id)
+        self._index(meter_id)
+
+    def has_meter(self, meter_id: str) -> bool:
+        return meter_id in self.registered
+
+    def _index(self, meter_id: str) -> int:
+        index = self.meter_index.get(meter_id)
+        if index is None:
+            index = self.meter_index[meter_id] = len(self.meter_index)
+            self.meter_ids.append(meter_id)
+        return index
+
+    @staticmethod
+    def _padded(column: np.ndarray, size: int, fill: float) -> np.ndarray:
+        if len(column) >= size:
+            return column
+        padded = np.full(size, fill, dtype=column.dtype)
+        padded[:len(column)] = column
+        return padded
+
+    def add_day(self, readings: DailyReadings, replace: bool = False):
+        """Index a day; readings for the latest day are added to it, or replace it."""
+        date = readings.date
+        positions = self._positions(readings.meter_ids)
+        if self.dates and date < self.dates[-1]:
+            # Out-of-order days only contribute their own first-to-last usage.
+            self.daily[date] = self._day_usage(readings, positions, np.full(0, np.nan))
+            bisect.insort(self.dates, date)
+            return
+        if not self.dates or date > self.dates[-1]:
+            self._baseline = self._latest_last
+            self.dates.append(date)
+        elif not replace and self._latest_day is not None and self._latest_day.date == date:
+            # The rest of a day that was collected in several steps.
+            readings = self._latest_day.merged(readings)
+            positions = self._positions(readings.meter_ids)
+
+        self.daily[date] = self._day_usage(readings, positions, self._baseline)
+        self._latest_day = readings
+        self._latest_rows = {meter_id: k for k, meter_id in enumerate(readings.meter_ids)}
+        last = np.full(len(self.meter_index), np.nan)
+        last[positions] = readings.last_values()
+        self._latest_last = self._padded(self._baseline, len(last), np.nan).copy()
+        self._latest_last[~np.isnan(last)] = last[~np.isnan(last)]
+
+    def skip_to(self, meter_ids: List[str], last: np.ndarray):
+        """Continue after days that were not indexed, from the meters' last values."""
+        positions = self._positions(meter_ids)
+        self._latest_last = self._padded(self._latest_last, len(self.meter_index), np.nan).copy()
+        self._latest_last[positions] = last
+        self._latest_day = None
+        self._latest_rows = {}
+
+    def _positions(self, meter_ids: List[str]) -> np.ndarray:
+        # Days usually list the meters in registration order, the index's order.
+        if self.meter_ids[:len(meter_ids)] == meter_ids:
+            return np.arange(len(meter_ids))
+        return np.fromiter((self._index(m) for m in meter_ids), dtype=np.int64, count=len(meter_ids))
+
+    def _day_usage(self, readings: DailyReadings, positions: np.ndarray, baseline: np.ndarray) -> np.ndarray:
+        usage = np.full(len(self.meter_index), np.nan, dtype=np.float32)
+        if not len(positions):
+            return usage
+        # Usage since the previous day's last reading, or within the day for new meters.
+        start = self._padded(baseline, len(self.meter_index), np.nan)[positions]
+        start = np.where(np.isnan(start), readings.first_values(), start)
+        usage[positions] = readings.last_values() - start
+        return usage
+
+    def set_month(self, month: str, totals: Dict[str, float]):
+        """Store the archived consumption of a month (YYYY-MM)."""
+        column = np.full(len(self.meter_index) + len(totals), np.nan)
+        for meter_id, total in totals.items():
+            column[self._index(meter_id)] = total
+        self.monthly[month] = column[:len(self.meter_index)]
+
+    def load_month_readings(self, monthly_data: Dict[str, Dict[str, float]]):
+        """Load the contents of month_readings.json."""
+        by_month: Dict[str, Dict[str, float]] = {}
+        for meter_id, months in monthly_data.items():
+            for month, total in months.items():
+                by_month.setdefault(month, {})[meter_id] = total
+        for month, totals in by_month.items():
+            self.set_month(month, totals)
+
+    def drop_before(self, date: datetime.date):
+        """Forget daily rollups older than date."""
+        cut = bisect.bisect_left(self.dates, date)
+        for old in self.dates[:cut]:
+            del self.daily[old]
+        del self.dates[:cut]
+
+    def clear(self):
+        self.__init__()
+
+    def _value(self, column: Optional[np.ndarray], index: int) -> Optional[float]:
+        if column is None or not 0 <= index < len(column) or np.isnan(column[index]):
+            return None
+        return round(float(column[index]), 3)
+
+    def daily_series(self, meter_id: str, dates: Iterable[datetime.date]) -> dict:
+        index = self.meter_index.get(meter_id, -1)
+        labels, usage = [], []
+        for date in dates:
+            value = self._value(self.daily.get(date), index)
+            if value is not None:
+                labels.append(date.isoformat())
+                usage.append(value)
+        return {"dates": labels, "usage": usage}
+
+    def month_total(self, meter_id: str, month: str) -> Optional[float]:
+        """Archived consumption of a meter in a month (YYYY-MM), if known."""
+        return self._value(self.monthly.get(month), self.meter_index.get(meter_id, -1))
+
+    def _intraday_series(self, meter_id: str, date: datetime.date) -> dict:
+        day = self._latest_day
+        if day is None or day.date != date or meter_id not in self._latest_rows:
+            return {"dates": [], "usage": []}
+        k = self._latest_rows[meter_id]
+        rows = slice(int(day.starts[k]), int(day.starts[k + 1]))
+        minutes = day.minutes[rows].tolist()
+        values = np.asarray(day.values[rows])
+        baseline = self._value(self._baseline, self.meter_index[meter_id])
+        previous = np.concatenate(([values[0] if baseline is None else baseline], values[:-1]))
+        return {
+            "dates": [f"{date.isoformat()} {m // 60:02d}:{m % 60:02d}" for m in minutes],
+            "usage": np.round(values - previous, 3).tolist()
+        }
+
+    def query(self, meter_id: str, time_range: str, current_time: datetime.datetime) -> dict:
+        """Usage series of a meter for one of TIME_RANGES, relative to current_time."""
+        today = current_time.date()
+        if time_range == "today":
+            series = self._intraday_series(meter_id, today)
+        elif time_range == "last_7_days":
+            series = self.daily_series(meter_id, (today - datetime.timedelta(days=n) for n in range(6, -1, -1)))
+        elif time_range == "this_month":
+            series = self.daily_series(meter_id, (today.replace(day=d) for d in range(1, today.day + 1)))
+        elif time_range == "last_month":
+            last_month_end = today.replace(day=1) - datetime.timedelta(days=1)
+            series = self.daily_series(
+                meter_id, (last_month_end.replace(day=d) for d in range(1, last_month_end.day + 1))
+            )
+            month = last_month_end.strftime("%Y-%m")
+            total = self.month_total(meter_id, month)
+            if not series["dates"] and total is not None:
+                series = {"dates": [month], "usage": [total]}
+        else:
+            raise ValueError(f"Invalid time range, expected one of: {', '.join(TIME_RANGES)}")
+        series.update({
+            "meter_id": meter_id,
+            "time_range": time_range,
+            "total": round(sum(series["usage"]), 3)
+        })
+        return series